@@ -0,0 +1,276 @@
+"""Microbenchmarks for the catalog and prompt-analysis hot paths.
+
+Runs DataManager lookups, UltraPromptBuilder.build(), get_recommendations()
+(for a repeated prompt and for always-new ones) and the suggest_prompt()
+route body against synthetic style catalogs of increasing size, records
+ops/sec and peak allocation per call, and compares the results with a
+stored baseline.
+
+Usage:
+    python benchmarks/bench_hotpaths.py                    # compare with baseline
+    python benchmarks/bench_hotpaths.py --update-baseline  # record a new baseline
+    python benchmarks/bench_hotpaths.py --sizes 200 2000 --tolerance 0.5
+"""
+import argparse
+import copy
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+SRC_DIR = os.path.join(PROJECT_ROOT, 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import main  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_SIZES = [200, 2000, 20000]
+STYLES_PER_CATEGORY = 20
+SAMPLE_PROMPT = "a detailed portrait of a person in a neon cyberpunk city at night, dramatic lighting"
+
+
+def make_synthetic_styles(size: int) -> List[Dict[str, Any]]:
+    """Build a styles catalog of `size` entries by cycling the real styles.json"""
+    with open(os.path.join(main.DATA_DIR, 'styles.json'), 'r', encoding='utf-8') as f:
+        real_categories = json.load(f)
+    templates = [(cat, style) for cat in real_categories for style in cat.get('styles', [])]
+
+    categories: List[Dict[str, Any]] = []
+    for i in range(size):
+        real_cat, real_style = templates[i % len(templates)]
+        if i % STYLES_PER_CATEGORY == 0:
+            categories.append({
+                'category': f"{real_cat['category']} #{len(categories)}",
+                'description': real_cat.get('description', ''),
+                'styles': []
+            })
+        style = copy.deepcopy(real_style)
+        style['name'] = f"{real_style['name']} {i}"
+        style['popularity'] = (i * 7) % 100
+        categories[-1]['styles'].append(style)
+    return categories
+
+
+class SyntheticCatalog:
+    """Points the app at a temporary data directory holding a synthetic catalog"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tmp_dir = tempfile.mkdtemp(prefix='dreamlit-bench-')
+        self._saved: Dict[str, Any] = {}
+
+    def __enter__(self) -> 'SyntheticCatalog':
+        self.styles = make_synthetic_styles(self.size)
+        with open(os.path.join(self.tmp_dir, 'styles.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.styles, f)
+        shutil.copy(os.path.join(main.DATA_DIR, 'models.json'), self.tmp_dir)
+
+        self._saved = {
+            'DATA_DIR': main.DATA_DIR,
+            'data_manager': main.data_manager,
+            'builder_data_manager': main.UltraPromptBuilder.data_manager,
+        }
+        main.DATA_DIR = self.tmp_dir
+        self.data_manager = main.DataManager()
+        main.data_manager = self.data_manager
+        main.UltraPromptBuilder.data_manager = self.data_manager
+        # Warm the caches so the first timed call doesn't pay for parsing
+        self.data_manager.load_styles()
+        self.data_manager.load_models()
+        return self
+
+    def __exit__(self, *exc):
+        main.DATA_DIR = self._saved['DATA_DIR']
+        main.data_manager = self._saved['data_manager']
+        main.UltraPromptBuilder.data_manager = self._saved['builder_data_manager']
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    @property
+    def last_style_name(self) -> str:
+        """Name of the last style, the worst case for linear lookups"""
+        return self.styles[-1]['styles'][-1]['name']
+
+
+def build_cases(catalog: SyntheticCatalog) -> Dict[str, Callable[[], Any]]:
+    """Map benchmark names to zero-argument callables for one catalog size"""
+    dm = catalog.data_manager
+    style_name = catalog.last_style_name
+    style_prompt = dm.find_style_prompt(style_name)
+    suggest_body = {
+        'prompt': SAMPLE_PROMPT,
+        'style': style_name,
+        'model': 'flux',
+        'hdr': False,
+        'quality': True,
+        'resolution': '1024x1024'
+    }
+
+    def suggest_prompt():
+        with main.app.test_request_context('/suggest_prompt', method='POST', json=suggest_body):
+            return main.suggest_prompt()
+
+    # A new prompt every call misses the result cache and measures the ranking itself
+    cold_prompts = (f"{SAMPLE_PROMPT}, variation {i}" for i in itertools.count())
+
+    return {
+        'find_style_prompt': lambda: dm.find_style_prompt(style_name),
+        'get_style_details': lambda: dm.get_style_details(style_name),
+        'get_model_details': lambda: dm.get_model_details('zimage'),
+        'filter_styles_by_criteria': lambda: dm.filter_styles_by_criteria(min_popularity=50),
+        'prompt_builder_build': lambda: main.UltraPromptBuilder(
+            SAMPLE_PROMPT, style_prompt, 'flux', True, True, '2048x2048').build(),
+        'get_recommendations': lambda: dm.get_recommendations(SAMPLE_PROMPT, 'flux', style_name),
+        'get_recommendations_cold': lambda: dm.get_recommendations(next(cold_prompts), 'flux', style_name),
+        'suggest_prompt': suggest_prompt,
+    }
+
+
+def measure_ops(func: Callable[[], Any], min_time: float, repeats: int) -> float:
+    """Return the best observed ops/sec over several timed rounds"""
+    func()
+    best = 0.0
+    for _ in range(repeats):
+        iterations = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            func()
+            iterations += 1
+            elapsed = time.perf_counter() - start
+        best = max(best, iterations / elapsed)
+    return best
+
+
+def measure_allocations(func: Callable[[], Any]) -> Dict[str, int]:
+    """Return peak traced bytes and allocated block count for one call"""
+    func()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base_current, _ = tracemalloc.get_traced_memory()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, 'lineno'))
+    return {'peak_bytes': max(peak - base_current, 0), 'blocks': blocks}
+
+
+def calibrate(min_time: float, repeats: int) -> float:
+    """Ops/sec of a fixed pure-Python workload, used to normalize across machines"""
+    words = [f"style-{i}" for i in range(500)]
+
+    def workload():
+        index = {word: i for i, word in enumerate(words)}
+        return sum(index[word] for word in sorted(words, reverse=True))
+
+    return measure_ops(workload, min_time, repeats)
+
+
+def run_suite(sizes: List[int], min_time: float, repeats: int) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Run every benchmark for every catalog size"""
+    results: Dict[str, Dict[str, Dict[str, float]]] = {
+        '_calibration': {'ops_per_sec': round(calibrate(min_time, repeats), 1)}
+    }
+    for size in sizes:
+        with SyntheticCatalog(size) as catalog:
+            for name, func in build_cases(catalog).items():
+                ops = measure_ops(func, min_time, repeats)
+                allocs = measure_allocations(func)
+                results.setdefault(name, {})[str(size)] = {
+                    'ops_per_sec': round(ops, 1),
+                    'peak_bytes': allocs['peak_bytes'],
+                    'blocks': allocs['blocks'],
+                }
+                print(f"{name:<28} {size:>6} styles  {ops:>12.1f} ops/s  "
+                      f"{allocs['peak_bytes']:>10} B peak  {allocs['blocks']:>6} blocks")
+    return results
+
+
+def compare_with_baseline(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Return a description of every result that regressed past the baseline"""
+    regressions = []
+    # Scale expectations by relative machine speed so baselines travel between hosts
+    speed = 1.0
+    if results.get('_calibration') and baseline.get('_calibration'):
+        speed = results['_calibration']['ops_per_sec'] / baseline['_calibration']['ops_per_sec']
+    for name, by_size in results.items():
+        if name.startswith('_'):
+            continue
+        for size, result in by_size.items():
+            expected = baseline.get(name, {}).get(size)
+            if not expected:
+                continue
+            min_ops = expected['ops_per_sec'] * speed * (1 - tolerance)
+            if result['ops_per_sec'] < min_ops:
+                regressions.append(
+                    f"{name}[{size}]: {result['ops_per_sec']:.1f} ops/s < {min_ops:.1f} "
+                    f"(baseline {expected['ops_per_sec']:.1f})")
+            # Small absolute slack keeps tiny allocations from flapping
+            max_bytes = expected['peak_bytes'] * (1 + tolerance) + 1024
+            if result['peak_bytes'] > max_bytes:
+                regressions.append(
+                    f"{name}[{size}]: {result['peak_bytes']} B peak > {int(max_bytes)} B "
+                    f"(baseline {expected['peak_bytes']} B)")
+    return regressions
+
+
+def main_cli(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Catalog and prompt-analysis microbenchmarks")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="synthetic catalog sizes (number of styles)")
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="seconds per timed round")
+    parser.add_argument('--repeats', type=int, default=3,
+                        help="timed rounds per benchmark; the best one is kept")
+    parser.add_argument('--tolerance', type=float, default=0.40,
+                        help="allowed fractional regression before failing")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline JSON path")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="write results to the baseline instead of comparing")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.min_time, args.repeats)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        for name, by_size in results.items():
+            baseline.setdefault(name, {}).update(by_size)
+        baseline['_calibration'] = results['_calibration']
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline first")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print("\nRegressions past baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nNo regressions past baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,85 @@
+"""Startup-time report for the web app module.
+
+Imports ``main`` in a fresh interpreter with ``-X importtime`` and breaks the
+import cost down by top-level package, so regressions in worker boot time
+can be traced to the module that caused them.
+
+Usage:
+    python benchmarks/startup_report.py            # top 20 packages
+    python benchmarks/startup_report.py --top 40 --module main
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+SRC_DIR = os.path.join(PROJECT_ROOT, 'src')
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def profile_import(module: str) -> Tuple[float, str]:
+    """Import `module` in a subprocess; returns wall seconds and the importtime log"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return time.perf_counter() - start, result.stderr
+
+
+def summarize(log: str, module: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """Aggregate self time per top-level package and cumulative time per direct import of `module`"""
+    self_us: Dict[str, int] = defaultdict(int)
+    direct_us: Dict[str, int] = {}
+    pending: Dict[str, int] = {}
+    for line in log.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_time, cumulative, indent, name = match.groups()
+        self_us[name.split('.')[0]] += int(self_time)
+        # importtime prints children before their parent, two spaces deeper per level
+        depth = (len(indent) - 1) // 2
+        if depth == 1:
+            pending[name] = int(cumulative)
+        elif depth == 0:
+            if name == module:
+                direct_us = pending
+            pending = {}
+    return self_us, direct_us
+
+
+def main_cli(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Break down import cost of the web app by module")
+    parser.add_argument('--module', default='main', help="module to import (default: main)")
+    parser.add_argument('--top', type=int, default=20, help="number of rows to show")
+    args = parser.parse_args(argv)
+
+    wall, log = profile_import(args.module)
+    self_us, direct_us = summarize(log, args.module)
+    total_us = sum(self_us.values())
+
+    print(f"Interpreter + import of '{args.module}': {wall * 1000:.1f} ms wall, "
+          f"{total_us / 1000:.1f} ms in imports\n")
+
+    print("Self time by top-level package:")
+    for package, micros in sorted(self_us.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        share = micros / total_us * 100 if total_us else 0
+        print(f"  {package:<32} {micros / 1000:>8.1f} ms  {share:>5.1f}%")
+
+    print(f"\nCumulative time of modules imported directly by '{args.module}':")
+    for name, micros in sorted(direct_us.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {name:<32} {micros / 1000:>8.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
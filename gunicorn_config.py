@@ -8,10 +8,18 @@ if SRC_DIR not in sys.path:
     sys.path.insert(0, SRC_DIR)
 
 bind = "0.0.0.0:" + os.getenv("PORT", "5000")
-workers = 2
-worker_class = "sync"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# Threaded workers let the upstream scheduler put interactive requests ahead
+# of background renders inside each worker instead of serializing everything
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
 timeout = 180
 keepalive = 5
 accesslog = "-"
 errorlog = "-"
 loglevel = "info"
+
+# Parse the style/model catalog once in the master and share it copy-on-write
+# with forked workers. Set PRELOAD_APP=false to load per worker instead.
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+wsgi_app = "main:create_app(preload=True)" if preload_app else "main:create_app()"
@@ -0,0 +1,135 @@
+"""Local stand-in for an OTLP/HTTP trace collector.
+
+Accepts ``POST /v1/traces`` with the JSON encoding of an OTLP export
+request, appends every span to a JSON lines file (the same shape the file
+exporter writes) and prints each finished trace as an indented tree with
+its span durations, so the exporter and the spans of a request can be
+checked without running a real collector.
+
+Usage:
+    python scripts/otlp_standin.py --port 4318 --out traces.jsonl
+    TRACE_EXPORTER=otlp TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces python src/main.py
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+_lock = threading.Lock()
+_traces: Dict[str, List[Dict[str, Any]]] = {}  # trace id -> spans received so far
+_KINDS = {1: 'internal', 2: 'server', 3: 'client'}
+
+
+def _attribute(value: Dict[str, Any]) -> Any:
+    if 'intValue' in value:
+        return int(value['intValue'])
+    for kind in ('stringValue', 'doubleValue', 'boolValue'):
+        if kind in value:
+            return value[kind]
+    return None
+
+
+def _flatten(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """OTLP export request -> spans in the file exporter's shape"""
+    spans = []
+    for resource in body.get('resourceSpans', []):
+        for scope in resource.get('scopeSpans', []):
+            for span in scope.get('spans', []):
+                start, end = int(span['startTimeUnixNano']), int(span['endTimeUnixNano'])
+                status = span.get('status', {})
+                spans.append({
+                    'trace_id': span['traceId'],
+                    'span_id': span['spanId'],
+                    'parent_id': span.get('parentSpanId') or None,
+                    'name': span['name'],
+                    'kind': _KINDS.get(span.get('kind'), 'internal'),
+                    'start': start / 1e9,
+                    'duration_ms': round((end - start) / 1e6, 3),
+                    'attributes': {item['key']: _attribute(item['value']) for item in span.get('attributes', [])},
+                    'status': 'error' if status.get('code') == 2 else 'ok',
+                    'error': status.get('message')
+                })
+    return spans
+
+
+def _print_trace(spans: List[Dict[str, Any]]):
+    children: Dict[str, List[Dict[str, Any]]] = {}
+    ids = {span['span_id'] for span in spans}
+    for span in sorted(spans, key=lambda s: s['start']):
+        # Spans whose parent is elsewhere (another service) are shown as roots
+        parent = span['parent_id'] if span['parent_id'] in ids else None
+        children.setdefault(parent, []).append(span)
+
+    def show(span, depth):
+        error = f"  ERROR {span['error']}" if span['status'] == 'error' else ''
+        print(f"  {'  ' * depth}{span['name']:<{40 - 2 * depth}} {span['duration_ms']:>9.1f} ms{error}")
+        for child in children.get(span['span_id'], []):
+            show(child, depth + 1)
+
+    print(f"trace {spans[0]['trace_id']}")
+    for root in children.get(None, []):
+        show(root, 0)
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config: argparse.Namespace = None
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.split('?')[0] != '/v1/traces':
+            return self._send(404, b'{"error": "not found"}')
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+            spans = _flatten(body)
+        except (ValueError, KeyError) as e:
+            return self._send(400, json.dumps({'error': str(e)}).encode())
+
+        finished = []
+        with _lock:
+            if self.config.out:
+                with open(self.config.out, 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(span) + '\n' for span in spans)
+            for span in spans:
+                _traces.setdefault(span['trace_id'], []).append(span)
+                # A request's (server) span ends last, once everything under it has ended
+                if span['kind'] == 'server':
+                    finished.append(span['trace_id'])
+            finished = [(trace_id, _traces.pop(trace_id)) for trace_id in dict.fromkeys(finished)]
+        if not self.config.quiet:
+            for _, trace in finished:
+                _print_trace(trace)
+        self._send(200, b'{}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4318)
+    parser.add_argument('--out', default='', help='append received spans to this JSON lines file')
+    parser.add_argument('--quiet', action='store_true', help='do not print traces')
+    parser.add_argument('--verbose', action='store_true')
+    config = parser.parse_args()
+    CollectorHandler.config = config
+
+    server = ThreadingHTTPServer((config.host, config.port), CollectorHandler)
+    print(f"OTLP stand-in on http://{config.host}:{config.port}/v1/traces")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
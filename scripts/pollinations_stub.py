@@ -0,0 +1,145 @@
+"""Local stand-in for the Pollinations image and text API with per-key rate limits.
+
+Answers ``GET /image/<prompt>`` with a small JPEG and ``GET /text/<prompt>``
+with plain text (or an SSE stream with ``stream=true``), after an optional
+delay. Every API key (``Authorization: Bearer <key>``) gets its own
+fixed-window quota and concurrency limit. Requests beyond them get a 429
+with ``Retry-After``, and every answer carries ``X-RateLimit-Remaining``
+and ``X-RateLimit-Reset``, so the credential pool can be exercised
+without touching the real upstream.
+
+Usage:
+    python scripts/pollinations_stub.py --port 8090 --keys k1,k2,k3 --limit 10 --window 10
+    POLLINATIONS_BASE_URL=http://localhost:8090 POLLINATIONS_API_KEYS=k1,k2,k3 python src/main.py
+"""
+import argparse
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+_lock = threading.Lock()
+_windows: Dict[str, List[float]] = {}  # key -> [window start, requests in window]
+_in_flight: Dict[str, int] = {}
+_served: Dict[str, int] = {}
+_throttled: Dict[str, int] = {}
+_image_cache: Dict[tuple, bytes] = {}
+
+
+def _image(width: int, height: int) -> bytes:
+    size = (min(width, 256), min(height, 256))
+    if size not in _image_cache:
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', size, '#336699').save(buffer, 'JPEG')
+        _image_cache[size] = buffer.getvalue()
+    return _image_cache[size]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config: argparse.Namespace = None
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+    def _key(self) -> Optional[str]:
+        auth = self.headers.get('Authorization', '')
+        return auth[7:].strip() if auth.startswith('Bearer ') else None
+
+    def _admit(self, key: str) -> tuple:
+        """(allowed, remaining, seconds until the window resets)"""
+        config = self.config
+        now = time.time()
+        with _lock:
+            window = _windows.setdefault(key, [now, 0])
+            if now - window[0] >= config.window:
+                window[0], window[1] = now, 0
+            reset = config.window - (now - window[0])
+            if window[1] >= config.limit or (config.concurrency and _in_flight.get(key, 0) >= config.concurrency):
+                _throttled[key] = _throttled.get(key, 0) + 1
+                return False, max(0, config.limit - window[1]), reset
+            window[1] += 1
+            _in_flight[key] = _in_flight.get(key, 0) + 1
+            return True, config.limit - window[1], reset
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Dict[str, str]):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/stats':
+            with _lock:
+                body = json.dumps({'served': _served, 'throttled': _throttled, 'in_flight': _in_flight}).encode()
+            return self._send(200, body, 'application/json', {})
+
+        key = self._key() or 'anonymous'
+        if self.config.keys and key not in self.config.keys:
+            return self._send(401, b'{"error": "invalid API key"}', 'application/json', {})
+
+        allowed, remaining, reset = self._admit(key)
+        limit_headers = {'X-RateLimit-Limit': str(self.config.limit),
+                         'X-RateLimit-Remaining': str(remaining),
+                         'X-RateLimit-Reset': str(int(reset + 0.999))}
+        if not allowed:
+            limit_headers['Retry-After'] = str(int(reset + 0.999))
+            return self._send(429, b'{"error": "rate limited"}', 'application/json', limit_headers)
+
+        try:
+            time.sleep(self.config.latency)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            if url.path.startswith('/image/'):
+                body = _image(int(query.get('width', 512)), int(query.get('height', 512)))
+                self._send(200, body, 'image/jpeg', limit_headers)
+            elif url.path.startswith('/text/'):
+                text = f"Stub reply to: {unquote(url.path[len('/text/'):])[:200]}"
+                if query.get('stream') == 'true':
+                    events = ''.join(f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}]})}\n\n"
+                                     for word in text.split())
+                    self._send(200, (events + 'data: [DONE]\n\n').encode(), 'text/event-stream', limit_headers)
+                else:
+                    self._send(200, text.encode(), 'text/plain; charset=utf-8', limit_headers)
+            else:
+                self._send(404, b'{"error": "not found"}', 'application/json', limit_headers)
+            with _lock:
+                _served[key] = _served.get(key, 0) + 1
+        finally:
+            with _lock:
+                _in_flight[key] -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--keys', default='', help='comma-separated accepted keys (default: accept any)')
+    parser.add_argument('--limit', type=int, default=10, help='requests per key per window')
+    parser.add_argument('--window', type=float, default=10.0, help='quota window in seconds')
+    parser.add_argument('--concurrency', type=int, default=0, help='in-flight requests per key (0 = no limit)')
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds before each answer')
+    parser.add_argument('--verbose', action='store_true')
+    config = parser.parse_args()
+    config.keys = {key.strip() for key in config.keys.split(',') if key.strip()}
+    StubHandler.config = config
+
+    server = ThreadingHTTPServer((config.host, config.port), StubHandler)
+    print(f"Pollinations stub on http://{config.host}:{config.port} "
+          f"({config.limit} requests / {config.window:g}s per key)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
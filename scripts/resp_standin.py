@@ -0,0 +1,133 @@
+"""In-memory Redis-protocol stand-in for local testing of STATE_BACKEND=redis.
+
+Implements the handful of commands the redis backend uses (GET, SET with
+PX/EX, DEL, EXISTS, INCRBY, PEXPIRE, HSET, HMGET, PING, AUTH, SELECT,
+FLUSHALL) so several app instances can share state without a real server.
+
+Usage:
+    python scripts/resp_standin.py --port 6390
+    STATE_BACKEND=redis REDIS_URL=redis://localhost:6390/0 python src/main.py
+"""
+import argparse
+import socketserver
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+_store: Dict[bytes, Any] = {}
+_expiry: Dict[bytes, float] = {}
+_lock = threading.Lock()
+
+
+def _alive(key: bytes) -> bool:
+    expires_at = _expiry.get(key)
+    if expires_at is not None and expires_at <= time.time():
+        _store.pop(key, None)
+        _expiry.pop(key, None)
+    return key in _store
+
+
+def _encode(value: Any) -> bytes:
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, str):
+        return b'+' + value.encode('utf-8') + b'\r\n'
+    if isinstance(value, Exception):
+        return b'-ERR ' + str(value).encode('utf-8') + b'\r\n'
+    if isinstance(value, list):
+        return b'*%d\r\n' % len(value) + b''.join(_encode(item) for item in value)
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def execute(args: List[bytes]) -> Any:
+    command = args[0].upper()
+    with _lock:
+        if command in (b'PING', b'AUTH', b'SELECT'):
+            return 'PONG' if command == b'PING' else 'OK'
+        if command == b'FLUSHALL':
+            _store.clear()
+            _expiry.clear()
+            return 'OK'
+        if command == b'GET':
+            value = _store.get(args[1]) if _alive(args[1]) else None
+            return value if isinstance(value, bytes) or value is None else ValueError('WRONGTYPE')
+        if command == b'SET':
+            _store[args[1]] = args[2]
+            _expiry.pop(args[1], None)
+            options = [arg.upper() for arg in args[3:]]
+            if b'PX' in options:
+                _expiry[args[1]] = time.time() + int(args[3 + options.index(b'PX') + 1]) / 1000
+            if b'EX' in options:
+                _expiry[args[1]] = time.time() + int(args[3 + options.index(b'EX') + 1])
+            return 'OK'
+        if command == b'DEL':
+            removed = 0
+            for key in args[1:]:
+                if _alive(key):
+                    removed += 1
+                _store.pop(key, None)
+                _expiry.pop(key, None)
+            return removed
+        if command == b'EXISTS':
+            return sum(1 for key in args[1:] if _alive(key))
+        if command == b'INCRBY':
+            current = int(_store[args[1]]) if _alive(args[1]) else 0
+            current += int(args[2])
+            _store[args[1]] = str(current).encode('utf-8')
+            return current
+        if command == b'PEXPIRE':
+            if not _alive(args[1]):
+                return 0
+            _expiry[args[1]] = time.time() + int(args[2]) / 1000
+            return 1
+        if command == b'HSET':
+            if not _alive(args[1]):
+                _store[args[1]] = {}
+            fields = args[2:]
+            for i in range(0, len(fields), 2):
+                _store[args[1]][fields[i]] = fields[i + 1]
+            return len(fields) // 2
+        if command == b'HMGET':
+            mapping: Optional[dict] = _store.get(args[1]) if _alive(args[1]) else None
+            return [(mapping or {}).get(field) for field in args[2:]]
+    return ValueError(f"unknown command '{command.decode()}'")
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            count = int(line[1:-2])
+            args = []
+            for _ in range(count):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.wfile.write(_encode(execute(args)))
+
+
+class ThreadedServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(host: str = '127.0.0.1', port: int = 6390) -> ThreadedServer:
+    """Start the stand-in on a background thread and return the server"""
+    server = ThreadedServer((host, port), RESPHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="In-memory Redis-protocol stand-in")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    print(f"RESP stand-in listening on {args.host}:{args.port}")
+    with ThreadedServer((args.host, args.port), RESPHandler) as server:
+        server.serve_forever()
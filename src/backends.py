@@ -0,0 +1,388 @@
+"""Pluggable shared state: key/value records and generated assets.
+
+Two implementations are provided:
+
+- ``local``: SQLite (WAL) for key/value state and the generated images
+  folder for assets. Shared by all workers on one machine.
+- ``redis``: any server speaking the Redis protocol, for both key/value
+  state and assets, so instances behind a load balancer see the same
+  caches, job records and images without sticky sessions.
+
+Select with ``STATE_BACKEND=local|redis`` and ``REDIS_URL``.
+"""
+import mimetypes
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+# Redis connections per process; one per request thread (GUNICORN_THREADS) avoids queuing for a socket
+REDIS_POOL_SIZE = int(os.environ.get('REDIS_POOL_SIZE', os.environ.get('GUNICORN_THREADS', '8')))
+
+# Commands that may be sent again when the connection drops before their reply arrives
+_RETRY_SAFE = frozenset(('PING', 'AUTH', 'SELECT', 'GET', 'SET', 'DEL', 'EXISTS', 'PEXPIRE',
+                         'HSET', 'HMGET', 'HGET', 'HGETALL', 'SADD', 'SMEMBERS', 'SREM'))
+
+
+class KVStore(ABC):
+    """String key/value store with optional per-key TTL"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+    def exists(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add to an integer counter; ttl applies when the counter is created"""
+
+
+class AssetStore(ABC):
+    """Binary blobs addressed by file name (generated images, audio, derivatives)"""
+
+    @abstractmethod
+    def put_file(self, name: str, path: str, content_type: Optional[str] = None):
+        pass
+
+    @abstractmethod
+    def get(self, name: str) -> Optional[Tuple[bytes, str]]:
+        """Return (content, content_type) or None"""
+
+    def local_path(self, name: str) -> Optional[str]:
+        """Path of the asset on this machine, if it is available locally"""
+        return None
+
+    def exists(self, name: str) -> bool:
+        """Override where get() would fetch the whole blob just to test for it"""
+        return self.local_path(name) is not None or self.get(name) is not None
+
+
+class SQLiteKVStore(KVStore):
+    """KV store in a WAL-mode SQLite file shared by every worker on the machine"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS kv ('
+                         'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at)')
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread and process; sqlite3 connections must not cross forks
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connect().execute(
+            'SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl else None
+        self._connect().execute(
+            'INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at',
+            (key, value, expires_at))
+        self._maybe_purge()
+
+    def delete(self, key: str):
+        self._connect().execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                               (key, now)).fetchone()
+            if row is None:
+                value = amount
+                conn.execute('INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                             (key, str(value), now + ttl if ttl else None))
+            else:
+                value = int(row[0]) + amount
+                conn.execute('UPDATE kv SET value = ? WHERE key = ?', (str(value), key))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def _maybe_purge(self):
+        """Drop expired rows every few hundred writes"""
+        self._writes += 1
+        if self._writes % 256 == 0:
+            self._connect().execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?',
+                                    (time.time(),))
+
+
+class LocalAssetStore(AssetStore):
+    """Assets are plain files in the generated images folder"""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.folder, os.path.basename(name))
+
+    def put_file(self, name: str, path: str, content_type: Optional[str] = None):
+        target = self._path(name)
+        if os.path.abspath(path) != os.path.abspath(target):
+            os.replace(path, target)
+
+    def get(self, name: str) -> Optional[Tuple[bytes, str]]:
+        path = self.local_path(name)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return f.read(), mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    def local_path(self, name: str) -> Optional[str]:
+        path = self._path(name)
+        return path if os.path.isfile(path) else None
+
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class _Connection:
+    """One socket to the server and its buffered reader"""
+
+    def __init__(self, client: 'RESPClient'):
+        self.sock = socket.create_connection((client.host, client.port), timeout=client.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile('rb')
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RESPClient:
+    """Minimal Redis protocol (RESP2) client with a small per-process connection pool"""
+
+    def __init__(self, url: str, timeout: float = 5.0, pool_size: int = REDIS_POOL_SIZE):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self.pool_size = max(1, pool_size)
+        self._idle: List[_Connection] = []
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> _Connection:
+        conn = _Connection(self)
+        try:
+            if self.password:
+                args = ['AUTH', self.username, self.password] if self.username else ['AUTH', self.password]
+                self._roundtrip(conn, args)
+            if self.db:
+                self._roundtrip(conn, ['SELECT', self.db])
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _checkout(self) -> Optional[_Connection]:
+        """Take a pool slot and an idle connection (None: open a new one)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Sockets and slot counts inherited across a fork belong to the parent
+                self._idle = []
+                self._slots = threading.BoundedSemaphore(self.pool_size)
+                self._pid = os.getpid()
+            slots = self._slots
+        if not slots.acquire(timeout=self.timeout):
+            raise ConnectionError(f'No Redis connection free after {self.timeout:.1f}s')
+        with self._lock:
+            return self._idle.pop() if self._idle else None
+
+    def _checkin(self, conn: Optional[_Connection]):
+        with self._lock:
+            if conn is not None and self._pid == os.getpid():
+                self._idle.append(conn)
+            self._slots.release()
+
+    @staticmethod
+    def _encode(args: List[Any]) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, bytes):
+                data = arg
+            else:
+                data = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(parts)
+
+    def _read_reply(self, conn: _Connection) -> Any:
+        line = conn.file.readline()
+        if not line:
+            raise ConnectionError('Connection closed by server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RedisError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length == -1:
+                return None
+            data = conn.file.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length == -1:
+                return None
+            return [self._read_reply(conn) for _ in range(length)]
+        raise RedisError(f'Unknown reply type {kind!r}')
+
+    def _roundtrip(self, conn: _Connection, args: List[Any]) -> Any:
+        conn.sock.sendall(self._encode(args))
+        return self._read_reply(conn)
+
+    def execute(self, *args) -> Any:
+        """Send one command and return its reply.
+
+        A pooled connection that turns out to be dropped is replaced and the
+        command sent again, unless the command may already have been applied
+        (INCRBY and other non-idempotent commands are never resent).
+        """
+        retry_safe = str(args[0]).upper() in _RETRY_SAFE
+        conn = self._checkout()
+        try:
+            for attempt in range(2):
+                sent = False
+                try:
+                    if conn is None:
+                        conn = self._connect()
+                    sent = True
+                    return self._roundtrip(conn, list(args))
+                except (ConnectionError, OSError):
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+                    if attempt or (sent and not retry_safe):
+                        raise
+        finally:
+            self._checkin(conn)
+
+
+class RedisKVStore(KVStore):
+    def __init__(self, client: RESPClient, prefix: str = 'dreamlit:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.execute('GET', self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        if ttl:
+            self.client.execute('SET', self.prefix + key, value, 'PX', int(ttl * 1000))
+        else:
+            self.client.execute('SET', self.prefix + key, value)
+
+    def delete(self, key: str):
+        self.client.execute('DEL', self.prefix + key)
+
+    def exists(self, key: str) -> bool:
+        return bool(self.client.execute('EXISTS', self.prefix + key))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = self.client.execute('INCRBY', self.prefix + key, amount)
+        if ttl and value == amount:
+            self.client.execute('PEXPIRE', self.prefix + key, int(ttl * 1000))
+        return value
+
+
+class RedisAssetStore(AssetStore):
+    """Write-through asset store: files stay on local disk and are mirrored to Redis"""
+
+    def __init__(self, client: RESPClient, folder: str, ttl: Optional[float] = None,
+                 prefix: str = 'dreamlit:asset:'):
+        self.client = client
+        self.local = LocalAssetStore(folder)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def put_file(self, name: str, path: str, content_type: Optional[str] = None):
+        self.local.put_file(name, path)
+        with open(self.local._path(name), 'rb') as f:
+            content = f.read()
+        content_type = content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        key = self.prefix + os.path.basename(name)
+        args = ['HSET', key, 'content_type', content_type, 'data', content]
+        self.client.execute(*args)
+        if self.ttl:
+            self.client.execute('PEXPIRE', key, int(self.ttl * 1000))
+
+    def get(self, name: str) -> Optional[Tuple[bytes, str]]:
+        local = self.local.get(name)
+        if local is not None:
+            return local
+        reply = self.client.execute('HMGET', self.prefix + os.path.basename(name), 'data', 'content_type')
+        if not reply or reply[0] is None:
+            return None
+        return reply[0], (reply[1] or b'application/octet-stream').decode('utf-8')
+
+    def local_path(self, name: str) -> Optional[str]:
+        return self.local.local_path(name)
+
+    def exists(self, name: str) -> bool:
+        return self.local.local_path(name) is not None or bool(
+            self.client.execute('EXISTS', self.prefix + os.path.basename(name)))
+
+
+class Backend:
+    """Bundle of the key/value and asset stores an instance uses"""
+
+    def __init__(self, name: str, kv: KVStore, assets: AssetStore):
+        self.name = name
+        self.kv = kv
+        self.assets = assets
+
+
+def create_backend(kind: str, assets_folder: str, state_folder: str,
+                   redis_url: Optional[str] = None, asset_ttl: Optional[float] = None) -> Backend:
+    """Build the configured backend (``local`` or ``redis``)"""
+    if kind == 'redis':
+        client = RESPClient(redis_url or 'redis://localhost:6379/0')
+        return Backend('redis', RedisKVStore(client), RedisAssetStore(client, assets_folder, ttl=asset_ttl))
+    if kind != 'local':
+        print(f"WARNING: Unknown STATE_BACKEND '{kind}'. Falling back to 'local'.")
+    return Backend('local', SQLiteKVStore(os.path.join(state_folder, 'state.sqlite3')),
+                   LocalAssetStore(assets_folder))
@@ -0,0 +1,152 @@
+"""Response compression and pre-encoded catalog responses.
+
+`init_compression` registers an after_request hook that gzip- or
+brotli-compresses text responses above a size threshold, negotiated on
+Accept-Encoding. Streaming responses (SSE, files) are left alone.
+
+`CatalogResponseCache` serializes and compresses responses derived only from
+the immutable catalog once per catalog version, so repeat requests cost a
+dictionary lookup instead of a JSON encode and a compression pass.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import Flask, Response, current_app, request as current_request
+
+from json_provider import dumps_bytes
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/css', 'text/plain',
+                      'application/javascript', 'text/javascript', 'image/svg+xml')
+
+
+def available_encodings() -> Tuple[str, ...]:
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header (honours q=0)"""
+    weights: Dict[str, float] = {}
+    for part in (accept_encoding or '').split(','):
+        pieces = part.strip().split(';')
+        coding = pieces[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    best, best_q = None, 0.0
+    for coding in available_encodings():
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data: bytes, encoding: str, level: int = COMPRESS_LEVEL) -> bytes:
+    if encoding == 'br':
+        # Brotli quality 0-11; scale the gzip-style 1-9 level onto it
+        return brotli.compress(data, quality=min(11, max(0, round(level * 11 / 9))))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _add_vary(response: Response):
+    vary = {value.strip().lower() for value in response.headers.get('Vary', '').split(',') if value.strip()}
+    if 'accept-encoding' not in vary:
+        response.headers.add('Vary', 'Accept-Encoding')
+
+
+def init_compression(app: Flask, min_size: int = COMPRESS_MIN_SIZE, level: int = COMPRESS_LEVEL):
+    """Compress eligible responses after each request"""
+
+    @app.after_request
+    def compress_response(response: Response) -> Response:
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        _add_vary(response)
+        encoding = choose_encoding(current_request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+        response.set_data(compress(data, encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class CatalogResponseCache:
+    """JSON responses built from the catalog, stored serialized and pre-compressed"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[tuple, Dict[str, bytes]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _encoded(self, app: Flask, key: tuple, build: Callable[[], Any]) -> Dict[str, bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        raw = dumps_bytes(app, build()) + b"\n"
+        entry = {'identity': raw}
+        if len(raw) >= COMPRESS_MIN_SIZE:
+            # Paid once per catalog version, so use the strongest settings
+            for encoding in available_encodings():
+                entry[encoding] = compress(raw, encoding, level=9)
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def response(self, version: str, key: tuple, build: Callable[[], Any]) -> Response:
+        """Serve `build()` for this catalog version, honouring If-None-Match and Accept-Encoding"""
+        # Stable across workers (unlike hash()), so any worker can answer a 304
+        etag = f"{version}-{hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:8]}"
+        if etag in current_request.if_none_match:
+            response = Response(status=304)
+        else:
+            entry = self._encoded(current_app, (version,) + key, build)
+            encoding = choose_encoding(current_request.headers.get('Accept-Encoding', ''))
+            if encoding not in entry:
+                encoding = 'identity'
+            response = Response(entry[encoding], mimetype='application/json')
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        _add_vary(response)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
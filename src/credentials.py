@@ -0,0 +1,213 @@
+"""Pool of upstream API keys.
+
+Every upstream call leases one key. Each key tracks its in-flight calls,
+the remaining quota the upstream reports (``X-RateLimit-Remaining`` and
+``X-RateLimit-Reset``) and a cool-down: a 429 benches the key for its
+``Retry-After`` (or an exponential back-off when the upstream gives none),
+and a key whose reported quota is used up rests until the reset. Calls go
+to the healthiest available key (most quota left, then fewest calls in
+flight), so throughput grows with the number of keys and one throttled key
+does not fail requests while others have room.
+
+With no keys configured the pool hands out anonymous leases and tracks
+nothing.
+"""
+import email.utils
+import os
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional
+
+# Comma-separated keys; the single-key variable still works
+POLLINATIONS_API_KEYS = [key.strip() for key in (
+    os.environ.get('POLLINATIONS_API_KEYS') or os.environ.get('POLLINATIONS_API_KEY') or ''
+).split(',') if key.strip()]
+# Calls one key may have in flight at once (0 = no limit)
+KEY_MAX_IN_FLIGHT = int(os.environ.get('KEY_MAX_IN_FLIGHT', '0'))
+# Back-off after a 429 without Retry-After, doubled per consecutive 429 up to the maximum
+KEY_COOLDOWN = float(os.environ.get('KEY_COOLDOWN', '15'))
+KEY_MAX_COOLDOWN = float(os.environ.get('KEY_MAX_COOLDOWN', '300'))
+# Longest a call waits for a key to come off cool-down (when it has no deadline of its own)
+KEY_MAX_WAIT = float(os.environ.get('KEY_MAX_WAIT', '10'))
+# Longest a call already holding an upstream slot waits for a key; past it the request fails fast
+KEY_SLOT_WAIT = float(os.environ.get('KEY_SLOT_WAIT', '1'))
+
+
+class CredentialsExhausted(Exception):
+    """Every key is cooling down (or at its in-flight limit) for longer than the caller can wait"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f'all upstream keys are rate limited, retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta seconds or an HTTP date)"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+class _Key:
+    __slots__ = ('secret', 'in_flight', 'remaining', 'reset_at', 'cooldown_until', 'strikes',
+                 'requests', 'throttled', 'last_used')
+
+    def __init__(self, secret: str):
+        self.secret = secret
+        self.in_flight = 0
+        self.remaining: Optional[int] = None  # Unknown until the upstream reports it
+        self.reset_at = 0.0
+        self.cooldown_until = 0.0
+        self.strikes = 0
+        self.requests = 0
+        self.throttled = 0
+        self.last_used = 0.0
+
+    @property
+    def label(self) -> str:
+        return f"…{self.secret[-4:]}"
+
+    def available_at(self, now: float) -> float:
+        """When this key can take another call (now or earlier means immediately)"""
+        at = self.cooldown_until
+        if self.remaining is not None and self.remaining - self.in_flight <= 0 and self.reset_at > now:
+            at = max(at, self.reset_at)
+        return at
+
+    def headroom(self, now: float) -> float:
+        if self.remaining is None or self.reset_at <= now:
+            return float('inf')
+        return self.remaining - self.in_flight
+
+
+class Lease:
+    """One upstream call's hold on a key; release it once the response body is consumed"""
+
+    __slots__ = ('key', 'released')
+
+    def __init__(self, key: Optional[_Key]):
+        self.key = key
+        self.released = False
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.key.secret}"} if self.key else {}
+
+
+class CredentialPool:
+    """Leases the healthiest upstream key and learns from each response"""
+
+    def __init__(self, keys: Optional[List[str]] = None, max_in_flight: int = KEY_MAX_IN_FLIGHT,
+                 cooldown: float = KEY_COOLDOWN, max_cooldown: float = KEY_MAX_COOLDOWN):
+        keys = POLLINATIONS_API_KEYS if keys is None else keys
+        self._keys = [_Key(secret) for secret in dict.fromkeys(keys)]
+        self.max_in_flight = max_in_flight
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._cond = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        return len(self._keys)
+
+    def _pick(self, now: float) -> Optional[_Key]:
+        """Best key that can take a call now (caller holds the lock)"""
+        best = None
+        for key in self._keys:
+            if key.available_at(now) > now:
+                continue
+            if self.max_in_flight and key.in_flight >= self.max_in_flight:
+                continue
+            if best is None or (key.headroom(now), -key.in_flight, -key.last_used) > \
+                    (best.headroom(now), -best.in_flight, -best.last_used):
+                best = key
+        return best
+
+    def acquire(self, timeout: Optional[float] = None) -> Lease:
+        """Lease a key, waiting up to `timeout` seconds for one to come off cool-down"""
+        if not self._keys:
+            return Lease(None)
+        give_up = time.monotonic() + (timeout if timeout is not None else KEY_MAX_WAIT)
+        with self._cond:
+            while True:
+                now = time.time()
+                key = self._pick(now)
+                if key is not None:
+                    key.in_flight += 1
+                    key.requests += 1
+                    key.last_used = now
+                    return Lease(key)
+                # Cooled keys come back at a known time; keys at their in-flight limit on release
+                cooling = [key.available_at(now) - now for key in self._keys if key.available_at(now) > now]
+                wait = min(cooling) if cooling else None
+                busy = len(cooling) < len(self._keys)
+                remaining = give_up - time.monotonic()
+                if remaining <= 0 or (not busy and wait > remaining):
+                    raise CredentialsExhausted(wait if wait is not None else 1.0)
+                self._cond.wait(min(wait, remaining) if wait is not None else remaining)
+
+    def retry_after(self) -> float:
+        """Seconds until some key can take a call (0 when one can now, or when no keys are configured)"""
+        if not self._keys:
+            return 0.0
+        now = time.time()
+        with self._cond:
+            return max(0.0, min(key.available_at(now) for key in self._keys) - now)
+
+    def observe(self, lease: Lease, status: int, headers: Mapping[str, str]):
+        """Learn from an upstream response: quota headers, and a cool-down on 429"""
+        key = lease.key
+        if key is None:
+            return
+        now = time.time()
+        with self._cond:
+            remaining = headers.get('X-RateLimit-Remaining')
+            if remaining is not None and remaining.strip().lstrip('-').isdigit():
+                key.remaining = int(remaining)
+                reset = parse_retry_after(headers.get('X-RateLimit-Reset'), now)
+                # Either seconds until the reset or an epoch timestamp
+                if reset is not None:
+                    key.reset_at = reset if reset > 10 ** 9 else now + reset
+            if status == 429:
+                key.strikes += 1
+                key.throttled += 1
+                retry_after = parse_retry_after(headers.get('Retry-After'), now)
+                if retry_after is None:
+                    retry_after = min(self.max_cooldown, self.cooldown * 2 ** (key.strikes - 1))
+                key.cooldown_until = max(key.cooldown_until, now + retry_after)
+                print(f"WARNING: Upstream key {key.label} throttled, cooling down for {retry_after:.0f}s")
+            elif status < 400:
+                key.strikes = 0
+
+    def release(self, lease: Lease):
+        """End the call; safe to call more than once"""
+        if lease.key is None or lease.released:
+            return
+        with self._cond:
+            if lease.released:
+                return
+            lease.released = True
+            lease.key.in_flight -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._cond:
+            keys = [{
+                'key': key.label,
+                'in_flight': key.in_flight,
+                'remaining': key.remaining if key.reset_at > now else None,
+                'cooldown_seconds': round(max(0.0, key.available_at(now) - now), 1),
+                'requests': key.requests,
+                'throttled': key.throttled
+            } for key in self._keys]
+        return {'keys': keys, 'available': sum(1 for key in keys if not key['cooldown_seconds'])}
@@ -0,0 +1,112 @@
+"""Per-request time budgets.
+
+Each generation request gets a deadline, from the client's
+``X-Request-Timeout`` header (seconds) or a per-endpoint default. Every
+stage checks it before starting and sizes its upstream timeouts to what is
+left, so a request the client has given up on stops consuming a worker.
+"""
+import os
+import select
+import selectors
+import socket
+import time
+from typing import Any, Callable, Dict, Optional
+
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+# Default and maximum budgets (seconds) per endpoint
+DEADLINE_DEFAULTS = {
+    'generate_image': float(os.environ.get('DEADLINE_GENERATE', '130')),
+    'generate_text': float(os.environ.get('DEADLINE_TEXT', '75')),
+    'generate_audio': float(os.environ.get('DEADLINE_AUDIO', '30'))
+}
+DEADLINE_MAX = float(os.environ.get('DEADLINE_MAX', '300'))
+
+# Below this much budget an upstream call is not worth starting
+MIN_UPSTREAM_BUDGET = 0.5
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out (or its client went away) before `stage`"""
+
+    def __init__(self, stage: str, reason: str = 'deadline exceeded'):
+        super().__init__(f"{reason} before {stage}")
+        self.stage = stage
+        self.reason = reason
+
+
+class Deadline:
+    """A monotonic deadline plus an optional client-disconnect probe"""
+
+    def __init__(self, budget: float, is_disconnected: Optional[Callable[[], bool]] = None):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        self.is_disconnected = is_disconnected
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, stage: str):
+        """Raise DeadlineExceeded if the budget is spent or the client disconnected"""
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(stage)
+        if self.is_disconnected and self.is_disconnected():
+            raise DeadlineExceeded(stage, reason='client disconnected')
+
+    def timeout(self, cap: float, stage: str = 'upstream call') -> float:
+        """Timeout for one stage: the smaller of `cap` and the remaining budget"""
+        self.check(stage)
+        remaining = self.remaining()
+        if remaining < MIN_UPSTREAM_BUDGET:
+            raise DeadlineExceeded(stage)
+        return min(cap, remaining)
+
+    def elapsed(self) -> float:
+        return self.budget - (self.expires_at - time.monotonic())
+
+
+def parse_budget(header_value: Optional[str], default: float) -> float:
+    """Budget from the request header, clamped to (0, DEADLINE_MAX]; the default if absent or invalid"""
+    if not header_value:
+        return default
+    try:
+        budget = float(header_value)
+    except ValueError:
+        return default
+    if budget <= 0:
+        return default
+    return min(budget, DEADLINE_MAX)
+
+
+def disconnect_probe(environ: Dict[str, Any]) -> Optional[Callable[[], bool]]:
+    """Callable reporting whether the client closed its connection, when the server exposes the socket.
+
+    A readable socket whose peek returns no bytes has been closed by the
+    peer. Bytes of a pipelined follow-up request are left untouched. The
+    socket is polled rather than select()ed, since select() cannot take
+    descriptors past 1024; a probe that fails for any other reason than a
+    reset connection counts as still connected.
+    """
+    sock = environ.get('gunicorn.socket')
+    if sock is None:
+        return None
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        readable = lambda: bool(poller.poll(0))
+    else:
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        readable = lambda: bool(selector.select(0))
+
+    def is_disconnected() -> bool:
+        try:
+            if not readable():
+                return False
+            return sock.recv(1, socket.MSG_PEEK) == b''
+        except ConnectionError:
+            return True
+        except (OSError, ValueError):
+            return False
+
+    return is_disconnected
@@ -0,0 +1,216 @@
+"""Preview derivatives for generated images.
+
+After an image is saved, a small WebP preview, a mid-size WebP display copy
+and a blurhash/LQIP placeholder are produced in a process pool so the chat
+view never has to download the full-size original. Uploaded reference
+images are downsized in the same pool. PIL is optional: without it no
+derivatives are produced and the originals are used.
+"""
+import base64
+import io
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+PREVIEW_MAX_SIDE = int(os.environ.get('PREVIEW_MAX_SIDE', '320'))
+DISPLAY_MAX_SIDE = int(os.environ.get('DISPLAY_MAX_SIDE', '1024'))
+DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', '2'))
+REFERENCE_MAX_SIDE = int(os.environ.get('REFERENCE_MAX_SIDE', '1024'))
+
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def pil_available() -> bool:
+    try:
+        import PIL  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _encode83(value: int, length: int) -> str:
+    result = ''
+    for i in range(1, length + 1):
+        digit = (value // (83 ** (length - i))) % 83
+        result += _BASE83[digit]
+    return result
+
+
+def _srgb_to_linear(value: int) -> float:
+    v = value / 255.0
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exponent: float) -> float:
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def encode_blurhash(pixels: List[Tuple[int, int, int]], width: int, height: int,
+                    x_components: int = 4, y_components: int = 3) -> str:
+    """Encode RGB pixels (row-major) as a blurhash string"""
+    linear = [(_srgb_to_linear(r), _srgb_to_linear(g), _srgb_to_linear(b)) for r, g, b in pixels]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1.0 if i == 0 and j == 0 else 2.0
+            r = g = b = 0.0
+            for y in range(height):
+                row_basis = normalisation * cos_y[j][y]
+                offset = y * width
+                for x in range(width):
+                    basis = row_basis * cos_x[i][x]
+                    pr, pg, pb = linear[offset + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = 1.0 / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    blurhash = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+
+    if ac:
+        actual_max = max(abs(component) for factor in ac for component in factor)
+        quantised_max = max(0, min(82, int(math.floor(actual_max * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        blurhash += _encode83(quantised_max, 1)
+    else:
+        max_value = 1.0
+        blurhash += _encode83(0, 1)
+
+    blurhash += _encode83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+
+    for r, g, b in ac:
+        quant = [max(0, min(18, int(math.floor(_sign_pow(c / max_value, 0.5) * 9 + 9.5)))) for c in (r, g, b)]
+        blurhash += _encode83(quant[0] * 19 * 19 + quant[1] * 19 + quant[2], 2)
+    return blurhash
+
+
+def derivative_names(filename: str) -> Dict[str, str]:
+    """File names of the derivatives for a generated image"""
+    stem = os.path.splitext(filename)[0]
+    return {
+        'preview': f"{stem}_preview.webp",
+        'display': f"{stem}_display.webp"
+    }
+
+
+def make_derivatives(filepath: str) -> Dict[str, Any]:
+    """Build preview, display and placeholder derivatives for one image (runs in a pool process)"""
+    from PIL import Image
+
+    folder, filename = os.path.split(filepath)
+    names = derivative_names(filename)
+    with Image.open(filepath) as original:
+        image = original.convert('RGB')
+    width, height = image.size
+
+    result: Dict[str, Any] = {'width': width, 'height': height}
+    for key, max_side in (('preview', PREVIEW_MAX_SIDE), ('display', DISPLAY_MAX_SIDE)):
+        copy = image.copy()
+        copy.thumbnail((max_side, max_side), Image.LANCZOS)
+        # Write then rename so a half-written file is never served
+        target = os.path.join(folder, names[key])
+        tmp_target = target + '.tmp'
+        copy.save(tmp_target, 'WEBP', quality=80 if key == 'preview' else 85, method=4)
+        os.replace(tmp_target, target)
+        result[key] = names[key]
+
+    tiny = image.copy()
+    tiny.thumbnail((32, 32))
+    result['blurhash'] = encode_blurhash(list(tiny.getdata()), tiny.width, tiny.height)
+
+    lqip = image.copy()
+    lqip.thumbnail((16, 16))
+    buffer = io.BytesIO()
+    lqip.save(buffer, 'WEBP', quality=40)
+    result['lqip'] = 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+    return result
+
+
+def reference_name(filename: str) -> str:
+    """File name of the downsized copy of an uploaded reference image"""
+    return f"{os.path.splitext(filename)[0]}_ref.jpg"
+
+
+def make_reference(filepath: str) -> str:
+    """Downsize an uploaded reference image for the upstream (runs in a pool process)"""
+    from PIL import Image, ImageOps
+
+    folder, filename = os.path.split(filepath)
+    target = os.path.join(folder, reference_name(filename))
+    with Image.open(filepath) as original:
+        # Respect camera orientation before the EXIF data is dropped
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    image.thumbnail((REFERENCE_MAX_SIDE, REFERENCE_MAX_SIDE), Image.LANCZOS)
+    tmp_target = target + '.tmp'
+    image.save(tmp_target, 'JPEG', quality=90, optimize=True)
+    os.replace(tmp_target, target)
+    return os.path.basename(target)
+
+
+def submit_reference(filepath: str) -> Optional[Future]:
+    """Queue reference downsizing off the request thread; None when PIL is missing"""
+    if not pil_available():
+        return None
+    return _get_pool().submit(make_reference, filepath)
+
+
+def _pool_context():
+    """Start method for the pool: never a plain fork of a threaded worker.
+
+    Forking a gthread worker copies whatever locks its other threads hold at
+    that moment, so a pool process can deadlock on its first print or import.
+    A fork server is started once, before any of that, with only this module
+    loaded; spawn is the fallback where fork servers are not supported.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Create the pool lazily, and again after a fork, so each worker owns its own"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=DERIVATIVE_WORKERS, mp_context=_pool_context())
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def submit_derivatives(filepath: str) -> Optional[Future]:
+    """Queue derivative generation off the request thread; None when PIL is missing"""
+    if not pil_available():
+        return None
+    return _get_pool().submit(make_derivatives, filepath)
+
+
+def collect_derivatives(future: Optional[Future], timeout: float) -> Dict[str, Any]:
+    """Wait up to `timeout` seconds for a derivative job; empty dict if not ready or failed"""
+    if future is None:
+        return {}
+    try:
+        return future.result(timeout=timeout)
+    except Exception as e:
+        print(f"WARNING: Derivatives not available yet: {e.__class__.__name__}: {e}")
+        return {}
@@ -0,0 +1,159 @@
+"""Load-adaptive degradation for image generation.
+
+The governor turns live load into a pressure value and maps it onto
+degradation levels. Load is what interactive requests compete for: the
+interactive class's own slots in use and calls queued (progressive renders
+and bulk work queue behind their own small caps and never count), and how
+much slower than usual recent upstream calls are, each compared with the
+measured median of the same model at the same size. Each level sheds more work per request instead of letting the
+backlog grow until everything times out:
+
+====  ==========================================================
+ 0    normal
+ 1    drop quality/HDR keyword load, cap resolution, no drafts
+ 2    tighter resolution cap, route to the fastest model
+ 3    serve a recent identical generation when one exists
+====  ==========================================================
+"""
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEGRADE_ENABLED = os.environ.get('DEGRADE_ENABLED', 'true').lower() == 'true'
+# Pressure at which levels 1, 2 and 3 start
+DEGRADE_THRESHOLDS = tuple(float(value) for value in
+                           os.environ.get('DEGRADE_THRESHOLDS', '0.75,0.9,1.2').split(','))
+# Upstream calls this many times slower than their model's usual latency at that size count as "at capacity"
+DEGRADE_SLOWDOWN_TARGET = float(os.environ.get('DEGRADE_SLOWDOWN_TARGET', '2.0'))
+# A single outlier moves the slowdown average by at most this much of a sample
+_SLOWDOWN_SAMPLE_MAX = 1.5 * DEGRADE_SLOWDOWN_TARGET
+# Seconds after the last upstream call that the slowdown still counts (an idle upstream is not a slow one)
+DEGRADE_SLOWDOWN_MAX_AGE = float(os.environ.get('DEGRADE_SLOWDOWN_MAX_AGE', '120'))
+# Largest side allowed at each level (index = level)
+DEGRADE_MAX_SIDES = (None, 1536, 1024, 768)
+DEGRADE_CACHE_MAX_AGE = float(os.environ.get('DEGRADE_CACHE_MAX_AGE', str(24 * 3600)))
+
+_DIMENSIONS = re.compile(r'(\d+)x(\d+)')
+
+
+def cap_resolution(resolution: str, max_side: int, resolutions: List[str]) -> str:
+    """Largest entry of `resolutions` within `max_side`, closest in aspect ratio to `resolution`"""
+    match = _DIMENSIONS.search(resolution)
+    if not match:
+        return resolution
+    width, height = int(match.group(1)), int(match.group(2))
+    if max(width, height) <= max_side:
+        return resolution
+    aspect = width / height
+    candidates: List[Tuple[float, int, str]] = []
+    for option in resolutions:
+        found = _DIMENSIONS.search(option)
+        if not found:
+            continue
+        w, h = int(found.group(1)), int(found.group(2))
+        if max(w, h) <= max_side:
+            candidates.append((abs(w / h - aspect), -(w * h), f"{w}x{h}"))
+    if not candidates:
+        scale = max_side / max(width, height)
+        return f"{int(width * scale) // 64 * 64}x{int(height * scale) // 64 * 64}"
+    return min(candidates)[2]
+
+
+class LoadGovernor:
+    """Maps live upstream load onto a degradation level and applies it to a request"""
+
+    def __init__(self, load: Callable[[], Dict[str, Any]], fastest_model: Callable[[List[str]], Optional[str]],
+                 resolutions: List[str], typical_ms: Callable[[str, int, int], Optional[float]],
+                 enabled: bool = DEGRADE_ENABLED):
+        self.load = load
+        self.fastest_model = fastest_model
+        self.resolutions = resolutions
+        self.typical_ms = typical_ms
+        self.enabled = enabled
+        self._slowdown: Optional[float] = None
+        self._slowdown_at = 0.0
+        self._lock = threading.Lock()
+        self.degraded_requests = 0
+
+    def observe(self, upstream_ms: float, model: str, width: int, height: int, alpha: float = 0.2):
+        """Feed the latency of one upstream image call, relative to that model's usual time at that size"""
+        typical = self.typical_ms(model, width, height)
+        if not typical:
+            # Nothing to compare with yet: a slow model or a large size is not load
+            return
+        ratio = min(upstream_ms / typical, _SLOWDOWN_SAMPLE_MAX)
+        with self._lock:
+            if self._slowdown is None or time.monotonic() - self._slowdown_at > DEGRADE_SLOWDOWN_MAX_AGE:
+                self._slowdown = 1.0
+            self._slowdown += alpha * (ratio - self._slowdown)
+            self._slowdown_at = time.monotonic()
+
+    def slowdown(self) -> Optional[float]:
+        """Recent upstream latency as a multiple of usual, or None when there has been no recent call"""
+        with self._lock:
+            if self._slowdown is None or time.monotonic() - self._slowdown_at > DEGRADE_SLOWDOWN_MAX_AGE:
+                return None
+            return self._slowdown
+
+    def pressure(self) -> float:
+        """0 = idle, 1 = at capacity; the worst of interactive slot usage, its queue depth and upstream slowdown"""
+        load = self.load()
+        limit = max(1, load['limit'])
+        latency = (self.slowdown() or 0.0) / DEGRADE_SLOWDOWN_TARGET
+        return max(load['in_flight'] / limit, 1.0 + load['queued'] / limit if load['queued'] else 0.0, latency)
+
+    def level(self) -> int:
+        if not self.enabled:
+            return 0
+        pressure = self.pressure()
+        return sum(1 for threshold in DEGRADE_THRESHOLDS if pressure >= threshold)
+
+    def apply(self, params: Dict[str, Any], valid_models: List[str]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Degrade request params for the current load; returns (params, degradation report or None)"""
+        level = self.level()
+        if level == 0:
+            return params, None
+        params = dict(params)
+        actions: List[str] = []
+        requested: Dict[str, Any] = {}
+
+        if params.get('quality') or params.get('hdr'):
+            requested.update(quality=params.get('quality'), hdr=params.get('hdr'))
+            params['quality'] = params['hdr'] = False
+            actions.append('quality')
+        if params.get('progressive'):
+            params['progressive'] = False
+            actions.append('progressive')
+
+        max_side = DEGRADE_MAX_SIDES[min(level, len(DEGRADE_MAX_SIDES) - 1)]
+        capped = cap_resolution(params['resolution'], max_side, self.resolutions)
+        if capped != params['resolution']:
+            requested['resolution'] = params['resolution']
+            params['resolution'] = capped
+            actions.append('resolution')
+
+        if level >= 2:
+            fastest = self.fastest_model(valid_models)
+            if fastest and fastest != params['model']:
+                requested['model'] = params['model']
+                params['model'] = fastest
+                actions.append('model')
+
+        if level >= 3:
+            params['allow_cached'] = True
+
+        with self._lock:
+            self.degraded_requests += 1
+        return params, {'level': level, 'actions': actions, 'requested': requested}
+
+    def stats(self) -> Dict[str, Any]:
+        slowdown = self.slowdown()
+        return {
+            'enabled': self.enabled,
+            'level': self.level(),
+            'pressure': round(self.pressure(), 3),
+            'slowdown': round(slowdown, 2) if slowdown is not None else None,
+            'degraded_requests': self.degraded_requests
+        }
@@ -0,0 +1,194 @@
+"""Server-side index of generated images.
+
+Every saved generation gets one row in a WAL-mode SQLite database with its
+prompts, model, style, size, content hash and timings. Gallery pages,
+per-model listings, prompt search and hash dedupe are all index lookups, so
+nothing ever has to scan the generated images folder.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+HISTORY_PAGE_MAX = 100
+
+_COLUMNS = ('id', 'created_at', 'prompt', 'enhanced_prompt', 'model', 'style', 'resolution',
+            'width', 'height', 'seed', 'filename', 'path', 'size_bytes', 'sha256', 'content_type',
+            'preview', 'display', 'blurhash', 'fetch_ms', 'save_ms', 'total_ms')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    prompt TEXT NOT NULL,
+    enhanced_prompt TEXT,
+    model TEXT NOT NULL,
+    style TEXT,
+    resolution TEXT,
+    width INTEGER,
+    height INTEGER,
+    seed INTEGER,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    content_type TEXT,
+    preview TEXT,
+    display TEXT,
+    blurhash TEXT,
+    fetch_ms REAL,
+    save_ms REAL,
+    total_ms REAL
+);
+CREATE INDEX IF NOT EXISTS generations_model ON generations (model, id);
+CREATE INDEX IF NOT EXISTS generations_sha256 ON generations (sha256);
+CREATE INDEX IF NOT EXISTS generations_filename ON generations (filename);
+CREATE INDEX IF NOT EXISTS generations_prompt ON generations (prompt, style, id);
+"""
+
+# External-content FTS index kept in sync by triggers
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts USING fts5(
+    prompt, enhanced_prompt, content='generations', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS generations_ai AFTER INSERT ON generations BEGIN
+    INSERT INTO generations_fts (rowid, prompt, enhanced_prompt)
+    VALUES (new.id, new.prompt, new.enhanced_prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS generations_ad AFTER DELETE ON generations BEGIN
+    INSERT INTO generations_fts (generations_fts, rowid, prompt, enhanced_prompt)
+    VALUES ('delete', old.id, old.prompt, old.enhanced_prompt);
+END;
+"""
+
+
+class HistoryStore:
+    """Generation metadata in SQLite (WAL), shared by every worker on the machine"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        try:
+            conn.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search falls back to LIKE
+            print("WARNING: SQLite FTS5 unavailable. History search will use LIKE.")
+            self.fts = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def record(self, **fields) -> int:
+        """Insert one generation; returns its id"""
+        fields.setdefault('created_at', time.time())
+        names = [name for name in _COLUMNS if name != 'id' and name in fields]
+        cursor = self._connect().execute(
+            f"INSERT INTO generations ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})",
+            [fields[name] for name in names])
+        return cursor.lastrowid
+
+    def set_derivatives(self, filename: str, derivatives: Dict[str, Any]) -> int:
+        """Fill in previews that finished after the generation was recorded; returns rows updated"""
+        cursor = self._connect().execute(
+            'UPDATE generations SET preview = ?, display = ?, blurhash = ?, width = COALESCE(?, width), '
+            'height = COALESCE(?, height) WHERE filename = ? AND preview IS NULL',
+            (derivatives.get('preview'), derivatives.get('display'), derivatives.get('blurhash'),
+             derivatives.get('width'), derivatives.get('height'), filename))
+        return cursor.rowcount
+
+    def get(self, generation_id: int) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute('SELECT * FROM generations WHERE id = ?', (generation_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_hash(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Most recent generation with identical image bytes"""
+        row = self._connect().execute(
+            'SELECT * FROM generations WHERE sha256 = ? ORDER BY id DESC LIMIT 1', (sha256,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_filename(self, filename: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            'SELECT * FROM generations WHERE filename = ? ORDER BY id DESC LIMIT 1', (filename,)).fetchone()
+        return dict(row) if row else None
+
+    def find_recent(self, prompt: str, style: Optional[str], max_age: float,
+                    model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Newest generation of exactly this prompt and style within `max_age` seconds, preferring `model`"""
+        rows = self._connect().execute(
+            'SELECT * FROM generations WHERE prompt = ? AND style IS ? AND created_at >= ? '
+            'ORDER BY id DESC LIMIT 20', (prompt, style or None, time.time() - max_age)).fetchall()
+        if not rows:
+            return None
+        for row in rows:
+            if row['model'] == model:
+                return dict(row)
+        return dict(rows[0])
+
+    def since(self, after_id: int, created_after: float, limit: int = 500) -> List[Dict[str, Any]]:
+        """Generations with an id above `after_id` created after `created_after`, oldest first"""
+        rows = self._connect().execute(
+            'SELECT id, created_at, prompt, model, style, resolution FROM generations '
+            'WHERE id > ? AND created_at >= ? ORDER BY id LIMIT ?', (after_id, created_after, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def list(self, limit: int = 24, before: Optional[int] = None, model: Optional[str] = None,
+             query: Optional[str] = None) -> Dict[str, Any]:
+        """One page, newest first. Keyset paging: pass the returned `next_before` for the next page"""
+        limit = max(1, min(int(limit), HISTORY_PAGE_MAX))
+        clauses: List[str] = []
+        params: List[Any] = []
+        source = 'generations g'
+        if query:
+            if self.fts:
+                source = 'generations_fts f JOIN generations g ON g.id = f.rowid'
+                clauses.append('generations_fts MATCH ?')
+                params.append(self._fts_query(query))
+            else:
+                clauses.append('(g.prompt LIKE ? OR g.enhanced_prompt LIKE ?)')
+                params.extend([f"%{query}%"] * 2)
+        if model:
+            clauses.append('g.model = ?')
+            params.append(model)
+        if before is not None:
+            clauses.append('g.id < ?')
+            params.append(int(before))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._connect().execute(
+            f"SELECT g.* FROM {source} {where} ORDER BY g.id DESC LIMIT ?", params + [limit + 1]).fetchall()
+        items = [dict(row) for row in rows[:limit]]
+        return {
+            'items': items,
+            'next_before': items[-1]['id'] if len(rows) > limit else None
+        }
+
+    def model_counts(self) -> Dict[str, int]:
+        rows = self._connect().execute('SELECT model, COUNT(*) FROM generations GROUP BY model').fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def delete(self, generation_id: int) -> bool:
+        cursor = self._connect().execute('DELETE FROM generations WHERE id = ?', (generation_id,))
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _fts_query(query: str) -> str:
+        """Quote each word so user input is never parsed as FTS syntax; last word matches as a prefix"""
+        words = [word.replace('"', '') for word in query.split()]
+        words = [word for word in words if word]
+        if not words:
+            return '""'
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += '*'
+        return ' '.join(terms)
@@ -0,0 +1,117 @@
+"""Background render jobs for progressive (draft-then-final) generation.
+
+Job records live in the shared key/value backend so any worker or instance
+can report status or cancel a job started elsewhere. The worker that owns a
+job polls for the cancel marker between upstream chunks.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from backends import KVStore
+
+JOB_TTL = float(os.environ.get('JOB_TTL', '900'))
+FINAL_RENDER_WORKERS = int(os.environ.get('FINAL_RENDER_WORKERS', '4'))
+
+TERMINAL_STATES = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once its cancel marker has been set"""
+
+
+class JobStore:
+    """Job records in the shared KV store with cross-worker cancellation"""
+
+    def __init__(self, kv: KVStore):
+        self.kv = kv
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(job_id: str, suffix: str = '') -> str:
+        return f"job:{job_id}{suffix}"
+
+    def _write(self, record: Dict[str, Any]):
+        self.kv.set(self._key(record['id']), json.dumps(record), ttl=JOB_TTL)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.kv.get(self._key(job_id))
+        return json.loads(raw) if raw else None
+
+    def update(self, job_id: str, **fields) -> Optional[Dict[str, Any]]:
+        record = self.get(job_id)
+        if record is None:
+            return None
+        record.update(fields, updated_at=time.time())
+        self._write(record)
+        return record
+
+    def create(self, kind: str, **fields) -> Dict[str, Any]:
+        now = time.time()
+        record = {'id': uuid.uuid4().hex, 'kind': kind, 'status': 'queued',
+                  'created_at': now, 'updated_at': now, **fields}
+        self._write(record)
+        return record
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Mark a job cancelled; the owning worker stops at its next check"""
+        record = self.get(job_id)
+        if record is None:
+            return None
+        if record['status'] in TERMINAL_STATES:
+            return record
+        self.kv.set(self._key(job_id, ':cancel'), '1', ttl=JOB_TTL)
+        return self.update(job_id, status='cancelled')
+
+    def is_cancelled(self, job_id: str) -> bool:
+        return self.kv.exists(self._key(job_id, ':cancel'))
+
+    def check(self, job_id: str):
+        """Raise JobCancelled if the job was cancelled"""
+        if self.is_cancelled(job_id):
+            raise JobCancelled(job_id)
+
+    def wait(self, job_id: str, timeout: float, interval: float = 0.25) -> Optional[Dict[str, Any]]:
+        """Long-poll until the job reaches a terminal state or `timeout` elapses"""
+        deadline = time.monotonic() + timeout
+        record = self.get(job_id)
+        while record and record['status'] not in TERMINAL_STATES and time.monotonic() < deadline:
+            time.sleep(interval)
+            record = self.get(job_id)
+        return record
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=FINAL_RENDER_WORKERS,
+                                                    thread_name_prefix='render-job')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def submit(self, record: Dict[str, Any], func: Callable[[str], Dict[str, Any]]):
+        """Run func(job_id) in the background and record its result or failure"""
+        job_id = record['id']
+
+        def run():
+            if self.is_cancelled(job_id):
+                return
+            self.update(job_id, status='running')
+            try:
+                result = func(job_id)
+            except JobCancelled:
+                self.update(job_id, status='cancelled')
+            except Exception as e:
+                print(f"ERROR: Job {job_id} failed: {str(e)}")
+                self.update(job_id, status='failed', error=str(e))
+            else:
+                if self.is_cancelled(job_id):
+                    return
+                self.update(job_id, status='done', result=result)
+
+        self._get_executor().submit(run)
@@ -1,23 +1,24 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, g, has_request_context, render_template, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-import requests
+import hashlib
 import json
+import math
 import re
 import os
 from urllib.parse import urlparse
 import uuid
 import random
-from urllib.parse import quote
+from urllib.parse import quote, urljoin
 from typing import Dict, List, Any, Optional
-import asyncio
-import asyncio
-import edge_tts
 import platform
-import subprocess
 import shutil
 import sys
-from dotenv import load_dotenv
+import threading
+import time
+
+# Heavy or rarely needed libraries (requests, subprocess, edge-tts, gTTS, PIL)
+# are imported inside the code paths that use them so worker boot stays cheap.
 
 # Get absolute paths based on this file's location
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -25,11 +26,36 @@ PROJECT_ROOT = os.path.dirname(BASE_DIR)
 DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
 CONFIG_DIR = os.path.join(PROJECT_ROOT, 'config')
 
-# Load .env from project root
+# Make sibling modules importable when loaded as src.main
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from derivatives import collect_derivatives, reference_name, submit_derivatives, submit_reference
+from backends import create_backend
+from compression import CatalogResponseCache, init_compression
+from credentials import KEY_SLOT_WAIT, CredentialPool, CredentialsExhausted, parse_retry_after
+from deadlines import DEADLINE_DEFAULTS, DEADLINE_HEADER, Deadline, DeadlineExceeded, disconnect_probe, parse_budget
+from governor import DEGRADE_CACHE_MAX_AGE, LoadGovernor
+from history import HistoryStore
+from jobs import JobCancelled, JobStore
+from model_stats import ModelPerformance
+from near_duplicates import NearDuplicateIndex
+from json_provider import install_json_provider
+from profiling import RequestProfiler, init_profiling, is_authorized as profiling_authorized
+from recommend import SimilarityIndex, model_document, style_document
+from scheduler import PRIORITY_CLASSES, SchedulerBusy, UpstreamScheduler
+from zip_export import ZipEntry, ZipStream, parse_range, unique_names
+from text_cache import TTLCache, TieredCache, compact_history, make_cache_key, render_context
+from tracing import TRACE_HEADER, SpanExporter, Tracer
+
+# Load .env from project root (skip importing dotenv when there is no file)
 dotenv_path = os.path.join(PROJECT_ROOT, '.env')
-load_dotenv(dotenv_path)
+if os.path.exists(dotenv_path):
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path)
 
 if platform.system() == "Windows":
+    import asyncio
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 app = Flask(__name__, 
@@ -37,6 +63,24 @@ app = Flask(__name__,
             static_folder=os.path.join(PROJECT_ROOT, 'static'))
 CORS(app)
 
+# Request tracing: spans for catalog reloads, recommendations, style selection (which times its catalog
+# lookups), prompt building, upstream calls, TTS and storage
+TRACE_FILE = os.environ.get('TRACE_FILE', os.path.join(PROJECT_ROOT, 'instance', 'traces.jsonl'))
+tracer = Tracer(SpanExporter(path=TRACE_FILE))
+
+# Seconds between checks of the catalog files for a new version (0 = every call)
+CATALOG_CHECK_INTERVAL = float(os.environ.get('CATALOG_CHECK_INTERVAL', '5'))
+# Recommendation results kept per (catalog version, prompt, candidate models)
+RECOMMENDATION_CACHE_SIZE = int(os.environ.get('RECOMMENDATION_CACHE_SIZE', '1024'))
+
+def compact_catalog(value: Any) -> Any:
+    """Recursively convert lists to tuples so catalog data is compact (dicts stay dicts: treat as read-only)"""
+    if isinstance(value, list):
+        return tuple(compact_catalog(item) for item in value)
+    if isinstance(value, dict):
+        return {key: compact_catalog(item) for key, item in value.items()}
+    return value
+
 class DataManager:
     """Manages loading and caching of styles and models data with advanced filtering"""
     
@@ -45,73 +89,180 @@ class DataManager:
         self._models_cache: Optional[List[Dict]] = None
         self._models_dict_cache: Optional[Dict[str, str]] = None
         self._compatibility_cache: Optional[Dict] = None
+        # Name lookups built once per catalog version
+        self._style_index: Dict[str, Dict] = {}
+        self._style_prompt_index: Dict[str, str] = {}
+        self._model_index: Dict[str, Dict] = {}
+        # TF-IDF search over style and model text for recommendations
+        self._style_search = SimilarityIndex()
+        self._model_search = SimilarityIndex()
+        self._recommendations = TTLCache(max_entries=RECOMMENDATION_CACHE_SIZE, ttl=24 * 3600)
+        # File stat signatures and content digests identify the loaded version
+        self._signatures: Dict[str, tuple] = {}
+        self._digests: Dict[str, str] = {}
+        self._last_check = 0.0
+        # Serializes reloads; readers never take it, they see the old or the new version whole
+        self._lock = threading.Lock()
+    
+    @property
+    def version(self) -> str:
+        """Content-derived catalog version, identical across workers serving the same files"""
+        digests = self._digests
+        return '-'.join(digests.get(name, '0') for name in ('styles.json', 'models.json'))
+    
+    def current_version(self) -> str:
+        """Catalog version after picking up any change on disk"""
+        self.load_styles()
+        self.load_models()
+        return self.version
+    
+    def _signature(self, filename: str) -> Optional[tuple]:
+        """Cheap change detector for a catalog file"""
+        try:
+            stat = os.stat(os.path.join(DATA_DIR, filename))
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    @tracer.traced('catalog.read_file')
+    def _read_catalog_file(self, filename: str) -> tuple:
+        """Parse a catalog file; returns (data, signature, digest)"""
+        signature = self._signature(filename)
+        with open(os.path.join(DATA_DIR, filename), 'rb') as f:
+            raw = f.read()
+        return compact_catalog(json.loads(raw.decode('utf-8'))), signature, hashlib.sha1(raw).hexdigest()[:12]
+    
+    def refresh_if_changed(self, force: bool = False) -> bool:
+        """Reload a catalog file that changed on disk; returns True if anything was reloaded"""
+        if not force and time.monotonic() - self._last_check < CATALOG_CHECK_INTERVAL:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            # Another thread may have checked while this one waited for the lock
+            if not force and now - self._last_check < CATALOG_CHECK_INTERVAL:
+                return False
+            self._last_check = now
+            changed = False
+            if self._styles_cache is not None and self._signature('styles.json') != self._signatures.get('styles.json'):
+                self._reload_styles()
+                changed = True
+            if self._models_cache is not None and self._signature('models.json') != self._signatures.get('models.json'):
+                self._reload_models()
+                changed = True
+            return changed
     
     def load_styles(self) -> List[Dict[str, Any]]:
         """Load and cache style categories from JSON file"""
-        if self._styles_cache is None:
-            try:
-                with open(os.path.join(DATA_DIR, 'styles.json'), 'r', encoding='utf-8') as f:
-                    self._styles_cache = json.load(f)
-            except FileNotFoundError:
-                print("Warning: styles.json not found. Creating default file.")
-                self._styles_cache = self._create_default_styles()
-                self._save_styles()
-        return self._styles_cache
+        self.refresh_if_changed()
+        styles = self._styles_cache
+        if styles is None:
+            with self._lock:
+                if self._styles_cache is None:
+                    self._reload_styles()
+                styles = self._styles_cache
+        return styles
     
     def load_models(self) -> List[Dict[str, Any]]:
-        """Load model categories from JSON file (always reload for development)"""
+        """Load and cache model categories from JSON file (reloaded when the file changes)"""
+        self.refresh_if_changed()
+        models = self._models_cache
+        if models is None:
+            with self._lock:
+                if self._models_cache is None:
+                    self._reload_models()
+                models = self._models_cache
+        return models
+    
+    def _reload_styles(self):
+        """Read styles.json, index it and publish it all in one step (caller holds the lock)"""
+        try:
+            styles, signature, digest = self._read_catalog_file('styles.json')
+        except FileNotFoundError:
+            print("Warning: styles.json not found. Creating default file.")
+            styles, signature, digest = self._create_default_styles(), None, self._digests.get('styles.json', '0')
+            self._save_styles(styles)
+        style_index, style_prompt_index, style_search = self._build_style_index(styles)
+        self._style_index, self._style_prompt_index, self._style_search, self._styles_cache = (
+            style_index, style_prompt_index, style_search, styles)
+        # Version last, so anything keyed by the new version sees the new indexes
+        self._signatures = {**self._signatures, 'styles.json': signature}
+        self._digests = {**self._digests, 'styles.json': digest}
+    
+    def _reload_models(self):
+        """Read models.json, index it and publish it all in one step (caller holds the lock)"""
         try:
-            with open(os.path.join(DATA_DIR, 'models.json'), 'r', encoding='utf-8') as f:
-                self._models_cache = json.load(f)
+            models, signature, digest = self._read_catalog_file('models.json')
         except FileNotFoundError:
             print("Warning: models.json not found. Creating default file.")
-            self._models_cache = self._create_default_models()
-            self._save_models()
-        return self._models_cache
+            models, signature, digest = self._create_default_models(), None, self._digests.get('models.json', '0')
+            self._save_models(models)
+        model_index, models_dict, model_search = self._build_model_index(models)
+        self._model_index, self._models_dict_cache, self._model_search, self._models_cache = (
+            model_index, models_dict, model_search, models)
+        self._signatures = {**self._signatures, 'models.json': signature}
+        self._digests = {**self._digests, 'models.json': digest}
+    
+    def _build_style_index(self, styles) -> tuple:
+        """Index styles by name and prompt, keeping the first match like a linear scan would"""
+        style_index: Dict[str, Dict] = {}
+        style_prompt_index: Dict[str, str] = {}
+        documents = []
+        for category in styles:
+            for style in category.get('styles', []):
+                if style['name'] not in style_index:
+                    documents.append((style['name'], style_document(style, category)))
+                style_index.setdefault(style['name'], {
+                    **style,
+                    'category_name': category['category'],
+                    'category_description': category.get('description', '')
+                })
+                style_prompt_index.setdefault(style['prompt'], style['prompt'])
+                style_prompt_index.setdefault(style['name'], style['prompt'])
+        return style_index, style_prompt_index, self._style_search.rebuilt(documents)
+    
+    def _build_model_index(self, models) -> tuple:
+        """Index models by name and build the flat models dict"""
+        model_index: Dict[str, Dict] = {}
+        models_dict: Dict[str, str] = {}
+        documents = []
+        for category in models:
+            for model in category.get('models', []):
+                if model['name'] not in model_index:
+                    documents.append((model['name'], model_document(model)))
+                model_index.setdefault(model['name'], {
+                    **model,
+                    'category_name': category['category'],
+                    'category_description': category.get('description', '')
+                })
+                models_dict[model['name']] = f"{model['display_name']} ({model['description']})"
+        return model_index, models_dict, self._model_search.rebuilt(documents)
+    
+    def prepare_search(self):
+        """Build the recommendation search indexes now instead of on the first recommendation"""
+        self.load_styles()
+        self.load_models()
+        self._style_search.build()
+        self._model_search.build()
     
     def get_models_dict(self) -> Dict[str, str]:
         """Get flat dictionary of models for backward compatibility"""
-        model_categories = self.load_models()
-        self._models_dict_cache = {}
-        for category in model_categories:
-            for model in category.get('models', []):
-                self._models_dict_cache[model['name']] = f"{model['display_name']} ({model['description']})"
+        self.load_models()
         return self._models_dict_cache
     
     def find_style_prompt(self, style: str) -> str:
         """Find style prompt by name or prompt value"""
-        styles = self.load_styles()
-        for category in styles:
-            for s in category.get('styles', []):
-                if s['prompt'] == style or s['name'] == style:
-                    return s['prompt']
-        return ''
+        self.load_styles()
+        return self._style_prompt_index.get(style, '')
     
     def get_style_details(self, style_name: str) -> Optional[Dict]:
-        """Get detailed information about a specific style"""
-        styles = self.load_styles()
-        for category in styles:
-            for style in category.get('styles', []):
-                if style['name'] == style_name:
-                    return {
-                        **style,
-                        'category_name': category['category'],
-                        'category_description': category.get('description', '')
-                    }
-        return None
+        """Get detailed information about a specific style (shared, treat as read-only)"""
+        self.load_styles()
+        return self._style_index.get(style_name)
     
     def get_model_details(self, model_name: str) -> Optional[Dict]:
-        """Get detailed information about a specific model"""
-        models = self.load_models()
-        for category in models:
-            for model in category.get('models', []):
-                if model['name'] == model_name:
-                    return {
-                        **model,
-                        'category_name': category['category'],
-                        'category_description': category.get('description', '')
-                    }
-        return None
+        """Get detailed information about a specific model (shared, treat as read-only)"""
+        self.load_models()
+        return self._model_index.get(model_name)
     
     def get_compatible_models_for_style(self, style_name: str) -> List[str]:
         """Get models that work best with a specific style"""
@@ -187,46 +338,69 @@ class DataManager:
                 
         return filtered_styles
     
+    @tracer.traced('catalog.recommendations')
     def get_recommendations(self, prompt: str, current_model: str = None, 
-                          current_style: str = None) -> Dict[str, List[str]]:
-        """Get intelligent recommendations based on prompt analysis"""
+                          current_style: str = None, models: Optional[List[str]] = None,
+                          limit: int = 3) -> Dict[str, Any]:
+        """Get intelligent recommendations based on prompt analysis (shared, treat as read-only)
+        
+        Styles are ranked by TF-IDF similarity of the prompt to their prompts,
+        advanced prompts and category descriptions. Models are ranked by their
+        own similarity plus the scores of the top styles that list them as a
+        best model; `models` restricts the candidates (e.g. to image models).
+        Results are cached per catalog version, since suggestions are asked
+        for again and again while a prompt is being edited.
+        """
+        self.load_styles()
+        self.load_models()
+        key = (self.version, prompt, tuple(models) if models is not None else None, limit)
+        recommendations = self._recommendations.get(key)
+        if recommendations is None:
+            recommendations = self._rank_recommendations(prompt, models, limit)
+            self._recommendations.set(key, recommendations)
+        return recommendations
+    
+    def _rank_recommendations(self, prompt: str, models: Optional[List[str]], limit: int) -> Dict[str, Any]:
+        """Uncached body of get_recommendations()"""
         recommendations = {
             'models': [],
             'styles': [],
-            'settings': {}
+            'settings': {},
+            'scores': {'models': {}, 'styles': {}}
         }
         
+        style_matches = self._style_search.search(prompt, k=limit * 4)
+        model_scores: Dict[str, float] = {}
+        for name, score in self._model_search.search(prompt, k=len(self._model_search)):
+            model_scores[name] = score
+        for name, score in style_matches:
+            for model in self.get_compatible_models_for_style(name):
+                model_scores[model] = model_scores.get(model, 0.0) + score
+        
+        candidates = [name for name in model_scores if name in self._model_index and (models is None or name in models)]
+        ranked_models = sorted(candidates, key=lambda name: -model_scores[name])[:limit]
+        if len(ranked_models) < limit:
+            # Nothing specific matched: fall back to the best-rated models
+            fallback = [name for name in (models or self._model_index) if name in self._model_index]
+            fallback.sort(key=lambda name: -self._model_index[name].get('rating', {}).get('quality', 0))
+            ranked_models += [name for name in fallback if name not in ranked_models][:limit - len(ranked_models)]
+        recommendations['models'] = ranked_models
+        recommendations['styles'] = [name for name, _ in style_matches[:limit]]
+        recommendations['scores']['models'] = {name: round(model_scores.get(name, 0.0), 4) for name in ranked_models}
+        recommendations['scores']['styles'] = dict(style_matches[:limit])
+        
+        # Settings still follow the subject matter of the prompt
         prompt_lower = prompt.lower()
-        
-        # Analyze prompt for content type
         if any(word in prompt_lower for word in ['portrait', 'person', 'face', 'human']):
-            recommendations['models'].extend(['realistic-vision-v3', 'dalle3', 'imagen'])
-            recommendations['styles'].extend(['Photorealistic', 'HDR', 'Hyperrealism'])
             recommendations['settings']['resolution'] = '1024x1024'
-            
         elif any(word in prompt_lower for word in ['landscape', 'nature', 'mountain', 'ocean']):
-            recommendations['models'].extend(['midjourney-v5', 'stable-diffusion-xl', 'dalle3'])
-            recommendations['styles'].extend(['Epic Cinematic', 'HDR', 'Golden Hour'])
             recommendations['settings']['resolution'] = '1536x1024'
-            
         elif any(word in prompt_lower for word in ['anime', 'manga', 'character']):
-            recommendations['models'].extend(['anything-v5', 'anime-art', 'dreamshaper'])
-            recommendations['styles'].extend(['Artistic Illustration', 'Digital Art'])
             recommendations['settings']['resolution'] = '1024x1024'
-            
         elif any(word in prompt_lower for word in ['cyberpunk', 'futuristic', 'neon', 'sci-fi']):
-            recommendations['models'].extend(['midjourney-v5', 'stable-diffusion-xl'])
-            recommendations['styles'].extend(['Cyberpunk', 'Epic Cinematic', 'Digital Art'])
             recommendations['settings']['hdr'] = True
-            
         elif any(word in prompt_lower for word in ['fantasy', 'dragon', 'magic', 'medieval']):
-            recommendations['models'].extend(['fantasy-art-v1', 'midjourney-v5', 'stable-diffusion-xl'])
-            recommendations['styles'].extend(['High Fantasy', 'Epic Cinematic', 'Digital Art'])
             recommendations['settings']['quality'] = True
-            
-        # Remove duplicates and limit to top 3
-        recommendations['models'] = list(dict.fromkeys(recommendations['models']))[:3]
-        recommendations['styles'] = list(dict.fromkeys(recommendations['styles']))[:3]
         
         return recommendations
     
@@ -238,25 +412,24 @@ class DataManager:
         """Create default models structure"""
         return []
     
-    def _save_styles(self):
+    def _save_styles(self, styles: List[Dict]):
         """Save styles to JSON file"""
         os.makedirs(DATA_DIR, exist_ok=True)
         with open(os.path.join(DATA_DIR, 'styles.json'), 'w', encoding='utf-8') as f:
-            json.dump(self._styles_cache, f, indent=2, ensure_ascii=False)
+            json.dump(styles, f, indent=2, ensure_ascii=False)
 
-    def _save_models(self):
+    def _save_models(self, models: List[Dict]):
         """Save models to JSON file"""
         os.makedirs(DATA_DIR, exist_ok=True)
         with open(os.path.join(DATA_DIR, 'models.json'), 'w', encoding='utf-8') as f:
-            json.dump(self._models_cache, f, indent=2, ensure_ascii=False)
+            json.dump(models, f, indent=2, ensure_ascii=False)
 
 # Initialize advanced data manager
 data_manager = DataManager()
 
-# Load data using the manager
-STYLE_CATEGORIES = data_manager.load_styles()
-MODEL_CATEGORIES = data_manager.load_models()
-MODELS = data_manager.get_models_dict()
+# Load data using the manager (read the catalog through data_manager: it is reloaded when the files change)
+data_manager.load_styles()
+data_manager.load_models()
 
 # Enhanced resolution options with aspect ratios
 RESOLUTIONS = [
@@ -271,50 +444,84 @@ GENERATED_IMAGES_FOLDER = os.path.join(PROJECT_ROOT, 'generated_images')
 STATIC_FOLDER = os.path.join(PROJECT_ROOT, 'static')
 MODELS_FOLDER = os.path.join(STATIC_FOLDER, 'models')
 STYLES_FOLDER = os.path.join(STATIC_FOLDER, 'styles')
+# Runtime state shared by the workers on this instance (job records etc.)
+INSTANCE_FOLDER = os.path.join(PROJECT_ROOT, 'instance')
+
+# Seconds /generate waits for preview derivatives before answering without them
+DERIVATIVE_WAIT = float(os.environ.get('DERIVATIVE_WAIT', '2'))
 
 # Create directories
-for folder in [GENERATED_IMAGES_FOLDER, STATIC_FOLDER, MODELS_FOLDER, STYLES_FOLDER]:
+for folder in [GENERATED_IMAGES_FOLDER, STATIC_FOLDER, MODELS_FOLDER, STYLES_FOLDER, INSTANCE_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
-# Create placeholder images for models if they don't exist
-def create_model_placeholders():
-    """Create placeholder images for models"""
-    try:
-        from PIL import Image, ImageDraw, ImageFont
-        
-        for category in MODEL_CATEGORIES:
-            for model in category.get('models', []):
-                model_name = model['name']
-                model_path = os.path.join(MODELS_FOLDER, f"{model_name}.jpg")
-                if not os.path.exists(model_path):
-                    # Create a simple placeholder image
-                    img = Image.new('RGB', (400, 300), color='#6366f1')
-                    draw = ImageDraw.Draw(img)
-                    
-                    # Try to use a font, fallback to default if not available
-                    try:
-                        font = ImageFont.truetype("arial.ttf", 20)
-                    except:
-                        font = ImageFont.load_default()
-                    
-                    # Draw model name on image
-                    text = model.get('display_name', model_name)
-                    bbox = draw.textbbox((0, 0), text, font=font)
-                    text_width = bbox[2] - bbox[0]
-                    text_height = bbox[3] - bbox[1]
-                    x = (400 - text_width) // 2
-                    y = (300 - text_height) // 2
-                    
-                    draw.text((x, y), text, fill='white', font=font)
-                    img.save(model_path, 'JPEG')
-                    
-    except ImportError:
-        # PIL not available, skip placeholder creation
-        print("PIL not available, skipping model placeholder creation")
-        pass
+# Shared state (caches, job records, counters) and generated assets.
+# 'local' uses SQLite + the generated images folder; 'redis' lets several
+# instances share them behind a load balancer.
+backend = create_backend(
+    os.environ.get('STATE_BACKEND', 'local').lower(),
+    assets_folder=GENERATED_IMAGES_FOLDER,
+    state_folder=INSTANCE_FOLDER,
+    redis_url=os.environ.get('REDIS_URL'),
+    asset_ttl=float(os.environ.get('ASSET_TTL', str(7 * 24 * 3600)))
+)
+
+# Background render jobs for progressive generation
+job_store = JobStore(backend.kv)
+
+# Reference images for image-to-image: uploads are streamed to disk in chunks
+# and stored once per content hash
+REFERENCE_MAX_BYTES = int(os.environ.get('REFERENCE_MAX_BYTES', str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+REFERENCE_NAME_PATTERN = re.compile(r'^ref_[0-9a-f]{64}\.(jpg|png|webp)$')
+# Public origin the upstream uses to fetch references (defaults to the request host)
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '')
+
+# Seconds of an audio request's budget kept back for the gTTS fallback
+AUDIO_FALLBACK_RESERVE = float(os.environ.get('AUDIO_FALLBACK_RESERVE', '8'))
+
+# On-demand and slow-request stack sampling (folded stacks for flamegraphs)
+PROFILES_FOLDER = os.path.join(INSTANCE_FOLDER, 'profiles')
+profiler = RequestProfiler(PROFILES_FOLDER)
+
+# Admission control for upstream calls: interactive work first, fair across clients
+upstream_scheduler = UpstreamScheduler()
+
+# Upstream API keys (POLLINATIONS_API_KEYS): spread calls, cool down throttled keys
+credential_pool = CredentialPool()
 
-# Create placeholder images
-create_model_placeholders()
+# Measured latency and error rate per image model, shared across workers
+model_performance = ModelPerformance(backend.kv)
+
+# Model the governor sheds load to until measurements say which is fastest
+DEGRADE_FAST_MODEL = os.environ.get('DEGRADE_FAST_MODEL', 'flux')
+
+# Sheds per-request work (resolution, model, quality) as upstream load builds
+load_governor = LoadGovernor(
+    # Only interactive work competes with the requests being degraded
+    load=lambda: upstream_scheduler.load('interactive'),
+    fastest_model=lambda models: model_performance.fastest(models) or (
+        DEGRADE_FAST_MODEL if DEGRADE_FAST_MODEL in models else None),
+    resolutions=RESOLUTIONS,
+    typical_ms=model_performance.typical_ms
+)
+
+# Bulk export: manifests live in the shared KV store so any worker can serve the download
+EXPORT_MAX_FILES = int(os.environ.get('EXPORT_MAX_FILES', '1000'))
+EXPORT_TTL = float(os.environ.get('EXPORT_TTL', str(24 * 3600)))
+EXPORT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Metadata index of every saved generation (gallery, search, dedupe)
+history_store = HistoryStore(os.environ.get('HISTORY_DB', os.path.join(INSTANCE_FOLDER, 'history.sqlite3')))
+
+# Recent prompts by model/style/resolution, for reusing near-identical generations;
+# seeded from history in create_app() and synced with it before each lookup
+near_duplicates = NearDuplicateIndex()
+
+# Model placeholder images are produced by the build step (python src/placeholders.py).
+# Set MODEL_PLACEHOLDERS=background to generate missing ones without blocking boot.
+if os.environ.get('MODEL_PLACEHOLDERS', '').lower() == 'background':
+    from placeholders import start_background_placeholders
+    start_background_placeholders(data_manager.load_models(), MODELS_FOLDER)
 
 class UltraPromptBuilder:
     """Advanced prompt enhancement with ultra-quality optimization"""
@@ -328,6 +535,7 @@ class UltraPromptBuilder:
         self.resolution = resolution
         self.data_manager = data_manager
     
+    @tracer.traced('prompt.build')
     def build(self) -> str:
         """Build ultra-optimized prompt with advanced enhancements"""
         prompt_parts = [self.base_prompt]
@@ -438,19 +646,542 @@ class UltraPromptBuilder:
 # Set global reference for prompt builder after class definition
 UltraPromptBuilder.data_manager = data_manager
 
+# Generated files are never rewritten under the same name, and versioned static
+# assets (?v=STATIC_VERSION) change URL when their content does
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Static files referenced with ?v= and precached by the service worker
+VERSIONED_STATIC = ('app.js', 'chat_store.js')
+
+def _static_version() -> str:
+    """Content hash of the versioned static assets and the service worker, identical across workers"""
+    digest = hashlib.sha1()
+    for name in VERSIONED_STATIC + ('sw.js',):
+        try:
+            with open(os.path.join(app.static_folder, name), 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            print(f"WARNING: Static asset {name} is missing")
+    return digest.hexdigest()[:12]
+
+STATIC_VERSION = _static_version()
+
 @app.route('/generated_images/<filename>')
 def serve_generated_image(filename):
-    """Serve generated images"""
-    return send_from_directory(GENERATED_IMAGES_FOLDER, filename)
+    """Serve generated images, from the shared asset store if not on this instance"""
+    if backend.assets.local_path(filename):
+        response = send_from_directory(GENERATED_IMAGES_FOLDER, filename)
+    else:
+        asset = backend.assets.get(secure_filename(filename))
+        if asset is None:
+            return jsonify({'error': 'Endpoint not found'}), 404
+        content, content_type = asset
+        response = Response(content, mimetype=content_type)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+@app.route('/sw.js')
+def service_worker():
+    """Service worker, served from the root so its scope covers the whole app"""
+    response = send_from_directory(app.static_folder, 'sw.js', mimetype='application/javascript')
+    # Browsers must always see the latest worker
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/')
 def home():
-    """Main page route"""
-    return render_template('index.html', 
-                          models=MODELS,
-                          model_categories=MODEL_CATEGORIES, 
-                          style_categories=STYLE_CATEGORIES, 
-                          resolutions=RESOLUTIONS)
+    """Main page route (the catalog is fetched from /api/catalog so it can be cached)"""
+    return render_template('index.html', resolutions=RESOLUTIONS, static_version=STATIC_VERSION)
+
+# Only FREE image models from the Pollinations docs
+VALID_IMAGE_MODELS = ['flux', 'kontext', 'klein', 'gptimage', 'gptimage-large',
+                      'qwen-image', 'wan-image', 'zimage']
+
+# Upstream API root; point it at scripts/pollinations_stub.py for local load tests
+POLLINATIONS_BASE_URL = os.environ.get('POLLINATIONS_BASE_URL', 'https://gen.pollinations.ai').rstrip('/')
+
+# Negative prompt sent with every image request to prevent quality issues
+NEGATIVE_PROMPT = "noisy, grainy, blurry, low quality, pixelated, artifacts, jpeg artifacts, compression artifacts, dark spots, poor quality, bad quality, distorted, deformed, ugly, disfigured"
+
+# Progressive mode: fast low-resolution draft before the full render
+DRAFT_MAX_SIDE = int(os.environ.get('DRAFT_MAX_SIDE', '512'))
+DRAFT_MODEL = os.environ.get('DRAFT_MODEL', 'flux')
+
+class UpstreamError(Exception):
+    """The image upstream answered without an image"""
+
+def _select_style_prompt(prompt: str, style: str) -> str:
+    """Enhanced style prompt lookup with context-aware advanced prompts
+
+    The catalog lookups are too cheap to trace one by one; this span times
+    them and `source` records which one answered.
+    """
+    with tracer.span('prompt.select_style', style=style or None) as span:
+        style_details = data_manager.get_style_details(style) if style else None
+        if style_details and 'advanced_prompts' in style_details:
+            prompt_lower = prompt.lower()
+            for keyword, mode in (('portrait', 'portrait_mode'), ('product', 'product_mode'),
+                                  ('landscape', 'landscape_mode')):
+                if keyword in prompt_lower and mode in style_details['advanced_prompts']:
+                    span.set(source=mode)
+                    return style_details['advanced_prompts'][mode]
+            span.set(source='style_details')
+            return style_details['prompt']
+        style_prompt = data_manager.find_style_prompt(style) if style else ''
+        span.set(source='style_prompt' if style_prompt else 'none')
+        return style_prompt
+
+def _parse_dimensions(resolution: str) -> tuple:
+    """Extract (width, height) from any '1024x1024'-like string"""
+    match = re.search(r'(\d+)x(\d+)', resolution)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    print(f"WARNING: Could not parse resolution '{resolution}'. Defaulting to 1024x1024.")
+    return 1024, 1024
+
+def _draft_dimensions(width: int, height: int) -> tuple:
+    """Scale dimensions down to the draft size, keeping the aspect ratio"""
+    scale = min(1.0, DRAFT_MAX_SIDE / max(width, height))
+    # Keep multiples of 64, which the upstream models prefer
+    return max(64, int(width * scale) // 64 * 64), max(64, int(height * scale) // 64 * 64)
+
+def _build_image_api_url(enhanced_prompt: str, width: int, height: int, model: str,
+                         hdr: bool, seed: int, reference: Optional[tuple] = None) -> str:
+    """Build the Pollinations image URL; `reference` is (image_url, strength) for image-to-image"""
+    api_url = (
+        f"{POLLINATIONS_BASE_URL}/image/{quote(enhanced_prompt)}"
+        f"?seed={seed}&nologo=true&width={width}&height={height}"
+        f"&enhance=true"  # Always enable quality enhancement
+        f"&negative={quote(NEGATIVE_PROMPT)}"  # Add negative prompt to prevent artifacts
+    )
+    if hdr:
+        api_url += "&hdr=true"
+    if model:
+        api_url += f"&model={model}"
+    if reference:
+        image_url, strength = reference
+        api_url += f"&image={quote(image_url, safe='')}&strength={strength}"
+    return api_url
+
+def _client_id() -> str:
+    """Identify the caller for fair queuing (first proxy hop when behind one)"""
+    forwarded = request.headers.get('X-Forwarded-For', '')
+    return forwarded.split(',')[0].strip() or request.remote_addr or ''
+
+def _request_priority(default: str = 'interactive') -> str:
+    """Priority class for this request; clients may lower it (X-Priority) but not raise it"""
+    requested = (request.headers.get('X-Priority') or '').strip().lower()
+    if requested in PRIORITY_CLASSES and PRIORITY_CLASSES.index(requested) > PRIORITY_CLASSES.index(default):
+        return requested
+    return default
+
+def _current_deadline() -> Optional[Deadline]:
+    """The time budget of the request being handled, if any"""
+    return g.get('deadline') if has_request_context() else None
+
+# Upstream calls that need an API key (TTS does not)
+KEYED_ENDPOINTS = ('image', 'text')
+
+def _acquire_upstream(endpoint: str, priority: Optional[str] = None, client: Optional[str] = None,
+                      check=None):
+    """Take an upstream slot; in a request, defaults come from the request itself.
+
+    `check` is polled while queued (see UpstreamScheduler.acquire), so a
+    background job stops waiting as soon as it is cancelled.
+    """
+    deadline = _current_deadline()
+    if has_request_context():
+        priority = priority or _request_priority()
+        client = _client_id() if client is None else client
+    if deadline:
+        deadline.check(f'{endpoint} queue')
+    if endpoint in KEYED_ENDPOINTS:
+        # Don't queue for a slot that would then sit idle waiting out every key's cool-down
+        retry_after = credential_pool.retry_after()
+        if retry_after > KEY_SLOT_WAIT:
+            raise SchedulerBusy(f'all upstream keys are rate limited, retry in {retry_after:.0f}s', retry_after)
+    try:
+        with tracer.span('scheduler.wait', endpoint=endpoint, priority=priority) as span:
+            ticket = upstream_scheduler.acquire(endpoint, client or '', priority or 'interactive',
+                                                timeout=deadline.remaining() if deadline else None, check=check)
+            span.set(queue_ms=ticket.queue_ms)
+            return ticket
+    except SchedulerBusy:
+        if deadline and deadline.remaining() <= 0:
+            raise DeadlineExceeded(f'{endpoint} upstream call')
+        raise
+
+def _busy_response(e: SchedulerBusy):
+    """503 for a request that found no upstream slot or API key, with a hint of when to retry"""
+    response = jsonify({'error': f'Server busy: {str(e)}'})
+    response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after or 1)))
+    return response, 503
+
+def _release_upstream(ticket):
+    """Return an upstream slot and note its timings for the Server-Timing header"""
+    upstream_scheduler.release(ticket)
+    if has_request_context():
+        timings = g.setdefault('upstream_timings', [])
+        timings.append((ticket.queue_ms, ticket.upstream_ms))
+
+def _upstream_get(api_url: str, timeout, stream: bool = False, deadline: Optional[Deadline] = None) -> tuple:
+    """GET from the upstream with a pooled API key; returns (response, lease).
+
+    A 429 cools its key down and the call moves on to the next healthiest
+    key, so throttling only surfaces (as SchedulerBusy, a 503 with
+    Retry-After) once every key has been tried. The caller holds an upstream
+    slot, so waiting for a key is capped at KEY_SLOT_WAIT. Release the lease
+    once the response body has been consumed.
+    """
+    import requests
+    attempts = max(1, credential_pool.size)
+    for attempt in range(attempts):
+        try:
+            lease = credential_pool.acquire(min(KEY_SLOT_WAIT, deadline.remaining()) if deadline else KEY_SLOT_WAIT)
+        except CredentialsExhausted as e:
+            if deadline and deadline.remaining() <= 0:
+                raise DeadlineExceeded('upstream API key')
+            raise SchedulerBusy(str(e), e.retry_after)
+        with tracer.span('upstream.request', kind='client', endpoint=api_url[len(POLLINATIONS_BASE_URL):].split('/')[1],
+                         attempt=attempt + 1, key=lease.key.label if lease.key else None) as span:
+            try:
+                response = requests.get(api_url, headers=lease.headers, timeout=timeout, stream=stream)
+            except Exception:
+                credential_pool.release(lease)
+                raise
+            # With stream=True this is the time to the response headers, not the whole body
+            span.set(status=response.status_code, ttfb_ms=round(response.elapsed.total_seconds() * 1000, 1))
+            if response.status_code >= 400:
+                span.fail(f"HTTP {response.status_code}")
+        credential_pool.observe(lease, response.status_code, response.headers)
+        if response.status_code != 429:
+            return response, lease
+        response.close()
+        credential_pool.release(lease)
+    raise SchedulerBusy('upstream rate limit reached on every API key',
+                        credential_pool.retry_after() or parse_retry_after(response.headers.get('Retry-After')))
+
+def _fetch_image(api_url: str, timeout: float, job_id: Optional[str] = None,
+                 priority: Optional[str] = None, client: Optional[str] = None,
+                 deadline: Optional[Deadline] = None, model: Optional[str] = None,
+                 width: int = 0, height: int = 0) -> tuple:
+    """Download an image from the upstream; returns (content, content_type).
+
+    A cancelled background job gives up its place in the upstream queue and
+    is checked again right before the call; the body is streamed so it can
+    also stop between chunks instead of paying for the whole download. With
+    `model` given, the call's latency and outcome feed the model's stats.
+    """
+    import requests
+    ticket = _acquire_upstream('image', priority, client, check=(lambda: job_store.check(job_id)) if job_id else None)
+    outcome = 'error'
+    lease = None
+    try:
+        if job_id:
+            # The job may have been cancelled while it queued; don't start the render
+            job_store.check(job_id)
+        if deadline:
+            timeout = deadline.timeout(timeout, 'image upstream call')
+        response, lease = _upstream_get(api_url, timeout, stream=True, deadline=deadline)
+        with response:
+            content_type = response.headers.get('Content-Type', '')
+            if response.status_code == 200 and 'image' in content_type:
+                chunks = []
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    if job_id:
+                        job_store.check(job_id)
+                    if deadline:
+                        deadline.check('image download')
+                    chunks.append(chunk)
+                outcome = 'ok'
+                return b''.join(chunks), content_type
+            try:
+                error_msg = response.json().get('error', 'Failed to generate image')
+            except Exception:
+                error_msg = f'Failed to generate image. Status: {response.status_code}'
+            raise UpstreamError(error_msg)
+    except requests.Timeout:
+        outcome = 'timeout'
+        raise
+    except (DeadlineExceeded, JobCancelled, SchedulerBusy):
+        # Our own budget, a cancel or no API key free: not the model's doing
+        outcome = None
+        raise
+    finally:
+        if lease:
+            credential_pool.release(lease)
+        _release_upstream(ticket)
+        if model and outcome in ('ok', 'timeout'):
+            load_governor.observe(ticket.upstream_ms, model, width, height)
+        if model and outcome:
+            # A timeout is a (lower bound) latency sample; other failures only count as errors
+            model_performance.record(model, width, height,
+                                     ticket.upstream_ms if outcome != 'error' else None, outcome == 'ok')
+
+def _save_image(content: bytes, content_type: str) -> tuple:
+    """Write image bytes to the generated images folder; returns (filename, sha256, existing row).
+
+    Byte-identical images are not stored twice: if the history already has
+    this hash and the file is still available, its file name is reused.
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    existing = history_store.find_by_hash(digest)
+    if existing and backend.assets.exists(existing['filename']):
+        print(f"DEBUG: Reusing identical image {existing['filename']}")
+        return existing['filename'], digest, existing
+    ext = '.png' if 'png' in content_type else '.jpg'
+    filename = f"{uuid.uuid4().hex}{ext}"
+    filepath = os.path.join(GENERATED_IMAGES_FOLDER, filename)
+    with open(filepath, 'wb') as f:
+        f.write(content)
+    backend.assets.put_file(filename, filepath, content_type.split(';')[0])
+    return filename, digest, None
+
+def _publish_derivatives(derivatives: Dict[str, Any]):
+    """Hand finished preview/display WebPs to the asset store (and so to other instances)"""
+    for key in ('preview', 'display'):
+        if derivatives.get(key):
+            backend.assets.put_file(derivatives[key], os.path.join(GENERATED_IMAGES_FOLDER, derivatives[key]),
+                                    'image/webp')
+
+def _publish_late_derivatives(future, filename: str):
+    """Done-callback for derivatives that missed the response: publish them and fill in the history row"""
+    def publish():
+        try:
+            derivatives = future.result()
+            _publish_derivatives(derivatives)
+            history_store.set_derivatives(filename, derivatives)
+            print(f"DEBUG: Late derivatives published for {filename}")
+        except Exception as e:
+            print(f"WARNING: Could not publish late derivatives for {filename}: {str(e)}")
+    # Callbacks run on the pool's management thread; keep uploads off it
+    threading.Thread(target=publish, name='late-derivatives', daemon=True).start()
+
+def _publish_downsized_reference(future, name: str):
+    """Done-callback for a reference's downsized copy: hand it to the asset store"""
+    def publish():
+        try:
+            downsized = future.result()
+            backend.assets.put_file(downsized, os.path.join(GENERATED_IMAGES_FOLDER, downsized), 'image/jpeg')
+        except Exception as e:
+            print(f"WARNING: Could not downsize reference {name}: {str(e)}")
+    # Same as _publish_late_derivatives: the callback runs on the pool's management thread
+    threading.Thread(target=publish, name='reference-publish', daemon=True).start()
+
+def _render_image(enhanced_prompt: str, model: str, width: int, height: int, hdr: bool,
+                  seed: int, timeout: float, derivative_wait: Optional[float] = None,
+                  job_id: Optional[str] = None, record: Optional[Dict[str, Any]] = None,
+                  priority: Optional[str] = None, client: Optional[str] = None,
+                  deadline: Optional[Deadline] = None, reference: Optional[tuple] = None) -> Dict[str, Any]:
+    """Fetch, store and post-process one image; returns the image fields of the response.
+
+    `record` carries the request fields (prompt, style, resolution) to store
+    in the generation history; drafts pass None and are not recorded.
+    """
+    started = time.perf_counter()
+    api_url = _build_image_api_url(enhanced_prompt, width, height, model, hdr, seed, reference)
+    print(f"DEBUG: Generated API URL: {api_url}")
+    with tracer.span('upstream.image', model=model, width=width, height=height) as span:
+        content, content_type = _fetch_image(api_url, timeout, job_id=job_id, priority=priority, client=client,
+                                             deadline=deadline, model=model, width=width, height=height)
+        span.set(bytes=len(content), content_type=content_type)
+    fetched = time.perf_counter()
+    if deadline:
+        deadline.check('file write')
+    with tracer.span('storage.save_image', bytes=len(content)) as span:
+        filename, digest, existing = _save_image(content, content_type)
+        span.set(filename=filename, deduplicated=existing is not None)
+    saved = time.perf_counter()
+
+    payload: Dict[str, Any] = {'image_url': f"/generated_images/{filename}"}
+    late_derivatives = None
+    if derivative_wait is not None:
+        if deadline:
+            # Never hold the response past the budget just for previews
+            derivative_wait = min(derivative_wait, deadline.remaining())
+        if existing and existing.get('preview'):
+            derivatives = {'preview': existing['preview'], 'display': existing['display'],
+                           'blurhash': existing['blurhash'], 'width': existing['width'],
+                           'height': existing['height']}
+        else:
+            # Preview/display WebPs and a blurhash are built in the process pool;
+            # wait briefly so most responses can include them
+            future = submit_derivatives(os.path.join(GENERATED_IMAGES_FOLDER, filename))
+            with tracer.span('derivatives.wait', budget_s=derivative_wait) as span:
+                derivatives = collect_derivatives(future, derivative_wait)
+                span.set(ready=bool(derivatives))
+            if derivatives:
+                _publish_derivatives(derivatives)
+            else:
+                late_derivatives = future
+        payload.update({
+            'preview_url': f"/generated_images/{derivatives['preview']}" if derivatives else None,
+            'display_url': f"/generated_images/{derivatives['display']}" if derivatives else None,
+            'blurhash': derivatives.get('blurhash'),
+            'lqip': derivatives.get('lqip'),
+            'width': derivatives.get('width'),
+            'height': derivatives.get('height')
+        })
+
+    if record is not None:
+        try:
+            with tracer.span('history.record'):
+                payload['history_id'] = history_store.record(
+                    prompt=record.get('prompt', ''),
+                    enhanced_prompt=enhanced_prompt,
+                    model=model,
+                    style=record.get('style') or None,
+                    resolution=record.get('resolution'),
+                    width=payload.get('width') or width,
+                    height=payload.get('height') or height,
+                    seed=seed,
+                    filename=filename,
+                    path=os.path.join(GENERATED_IMAGES_FOLDER, filename),
+                    size_bytes=len(content),
+                    sha256=digest,
+                    content_type=content_type.split(';')[0],
+                    preview=os.path.basename(payload['preview_url']) if payload.get('preview_url') else None,
+                    display=os.path.basename(payload['display_url']) if payload.get('display_url') else None,
+                    blurhash=payload.get('blurhash'),
+                    fetch_ms=round((fetched - started) * 1000, 1),
+                    save_ms=round((saved - fetched) * 1000, 1),
+                    total_ms=round((time.perf_counter() - started) * 1000, 1)
+                )
+            if reference is None:
+                near_duplicates.add(payload['history_id'], record.get('prompt', ''),
+                                    _near_duplicate_scope(model, record.get('style'), record.get('resolution')))
+        except Exception as e:
+            print(f"WARNING: Could not record generation history: {str(e)}")
+    if late_derivatives is not None:
+        # Attached after the history write so a late result always finds its row
+        late_derivatives.add_done_callback(lambda future: _publish_late_derivatives(future, filename))
+    return payload
+
+def _near_duplicate_scope(model: str, style: Optional[str], resolution: Optional[str]) -> tuple:
+    return (model, style or '', resolution or '')
+
+def _near_duplicate_rows(after_id: Optional[int], created_after: float, limit: int) -> List[tuple]:
+    """History rows for NearDuplicateIndex.sync()"""
+    return [(row['id'], row['prompt'], _near_duplicate_scope(row['model'], row['style'], row['resolution']),
+             row['created_at']) for row in history_store.since(after_id or 0, created_after, limit)]
+
+def _similar_generations(prompt: str, model: str, style: str, resolution: str) -> List[Dict[str, Any]]:
+    """Recent generations of near-identical prompts with the same settings, best match first"""
+    # Pick up what other workers (or this one before a restart) recorded
+    near_duplicates.sync(_near_duplicate_rows)
+    items = []
+    for history_id, similarity in near_duplicates.find(prompt, _near_duplicate_scope(model, style, resolution)):
+        row = history_store.get(history_id)
+        if not row or not backend.assets.exists(row['filename']):
+            near_duplicates.discard(history_id)
+            continue
+        items.append({**_history_item(row), 'similarity': similarity})
+    return items
+
+def _cached_generation_response(row: Dict[str, Any], quality: bool, hdr: bool, **extra):
+    """Answer a generation request with an existing image instead of rendering"""
+    item = _history_item(row)
+    return jsonify({
+        'success': True,
+        'prompt': row['enhanced_prompt'],
+        'model': row['model'],
+        'resolution': row['resolution'],
+        'quality': quality,
+        'hdr': hdr,
+        **{key: item.get(key) for key in ('image_url', 'preview_url', 'display_url',
+                                          'blurhash', 'width', 'height')},
+        'history_id': row['id'],
+        'cached': True,
+        **extra
+    })
+
+def _sniff_image_type(head: bytes) -> Optional[str]:
+    """File extension for JPEG, PNG or WebP data, from its leading bytes"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+def _reference_payload(name: str, deduplicated: bool) -> Dict[str, Any]:
+    return {
+        'success': True,
+        'reference': name,
+        'url': f"/generated_images/{name}",
+        'deduplicated': deduplicated
+    }
+
+def _reference_public_url(reference: str) -> Optional[str]:
+    """Absolute URL of a stored reference (its downsized copy once ready), or None if unknown"""
+    name = os.path.basename(str(reference))
+    if not REFERENCE_NAME_PATTERN.match(name) or not backend.assets.exists(name):
+        return None
+    downsized = reference_name(name)
+    if backend.assets.exists(downsized):
+        name = downsized
+    return urljoin(PUBLIC_BASE_URL or request.host_url, f"/generated_images/{name}")
+
+@app.route('/upload_reference/<digest>', methods=['GET'])
+def check_reference(digest):
+    """Look up a reference image by SHA-256 so clients can skip re-uploading it"""
+    for ext in ('jpg', 'png', 'webp'):
+        name = f"ref_{digest.lower()}.{ext}"
+        if REFERENCE_NAME_PATTERN.match(name) and backend.assets.exists(name):
+            return jsonify(_reference_payload(name, deduplicated=True))
+    return jsonify({'error': 'Reference not found'}), 404
+
+@app.route('/upload_reference', methods=['POST'])
+def upload_reference():
+    """Store a reference image sent as the raw request body (Content-Type: image/*).
+
+    The body is streamed to disk in 64KB chunks while it is hashed, so an
+    upload never sits in worker memory; identical images are stored once.
+    """
+    tmp_path = os.path.join(GENERATED_IMAGES_FOLDER, f".upload_{uuid.uuid4().hex}.part")
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        ext = None
+        with open(tmp_path, 'wb') as f:
+            while True:
+                chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if ext is None:
+                    ext = _sniff_image_type(chunk)
+                    if ext is None:
+                        return jsonify({'error': 'Reference must be a JPEG, PNG or WebP image'}), 415
+                size += len(chunk)
+                if size > REFERENCE_MAX_BYTES:
+                    return jsonify({'error': f'Reference image is larger than {REFERENCE_MAX_BYTES // (1024 * 1024)}MB'}), 413
+                digest.update(chunk)
+                f.write(chunk)
+        if size == 0:
+            return jsonify({'error': 'No image data provided'}), 400
+        
+        name = f"ref_{digest.hexdigest()}.{ext}"
+        if backend.assets.exists(name):
+            print(f"DEBUG: Reference {name} already stored")
+            return jsonify(_reference_payload(name, deduplicated=True))
+        
+        path = os.path.join(GENERATED_IMAGES_FOLDER, name)
+        os.replace(tmp_path, path)
+        backend.assets.put_file(name, path, f"image/{'jpeg' if ext == 'jpg' else ext}")
+        
+        # The upstream gets a downsized copy once the pool has built it
+        future = submit_reference(path)
+        if future is not None:
+            future.add_done_callback(lambda done: _publish_downsized_reference(done, name))
+        print(f"DEBUG: Stored reference {name} ({size} bytes)")
+        return jsonify(_reference_payload(name, deduplicated=False))
+    
+    except Exception as e:
+        app.logger.error(f"Reference upload error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 @app.route('/generate', methods=['POST'])
 def generate_image():
@@ -466,113 +1197,171 @@ def generate_image():
         quality = data.get('quality', False)
         hdr = data.get('hdr', False)
         model = data.get('model', 'flux')
+        progressive = bool(data.get('progressive', False))
         # Strength: 0.0 to 1.0. Lower = more like original image. Higher = more creative/random.
         # Pollinations usually defaults to high/1.0 if not set.
         # We'll set a default of 0.6 if image is present to preserve the original structure.
-        strength = data.get('strength', 0.6)
+        try:
+            strength = min(max(float(data.get('strength', 0.6)), 0.0), 1.0)
+        except (TypeError, ValueError):
+            strength = 0.6
         
         if not prompt:
             return jsonify({'error': 'Prompt is required'}), 400
         
-        # Validate model - fallback to flux if invalid (only FREE models from doc)
-        valid_models = ['flux', 'kontext', 'klein', 'gptimage', 'gptimage-large', 
-                       'qwen-image', 'wan-image', 'zimage']
-        if model not in valid_models:
+        # Validate model - fallback to flux if invalid ('auto' is resolved below)
+        if model not in VALID_IMAGE_MODELS and model != 'auto':
             print(f"WARNING: Invalid model '{model}'. Falling back to 'flux'.")
             model = 'flux'
         
+        reference = None
+        if data.get('reference_image'):
+            reference_url = _reference_public_url(data['reference_image'])
+            if not reference_url:
+                return jsonify({'error': 'Reference image not found. Please upload it again.'}), 400
+            reference = (reference_url, strength)
+        
         # Clean up resolution format if needed
         resolution = re.sub(r'\s*\(.*?\)', '', resolution).strip()
         
-        # Enhanced style prompt lookup with advanced prompts
-        style_details = data_manager.get_style_details(style) if style else None
-        if style_details and 'advanced_prompts' in style_details:
-            # Use context-aware advanced prompts
-            prompt_lower = prompt.lower()
-            if 'portrait' in prompt_lower and 'portrait_mode' in style_details['advanced_prompts']:
-                style_prompt = style_details['advanced_prompts']['portrait_mode']
-            elif 'product' in prompt_lower and 'product_mode' in style_details['advanced_prompts']:
-                style_prompt = style_details['advanced_prompts']['product_mode']
-            elif 'landscape' in prompt_lower and 'landscape_mode' in style_details['advanced_prompts']:
-                style_prompt = style_details['advanced_prompts']['landscape_mode']
-            else:
-                style_prompt = style_details['prompt']
-        else:
-            style_prompt = data_manager.find_style_prompt(style) if style else ''
+        # Auto: the most preferred model that is currently about as fast as the fastest
+        auto_model = model == 'auto'
+        if auto_model:
+            model = model_performance.choose(VALID_IMAGE_MODELS, *_parse_dimensions(resolution))
+            print(f"DEBUG: Auto-selected model '{model}'")
+        
+        # Under load, trade resolution/model/quality for staying responsive
+        degraded = None
+        if data.get('allow_degrade', True) is not False:
+            params, degraded = load_governor.apply({'resolution': resolution, 'model': model, 'quality': quality,
+                                                    'hdr': hdr, 'progressive': progressive}, VALID_IMAGE_MODELS)
+            if degraded:
+                print(f"WARNING: Degrading request under load: {degraded}")
+                resolution, model = params['resolution'], params['model']
+                quality, hdr, progressive = params['quality'], params['hdr'], params['progressive']
+                if params.get('allow_cached') and not reference:
+                    row = history_store.find_recent(prompt, style, DEGRADE_CACHE_MAX_AGE, model)
+                    if not (row and backend.assets.exists(row['filename'])):
+                        similar = _similar_generations(prompt, model, style, resolution)
+                        row = history_store.get(similar[0]['id']) if similar else None
+                    if row:
+                        degraded['actions'].append('cached')
+                        return _cached_generation_response(row, quality, hdr, degraded=degraded)
+        
+        # Opt-in reuse of recent near-identical prompts: 'alongside' a new render or 'instead' of one
+        reuse_similar = data.get('reuse_similar', False)
+        if reuse_similar is True:
+            reuse_similar = 'alongside'
+        similar = []
+        if reuse_similar in ('alongside', 'instead') and not reference:
+            similar = _similar_generations(prompt, model, style, resolution)
+            if similar and reuse_similar == 'instead':
+                return _cached_generation_response(history_store.get(similar[0]['id']), quality, hdr,
+                                                   similarity=similar[0]['similarity'], similar=similar,
+                                                   **({'degraded': degraded} if degraded else {}))
+        
+        style_prompt = _select_style_prompt(prompt, style)
         
         # Build ultra-enhanced prompt
         enhanced_prompt = UltraPromptBuilder(prompt, style_prompt, model, quality, hdr, resolution).build()
+        deadline = _current_deadline()
+        if deadline:
+            deadline.check('image upstream call')
         
-        # Build API URL
         seed = random.randint(1, 1000000)
-        prompt_encoded = quote(enhanced_prompt)
-        
-        # Robust Resolution Parsing
-        # Extract 1024x1024 or similar pattern from any string
-        match = re.search(r'(\d+)x(\d+)', resolution)
-        if match:
-            width = match.group(1)
-            height = match.group(2)
-        else:
-            # Fallback default
-            width = '1024'
-            height = '1024'
-            print(f"WARNING: Could not parse resolution '{resolution}'. Defaulting to 1024x1024.")
-        
+        width, height = _parse_dimensions(resolution)
         print(f"DEBUG: Parsed Width: {width}, Height: {height}")
-
-        # Build negative prompt to prevent quality issues
-        negative_prompt = "noisy, grainy, blurry, low quality, pixelated, artifacts, jpeg artifacts, compression artifacts, dark spots, poor quality, bad quality, distorted, deformed, ugly, disfigured"
-        negative_encoded = quote(negative_prompt)
-
-        api_url = (
-            f"https://gen.pollinations.ai/image/{prompt_encoded}"
-            f"?seed={seed}&nologo=true&width={width}&height={height}"
-            f"&enhance=true"  # Always enable quality enhancement
-            f"&negative={negative_encoded}"  # Add negative prompt to prevent artifacts
-        )
-        if hdr:
-            api_url += "&hdr=true"
-        if model:
-            api_url += f"&model={model}"
-            
-        print(f"DEBUG: Generated API URL: {api_url}")
         print(f"DEBUG: Enhanced Prompt: {enhanced_prompt}")
-        print(f"DEBUG: Negative Prompt: {negative_prompt}")
         
-        # Generate image with enhanced quality parameters
-        api_key = os.environ.get('POLLINATIONS_API_KEY')
-        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
-        response = requests.get(api_url, headers=headers, timeout=120)  # Increased timeout for high-res
-        if response.status_code == 200 and 'image' in response.headers.get('Content-Type', ''):
-            ext = '.jpg'
-            if 'png' in response.headers.get('Content-Type', ''):
-                ext = '.png'
-            filename = f"{uuid.uuid4().hex}{ext}"
-            filepath = os.path.join(GENERATED_IMAGES_FOLDER, filename)
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            local_url = f"/generated_images/{filename}"
+        response_fields = {
+            'success': True,
+            'prompt': enhanced_prompt,
+            'model': model,
+            'resolution': resolution,
+            'quality': quality,
+            'hdr': hdr
+        }
+        if auto_model:
+            response_fields['auto_model'] = True
+        if similar:
+            response_fields['similar'] = similar
+        if degraded:
+            response_fields['degraded'] = degraded
+        
+        history_fields = {'prompt': prompt, 'style': style, 'resolution': resolution}
+        
+        if progressive:
+            # Queue the full render first so it runs while the draft is fetched
+            # Nobody is blocked on it, so the final render queues as background work
+            job = job_store.create('final_render', model=model, resolution=resolution)
+            final_priority = _request_priority('background')
+            client = _client_id()
+            # The job's spans join this request's trace (and may outlive its root span)
+            job_store.submit(job, tracer.bind(lambda job_id: _render_image(
+                enhanced_prompt, model, width, height, hdr, seed,
+                timeout=120, derivative_wait=DERIVATIVE_WAIT * 5, job_id=job_id,
+                record=history_fields, priority=final_priority, client=client, reference=reference)))
+            
+            draft_width, draft_height = _draft_dimensions(width, height)
+            draft_prompt = UltraPromptBuilder(prompt, style_prompt, DRAFT_MODEL, False, False,
+                                              f"{draft_width}x{draft_height}").build()
+            try:
+                draft = _render_image(draft_prompt, DRAFT_MODEL, draft_width, draft_height,
+                                      False, seed, timeout=30, deadline=deadline, reference=reference)
+                draft['resolution'] = f"{draft_width}x{draft_height}"
+            except DeadlineExceeded:
+                job_store.cancel(job['id'])
+                raise
+            except Exception as e:
+                # The final render is still on its way; report the missing draft
+                print(f"WARNING: Draft render failed: {str(e)}")
+                draft = None
             return jsonify({
-                'success': True,
-                'image_url': local_url,
-                'prompt': enhanced_prompt,
-                'model': model,
-                'resolution': resolution,
-                'quality': quality,
-                'hdr': hdr
+                **response_fields,
+                'progressive': True,
+                'draft': draft,
+                'job_id': job['id'],
+                'status_url': f"/generate/jobs/{job['id']}"
             })
-        else:
-            try:
-                error_msg = response.json().get('error', 'Failed to generate image')
-            except Exception:
-                error_msg = f'Failed to generate image. Status: {response.status_code}'
-            return jsonify({'error': error_msg}), 500
         
+        # Generate image with enhanced quality parameters
+        image_fields = _render_image(enhanced_prompt, model, width, height, hdr, seed,
+                                     timeout=120,  # Increased timeout for high-res
+                                     derivative_wait=DERIVATIVE_WAIT,
+                                     record=history_fields, deadline=deadline, reference=reference)
+        return jsonify({**response_fields, **image_fields})
+        
+    except DeadlineExceeded as e:
+        print(f"WARNING: Image generation abandoned: {str(e)}")
+        return jsonify({'error': f'Request timed out: {str(e)}'}), 504
+    except SchedulerBusy as e:
+        return _busy_response(e)
+    except UpstreamError as e:
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         app.logger.error(f"Generation error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/generate/jobs/<job_id>', methods=['GET'])
+def get_generation_job(job_id):
+    """Report a progressive render job; ?wait=N long-polls up to N seconds for completion"""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0.0), 25.0)
+    except ValueError:
+        wait = 0.0
+    job = job_store.wait(job_id, wait) if wait else job_store.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/generate/jobs/<job_id>', methods=['DELETE'])
+def cancel_generation_job(job_id):
+    """Cancel a progressive render job the user no longer needs"""
+    job = job_store.cancel(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
 def _build_system_prompt(data):
     """Helper to build robust system prompt from settings"""
     persona = data.get('persona', 'helpful')
@@ -607,10 +1396,107 @@ def _build_system_prompt(data):
         
     return system_instruction
 
+# Serialized + compressed catalog API responses, keyed by catalog version
+catalog_responses = CatalogResponseCache()
+
+# Text response cache: identical prompt + model + system prompt + temperature
+text_cache = TieredCache(TTLCache(
+    max_entries=int(os.environ.get('TEXT_CACHE_SIZE', '512')),
+    ttl=float(os.environ.get('TEXT_CACHE_TTL', '3600'))
+), backend.kv)
+# Bounds for the prior-turn window sent in multi-turn mode
+TEXT_CONTEXT_TURNS = int(os.environ.get('TEXT_CONTEXT_TURNS', '6'))
+TEXT_CONTEXT_CHARS = int(os.environ.get('TEXT_CONTEXT_CHARS', '2000'))
+
+def _sse(payload: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Format one Server-Sent Events message"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def _iter_upstream_text(response):
+    """Yield text deltas from a streaming Pollinations text response.
+
+    The upstream answers either with its own SSE stream of OpenAI-style
+    chunks or with plain chunked text, depending on model and endpoint.
+    """
+    if 'event-stream' in response.headers.get('Content-Type', ''):
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            payload = line[5:].strip()
+            if payload == '[DONE]':
+                break
+            try:
+                chunk = json.loads(payload)
+            except ValueError:
+                yield payload
+                continue
+            choices = chunk.get('choices') or [{}]
+            delta = choices[0].get('delta', {}).get('content')
+            if delta:
+                yield delta
+    else:
+        for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+            if chunk:
+                yield chunk
+
+def _stream_text_response(response, model: str, on_complete=None, ticket=None,
+                          deadline: Optional[Deadline] = None, lease=None) -> Response:
+    """Forward upstream tokens to the browser as Server-Sent Events; the upstream slot and key are held until the stream ends"""
+    def generate():
+        parts = []
+        try:
+            for delta in _iter_upstream_text(response):
+                if deadline:
+                    deadline.check('text stream')
+                parts.append(delta)
+                yield _sse({'delta': delta})
+            if on_complete:
+                on_complete(''.join(parts).strip())
+            yield _sse({'model': model}, event='done')
+        except DeadlineExceeded as e:
+            print(f"WARNING: Text stream stopped: {str(e)}")
+            yield _sse({'error': f'Request timed out: {str(e)}'}, event='error')
+        except Exception as e:
+            print(f"ERROR: Text stream interrupted: {str(e)}")
+            yield _sse({'error': f'Stream interrupted: {str(e)}'}, event='error')
+        finally:
+            response.close()
+            if ticket:
+                upstream_scheduler.release(ticket)
+            if lease:
+                credential_pool.release(lease)
+
+    streamed = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
+    })
+    if ticket:
+        # Also covers clients that disconnect before the first chunk
+        streamed.call_on_close(lambda: upstream_scheduler.release(ticket))
+    if lease:
+        streamed.call_on_close(lambda: credential_pool.release(lease))
+    return streamed
+
+def _cached_text_response(content: str, model: str, stream: bool):
+    """Serve a cached completion in the same shape as a live one"""
+    if stream:
+        def generate():
+            yield _sse({'delta': content})
+            yield _sse({'model': model, 'cached': True}, event='done')
+        return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    return jsonify({
+        'success': True,
+        'content': content,
+        'model': model,
+        'cached': True
+    })
+
 @app.route('/generate_text', methods=['POST'])
 def generate_text():
     """Generate text endpoint"""
     print(f"DEBUG: generate_text endpoint hit!")
+    import requests
     try:
         data = request.get_json()
         print(f"DEBUG: Received data: {data}")
@@ -629,29 +1515,74 @@ def generate_text():
             'openai': 'openai'
         }
         api_model = model_api_map.get(model, model)
-        temperature = data.get('temperature', 0.7)
+        try:
+            temperature = min(max(float(data.get('temperature', 0.7)), 0.0), 2.0)
+        except (TypeError, ValueError):
+            temperature = 0.7
+        stream = bool(data.get('stream', False))
 
         if not prompt:
             return jsonify({'error': 'Prompt is required'}), 400
 
+        # Persona, length and format from the UI become the system prompt
+        system_prompt = _build_system_prompt(data)
+
+        # Multi-turn mode sends a bounded window of prior turns, not the whole chat
+        context_window = compact_history(data.get('history') or [], max_turns=TEXT_CONTEXT_TURNS,
+                                         max_chars=TEXT_CONTEXT_CHARS)
+        upstream_prompt = render_context(context_window, prompt)
+
+        use_cache = data.get('cache', True) is not False
+        cache_key = make_cache_key(prompt, api_model, system_prompt, temperature,
+                                   context=json.dumps(context_window))
+        if use_cache:
+            cached = text_cache.get(cache_key)
+            if cached is not None:
+                print(f"DEBUG: Text cache hit for model {api_model}")
+                return _cached_text_response(cached, model, stream)
+
+        def store(content: str):
+            if use_cache and content:
+                text_cache.set(cache_key, content)
+
         # Pollinations Text API (GET) - Simple like image API
-        # Just encode the raw prompt
-        encoded_prompt = quote(prompt)
+        encoded_prompt = quote(upstream_prompt)
         
-        api_url = f"https://gen.pollinations.ai/text/{encoded_prompt}?model={api_model}"
+        api_url = (
+            f"{POLLINATIONS_BASE_URL}/text/{encoded_prompt}?model={api_model}"
+            f"&system={quote(system_prompt)}&temperature={temperature}"
+        )
+        if stream:
+            api_url += "&stream=true"
         
-        print(f"DEBUG: Text generation request - model: {model} (API: {api_model})")
+        print(f"DEBUG: Text generation request - model: {model} (API: {api_model}), stream: {stream}")
         print(f"DEBUG: API URL: {api_url[:150]}...")
         
-        # Add API key authentication (same as image generation)
-        api_key = os.environ.get('POLLINATIONS_API_KEY')
-        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
-        
-        response = requests.get(api_url, headers=headers, timeout=60)
+        # Streaming uses a connect/read timeout pair: the read timeout bounds
+        # the gap between tokens rather than the whole completion
+        deadline = _current_deadline()
+        if stream:
+            timeout = (deadline.timeout(10), deadline.timeout(60)) if deadline else (10, 60)
+        else:
+            timeout = deadline.timeout(60) if deadline else 60
+        ticket = _acquire_upstream('text')
+        try:
+            # Pooled API key, same as image generation
+            response, lease = _upstream_get(api_url, timeout, stream=stream, deadline=deadline)
+        except Exception:
+            _release_upstream(ticket)
+            raise
         print(f"DEBUG: Text generation response status: {response.status_code}")
 
+        if response.status_code == 200 and stream:
+            g.upstream_timings = [(ticket.queue_ms, ticket.upstream_ms)]
+            return _stream_text_response(response, model, on_complete=store, ticket=ticket, deadline=deadline,
+                                         lease=lease)
+        credential_pool.release(lease)
+        _release_upstream(ticket)
         if response.status_code == 200:
             content = response.text.strip()
+            store(content)
             return jsonify({
                 'success': True,
                 'content': content,
@@ -662,6 +1593,11 @@ def generate_text():
             print(f"ERROR: Pollinations API error - Status: {response.status_code}, Response: {error_text}")
             return jsonify({'error': f'API error: {response.status_code} - {error_text}'}), 500
 
+    except DeadlineExceeded as e:
+        print(f"WARNING: Text generation abandoned: {str(e)}")
+        return jsonify({'error': f'Request timed out: {str(e)}'}), 504
+    except SchedulerBusy as e:
+        return _busy_response(e)
     except requests.exceptions.Timeout:
         print("ERROR: Text generation request timed out")
         return jsonify({'error': 'Request timed out. Please try again.'}), 504
@@ -677,6 +1613,7 @@ def generate_text():
 @app.route('/generate_audio', methods=['POST'])
 def generate_audio():
     """Generate audio endpoint"""
+    import subprocess
     try:
         data = request.get_json()
         prompt = data.get('prompt', '').strip()
@@ -729,87 +1666,103 @@ def generate_audio():
             success = False
             used_provider = None
             
-            # STRATEGY 1: Try edge-tts with fallback voices
-            print(f"DEBUG: Attempting edge-tts audio generation...")
-            for attempt_voice in fallback_voices:
-                try:
-                    # Basic command without advanced parameters
-                    cmd_safe = [
-                        sys.executable, "-m", "edge_tts",
-                        "--voice", attempt_voice,
-                        "--text", prompt,
-                        "--write-media", filepath
-                    ]
-                    
-                    print(f"DEBUG: Trying edge-tts with voice: {attempt_voice}")
-                    
-                    # Run with timeout to prevent hanging
-                    result = subprocess.run(
-                        cmd_safe, 
-                        check=True, 
-                        capture_output=True, 
-                        text=True,
-                        timeout=15  # Reduced timeout for faster fallback
-                    )
-                    
-                    # Verify the file was created and has content
-                    if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-                        success = True
-                        used_provider = "edge-tts"
-                        print(f"DEBUG: edge-tts succeeded with voice {attempt_voice} ({os.path.getsize(filepath)} bytes)")
-                        break
-                    else:
-                        if os.path.exists(filepath):
-                            os.remove(filepath)
+            ticket = _acquire_upstream('audio')
+            try:
+                # STRATEGY 1: Try edge-tts with fallback voices
+                print(f"DEBUG: Attempting edge-tts audio generation...")
+                deadline = _current_deadline()
+                for attempt_voice in fallback_voices:
+                    # Leave enough of the budget for the gTTS fallback
+                    attempt_timeout = 15
+                    if deadline:
+                        deadline.check('edge-tts')
+                        attempt_timeout = min(15, deadline.remaining() - AUDIO_FALLBACK_RESERVE)
+                        if attempt_timeout < 1:
+                            print(f"WARNING: Skipping remaining edge-tts voices to stay within the request budget")
+                            break
+                    try:
+                        # Basic command without advanced parameters
+                        cmd_safe = [
+                            sys.executable, "-m", "edge_tts",
+                            "--voice", attempt_voice,
+                            "--text", prompt,
+                            "--write-media", filepath
+                        ]
+                        
+                        print(f"DEBUG: Trying edge-tts with voice: {attempt_voice}")
+                        
+                        # Run with timeout to prevent hanging
+                        with tracer.span('tts.edge', kind='client', voice=attempt_voice):
+                            result = subprocess.run(
+                                cmd_safe, 
+                                check=True, 
+                                capture_output=True, 
+                                text=True,
+                                timeout=attempt_timeout  # Reduced timeout for faster fallback
+                            )
+                        
+                        # Verify the file was created and has content
+                        if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+                            success = True
+                            used_provider = "edge-tts"
+                            print(f"DEBUG: edge-tts succeeded with voice {attempt_voice} ({os.path.getsize(filepath)} bytes)")
+                            break
+                        else:
+                            if os.path.exists(filepath):
+                                os.remove(filepath)
+                            continue
+                            
+                    except subprocess.TimeoutExpired:
+                        last_error = f"edge-tts timeout with voice {attempt_voice}"
+                        print(f"WARNING: {last_error}")
                         continue
                         
-                except subprocess.TimeoutExpired:
-                    last_error = f"edge-tts timeout with voice {attempt_voice}"
-                    print(f"WARNING: {last_error}")
-                    continue
-                    
-                except subprocess.CalledProcessError as e:
-                    error_msg = e.stderr if e.stderr else str(e)
-                    last_error = f"edge-tts failed with {attempt_voice}"
-                    print(f"WARNING: {last_error}")
-                    continue
-            
-            # STRATEGY 2: Fallback to gTTS if edge-tts failed
-            if not success:
-                print(f"DEBUG: edge-tts failed, falling back to gTTS...")
-                try:
-                    from gtts import gTTS
-                    
-                    # Map voice preferences to gTTS accents
-                    # gTTS doesn't have individual voices, but we can vary accent
-                    accent_map = {
-                        'alloy': 'com',      # US English
-                        'echo': 'com',       # US English
-                        'fable': 'co.uk',    # British English
-                        'onyx': 'com',       # US English
-                        'nova': 'com',       # US English
-                        'shimmer': 'co.in'   # Indian English
-                    }
-                    
-                    tld = accent_map.get(voice, 'com')
-                    
-                    # Generate audio with gTTS
-                    tts = gTTS(text=prompt, lang='en', tld=tld, slow=False)
-                    tts.save(filepath)
-                    
-                    # Verify the file
-                    if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-                        success = True
-                        used_provider = "gTTS"
-                        print(f"DEBUG: gTTS succeeded ({os.path.getsize(filepath)} bytes)")
-                    else:
-                        last_error = "gTTS failed to create valid audio file"
+                    except subprocess.CalledProcessError as e:
+                        error_msg = e.stderr if e.stderr else str(e)
+                        last_error = f"edge-tts failed with {attempt_voice}"
+                        print(f"WARNING: {last_error}")
+                        continue
+                
+                # STRATEGY 2: Fallback to gTTS if edge-tts failed
+                if not success:
+                    print(f"DEBUG: edge-tts failed, falling back to gTTS...")
+                    gtts_timeout = deadline.timeout(20, 'gTTS') if deadline else None
+                    try:
+                        from gtts import gTTS
+                        
+                        # Map voice preferences to gTTS accents
+                        # gTTS doesn't have individual voices, but we can vary accent
+                        accent_map = {
+                            'alloy': 'com',      # US English
+                            'echo': 'com',       # US English
+                            'fable': 'co.uk',    # British English
+                            'onyx': 'com',       # US English
+                            'nova': 'com',       # US English
+                            'shimmer': 'co.in'   # Indian English
+                        }
                         
-                except Exception as e:
-                    last_error = f"gTTS error: {str(e)}"
-                    print(f"ERROR: {last_error}")
-                    import traceback
-                    traceback.print_exc()
+                        tld = accent_map.get(voice, 'com')
+                        
+                        # Generate audio with gTTS
+                        with tracer.span('tts.gtts', kind='client', tld=tld):
+                            tts = gTTS(text=prompt, lang='en', tld=tld, slow=False, timeout=gtts_timeout)
+                            tts.save(filepath)
+                        
+                        # Verify the file
+                        if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+                            success = True
+                            used_provider = "gTTS"
+                            print(f"DEBUG: gTTS succeeded ({os.path.getsize(filepath)} bytes)")
+                        else:
+                            last_error = "gTTS failed to create valid audio file"
+                            
+                    except Exception as e:
+                        last_error = f"gTTS error: {str(e)}"
+                        print(f"ERROR: {last_error}")
+                        import traceback
+                        traceback.print_exc()
+            finally:
+                _release_upstream(ticket)
             
             # Check if any provider succeeded
             if not success:
@@ -818,6 +1771,8 @@ def generate_audio():
                     'error': 'Audio generation failed. Both Microsoft Edge TTS and Google TTS are currently unavailable. Please check your internet connection and try again.'
                 }), 503
             
+            with tracer.span('storage.put_audio', bytes=os.path.getsize(filepath)):
+                backend.assets.put_file(filename, filepath, 'audio/mpeg')
             local_url = f"/generated_images/{filename}"
             print(f"DEBUG: Audio generated successfully at {local_url} using {used_provider}")
             
@@ -829,6 +1784,13 @@ def generate_audio():
                 'provider': used_provider  # Include which TTS provider was used
             })
             
+        except DeadlineExceeded as e:
+            print(f"WARNING: Audio generation abandoned: {str(e)}")
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            return jsonify({'error': f'Request timed out: {str(e)}'}), 504
+        except SchedulerBusy as e:
+            return _busy_response(e)
         except Exception as e:
             app.logger.error(f"Audio generation error: {str(e)}")
             import traceback
@@ -853,7 +1815,7 @@ def suggest_prompt():
         prompt_lower = prompt.lower()
         
         # Get intelligent recommendations
-        recommendations = data_manager.get_recommendations(prompt, model, style)
+        recommendations = data_manager.get_recommendations(prompt, model, style, models=VALID_IMAGE_MODELS)
         
         # Basic prompt enhancement suggestions
         if len(prompt) < 20:
@@ -993,30 +1955,33 @@ def suggest_prompt():
             else:
                 return '1536x1536'
         
-        def estimate_generation_time(model: str, quality: bool, hdr: bool) -> str:
-            """Estimate generation time"""
-            base_time = 15
+        def estimate_generation_time(model: str, resolution: str) -> Dict[str, Any]:
+            """Estimate generation time from measured upstream latency, or the catalog's stated range"""
+            width, height = _parse_dimensions(resolution)
+            if model == 'auto':
+                model = model_performance.fastest(VALID_IMAGE_MODELS, width, height) or VALID_IMAGE_MODELS[0]
+            measured = model_performance.estimate(model, width, height)
+            if measured:
+                typical, slow = measured
+                return {'text': f"{round(typical)}-{max(round(slow), round(typical) + 1)} seconds",
+                        'seconds': round(typical, 1), 'source': 'measured'}
             
+            low, high = 15, 30
             model_details = data_manager.get_model_details(model)
             if model_details and 'technical_specs' in model_details:
-                inference_time = model_details['technical_specs'].get('inference_time', '15-30 seconds')
-                if 'slow' in inference_time.lower() or '45' in inference_time:
-                    base_time = 45
-                elif '30' in inference_time:
-                    base_time = 30
-            
-            if quality:
-                base_time += 15
-            if hdr:
-                base_time += 10
-            
-            return f"{base_time}-{base_time + 15} seconds"
+                bounds = [int(n) for n in re.findall(r'\d+', model_details['technical_specs'].get('inference_time', ''))]
+                if bounds:
+                    low, high = min(bounds), max(bounds)
+            return {'text': f"{low}-{high} seconds", 'seconds': (low + high) / 2, 'source': 'catalog'}
         
         # Add ultra-quality optimization summary
+        generation_time = estimate_generation_time(model, data.get('resolution') or '1024x1024')
         optimization_summary = {
             'quality_score': calculate_quality_score(prompt, model, style, data.get('quality', False), hdr),
             'recommended_resolution': get_optimal_resolution(prompt, model, style),
-            'estimated_generation_time': estimate_generation_time(model, data.get('quality', False), hdr),
+            'estimated_generation_time': generation_time['text'],
+            'estimated_generation_seconds': generation_time['seconds'],
+            'estimate_source': generation_time['source'],
             'optimization_level': 'Ultra-High' if data.get('quality') and hdr else 'Standard'
         }
         
@@ -1034,12 +1999,21 @@ def suggest_prompt():
 @app.route('/health')
 def health_check():
     """Health check endpoint with detailed statistics"""
+    style_categories = data_manager.load_styles()
+    model_categories = data_manager.load_models()
     return jsonify({
         'status': 'healthy',
-        'models_available': len(MODELS),
-        'model_categories': len(MODEL_CATEGORIES),
-        'styles_available': sum(len(cat.get('styles', [])) for cat in STYLE_CATEGORIES),
-        'style_categories': len(STYLE_CATEGORIES),
+        'models_available': len(data_manager.get_models_dict()),
+        'model_categories': len(model_categories),
+        'styles_available': sum(len(cat.get('styles', [])) for cat in style_categories),
+        'style_categories': len(style_categories),
+        'catalog_version': data_manager.version,
+        'text_cache': text_cache.stats(),
+        'state_backend': backend.name,
+        'json_provider': json_provider_name,
+        'catalog_responses': catalog_responses.stats(),
+        'tracing': tracer.stats(),
+        'near_duplicates': near_duplicates.stats(),
         'advanced_features': {
             'model_filtering': True,
             'style_filtering': True,
@@ -1049,6 +2023,17 @@ def health_check():
         }
     })
 
+@app.route('/api/catalog', methods=['GET'])
+def get_catalog():
+    """Models and styles for the UI; versioned by ETag and cached stale-while-revalidate by the service worker"""
+    return catalog_responses.response(data_manager.current_version(), ('catalog',), lambda: {
+        'success': True,
+        'version': data_manager.version,
+        'models': data_manager.get_models_dict(),
+        'model_categories': data_manager.load_models(),
+        'style_categories': data_manager.load_styles()
+    })
+
 @app.route('/api/models/filter', methods=['POST'])
 def filter_models():
     """Filter models based on criteria"""
@@ -1059,18 +2044,21 @@ def filter_models():
         min_quality = data.get('min_quality')
         min_speed = data.get('min_speed')
         
-        filtered_models = data_manager.filter_models_by_criteria(
-            category=category,
-            difficulty=difficulty,
-            min_quality=min_quality,
-            min_speed=min_speed
-        )
+        def build():
+            filtered_models = data_manager.filter_models_by_criteria(
+                category=category,
+                difficulty=difficulty,
+                min_quality=min_quality,
+                min_speed=min_speed
+            )
+            return {
+                'success': True,
+                'models': filtered_models,
+                'count': len(filtered_models)
+            }
         
-        return jsonify({
-            'success': True,
-            'models': filtered_models,
-            'count': len(filtered_models)
-        })
+        key = ('models_filter', json.dumps([category, difficulty, min_quality, min_speed]))
+        return catalog_responses.response(data_manager.current_version(), key, build)
         
     except Exception as e:
         app.logger.error(f"Model filtering error: {str(e)}")
@@ -1086,18 +2074,21 @@ def filter_styles():
         complexity_level = data.get('complexity_level')
         min_popularity = data.get('min_popularity')
         
-        filtered_styles = data_manager.filter_styles_by_criteria(
-            category=category,
-            difficulty=difficulty,
-            complexity_level=complexity_level,
-            min_popularity=min_popularity
-        )
+        def build():
+            filtered_styles = data_manager.filter_styles_by_criteria(
+                category=category,
+                difficulty=difficulty,
+                complexity_level=complexity_level,
+                min_popularity=min_popularity
+            )
+            return {
+                'success': True,
+                'styles': filtered_styles,
+                'count': len(filtered_styles)
+            }
         
-        return jsonify({
-            'success': True,
-            'styles': filtered_styles,
-            'count': len(filtered_styles)
-        })
+        key = ('styles_filter', json.dumps([category, difficulty, complexity_level, min_popularity]))
+        return catalog_responses.response(data_manager.current_version(), key, build)
         
     except Exception as e:
         app.logger.error(f"Style filtering error: {str(e)}")
@@ -1111,12 +2102,10 @@ def get_model_compatibility(model_name):
         if not model_details:
             return jsonify({'error': 'Model not found'}), 404
             
-        compatible_styles = data_manager.get_compatible_styles_for_model(model_name)
-        
-        return jsonify({
+        return catalog_responses.response(data_manager.current_version(), ('compatibility', model_name), lambda: {
             'success': True,
             'model': model_details,
-            'compatible_styles': compatible_styles
+            'compatible_styles': data_manager.get_compatible_styles_for_model(model_name)
         })
         
     except Exception as e:
@@ -1135,7 +2124,8 @@ def get_recommendations():
         if not prompt:
             return jsonify({'error': 'Prompt is required'}), 400
             
-        recommendations = data_manager.get_recommendations(prompt, current_model, current_style)
+        recommendations = data_manager.get_recommendations(prompt, current_model, current_style,
+                                                          models=VALID_IMAGE_MODELS)
         
         return jsonify({
             'success': True,
@@ -1146,6 +2136,244 @@ def get_recommendations():
         app.logger.error(f"Recommendations error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """List captured profiles (requires the profiling admin token)"""
+    if not profiling_authorized():
+        return jsonify({'error': 'Endpoint not found'}), 404
+    return jsonify({'success': True, 'profiles': profiler.list_profiles(), 'slow_request_ms': profiler.slow_ms})
+
+@app.route('/api/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    """Download one folded-stack profile (requires the profiling admin token)"""
+    if not profiling_authorized() or not name.endswith('.folded'):
+        return jsonify({'error': 'Endpoint not found'}), 404
+    return send_from_directory(PROFILES_FOLDER, secure_filename(name), mimetype='text/plain')
+
+# Requests that only serve files are not worth a trace
+UNTRACED_ENDPOINTS = {None, 'static', 'serve_generated_image', 'service_worker'}
+
+@app.before_request
+def start_request_trace():
+    """Join the caller's trace (traceparent or X-Trace-Id) or start a new one"""
+    if request.endpoint in UNTRACED_ENDPOINTS:
+        return
+    route = request.url_rule.rule
+    g.trace_span = tracer.start_trace(f"{request.method} {route}", request.headers.get('traceparent'),
+                                      request.headers.get(TRACE_HEADER), method=request.method, route=route)
+
+@app.after_request
+def add_trace_id(response):
+    """Return the trace id so a slow or failed request can be looked up"""
+    span = g.get('trace_span')
+    if span is not None:
+        response.headers[TRACE_HEADER] = span.trace_id
+        span.set(status=response.status_code)
+        if response.status_code >= 500:
+            span.fail(f"HTTP {response.status_code}")
+    return response
+
+@app.teardown_request
+def end_request_trace(exc):
+    """Close the root span once the response (including a streamed body) is done"""
+    span = g.pop('trace_span', None)
+    if span is not None:
+        tracer.end_trace(span, error=f"{type(exc).__name__}: {exc}" if exc else None)
+
+@app.before_request
+def start_deadline():
+    """Give generation requests a time budget (X-Request-Timeout or the endpoint default)"""
+    default = DEADLINE_DEFAULTS.get(request.endpoint)
+    if default is not None:
+        g.deadline = Deadline(parse_budget(request.headers.get(DEADLINE_HEADER), default),
+                              disconnect_probe(request.environ))
+
+@app.route('/api/scheduler', methods=['GET'])
+def scheduler_stats():
+    """Upstream scheduler state: in-flight and queued calls, queue-wait vs upstream latency per class"""
+    return jsonify({'success': True, 'scheduler': upstream_scheduler.stats(), 'governor': load_governor.stats(),
+                    'credentials': credential_pool.stats()})
+
+@app.after_request
+def cache_versioned_static(response):
+    """Static assets requested with the current ?v= never change under that URL"""
+    if request.endpoint == 'static' and response.status_code == 200 and request.args.get('v') == STATIC_VERSION:
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+@app.after_request
+def add_server_timing(response):
+    """Report time spent queued for upstream slots separately from time spent upstream"""
+    timings = g.get('upstream_timings')
+    if timings:
+        queue_ms = sum(queue for queue, _ in timings)
+        upstream_ms = sum(upstream for _, upstream in timings)
+        response.headers.add('Server-Timing', f'queue;dur={queue_ms:.1f}, upstream;dur={upstream_ms:.1f}')
+    return response
+
+def _history_item(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a history row (URLs instead of server paths)"""
+    item = {key: value for key, value in row.items() if key not in ('path', 'preview', 'display')}
+    item['image_url'] = f"/generated_images/{row['filename']}"
+    item['preview_url'] = f"/generated_images/{row['preview']}" if row.get('preview') else None
+    item['display_url'] = f"/generated_images/{row['display']}" if row.get('display') else None
+    return item
+
+@app.route('/api/models/performance', methods=['GET'])
+def model_performance_stats():
+    """Measured latency percentiles and error rate per image model and resolution bucket"""
+    return jsonify({'success': True, 'models': model_performance.stats(VALID_IMAGE_MODELS)})
+
+@app.route('/api/history', methods=['GET'])
+def list_history():
+    """Page through generated images, newest first; filter by ?model= or search with ?q="""
+    try:
+        before = request.args.get('before', type=int)
+        limit = request.args.get('limit', 24, type=int)
+        model = request.args.get('model') or None
+        query = (request.args.get('q') or '').strip() or None
+        page = history_store.list(limit=limit, before=before, model=model, query=query)
+        return jsonify({
+            'success': True,
+            'items': [_history_item(row) for row in page['items']],
+            'next_before': page['next_before']
+        })
+    except Exception as e:
+        app.logger.error(f"History error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/models', methods=['GET'])
+def history_model_counts():
+    """Number of stored generations per model"""
+    return jsonify({'success': True, 'models': history_store.model_counts()})
+
+@app.route('/api/history/<int:generation_id>', methods=['GET'])
+def get_history_item(generation_id):
+    """Metadata for one generation"""
+    row = history_store.get(generation_id)
+    if not row:
+        return jsonify({'error': 'Generation not found'}), 404
+    return jsonify({'success': True, 'item': _history_item(row)})
+
+@app.route('/api/history/<int:generation_id>', methods=['DELETE'])
+def delete_history_item(generation_id):
+    """Remove a generation from the history index (the image file is kept)"""
+    if not history_store.delete(generation_id):
+        return jsonify({'error': 'Generation not found'}), 404
+    near_duplicates.discard(generation_id)
+    return jsonify({'success': True})
+
+def _export_archive_name(index: int, filename: str) -> str:
+    """Archive name for an asset: its position plus the prompt it was generated from, if known"""
+    stem, ext = os.path.splitext(filename)
+    row = history_store.find_by_filename(filename)
+    if row and row.get('prompt'):
+        slug = re.sub(r'[^a-z0-9]+', '-', row['prompt'].lower()).strip('-')[:48]
+        if slug:
+            return f"{index:04d}-{slug}{ext}"
+    return f"{index:04d}-{stem}{ext}"
+
+def _ensure_local_asset(filename: str) -> Optional[str]:
+    """Path of the asset on this instance, copying it from the shared store if needed"""
+    path = backend.assets.local_path(filename)
+    if path:
+        return path
+    asset = backend.assets.get(filename)
+    if asset is None:
+        return None
+    path = os.path.join(GENERATED_IMAGES_FOLDER, filename)
+    with open(path, 'wb') as f:
+        f.write(asset[0])
+    return path
+
+def _file_stat(filename: str) -> tuple:
+    stat = os.stat(backend.assets.local_path(filename))
+    return stat.st_size, stat.st_mtime
+
+@app.route('/api/export', methods=['POST'])
+def create_export():
+    """Register a ZIP export of generated assets; returns the download URL"""
+    try:
+        data = request.get_json() or {}
+        requested = [os.path.basename(urlparse(str(item)).path) for item in data.get('files') or []]
+        for generation_id in data.get('history_ids') or []:
+            row = history_store.get(int(generation_id))
+            if row:
+                requested.append(row['filename'])
+        if not requested:
+            return jsonify({'error': 'No files to export'}), 400
+        if len(requested) > EXPORT_MAX_FILES:
+            return jsonify({'error': f'At most {EXPORT_MAX_FILES} files per export'}), 400
+
+        files, missing, seen = [], [], set()
+        for filename in requested:
+            if filename in seen:
+                continue
+            seen.add(filename)
+            if filename != secure_filename(filename) or not _ensure_local_asset(filename):
+                missing.append(filename)
+                continue
+            files.append(filename)
+        if not files:
+            return jsonify({'error': 'None of the requested files exist', 'missing': missing}), 404
+
+        names = unique_names([_export_archive_name(index, filename) for index, filename in enumerate(files, 1)])
+        archive = ZipStream([ZipEntry(name, backend.assets.local_path(filename), *_file_stat(filename))
+                             for name, filename in zip(names, files)])
+        export_id = uuid.uuid4().hex
+        backend.kv.set(f"export:{export_id}", json.dumps({'files': list(zip(names, files))}), ttl=EXPORT_TTL)
+        return jsonify({
+            'success': True,
+            'export_id': export_id,
+            'download_url': f"/api/export/{export_id}.zip",
+            'count': len(files),
+            'size': archive.size,
+            'missing': missing
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Export error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/export/<export_id>.zip', methods=['GET'])
+def download_export(export_id):
+    """Stream an export as a stored ZIP; supports Range requests for resuming"""
+    raw = backend.kv.get(f"export:{export_id}") if EXPORT_ID_PATTERN.match(export_id) else None
+    if raw is None:
+        return jsonify({'error': 'Export not found or expired'}), 404
+    entries = []
+    for name, filename in json.loads(raw)['files']:
+        path = _ensure_local_asset(filename)
+        if path is None:
+            return jsonify({'error': f'{filename} is no longer available'}), 410
+        entries.append(ZipEntry(name, path, *_file_stat(filename)))
+    archive = ZipStream(entries)
+
+    # The manifest never changes, so id and size identify the bytes
+    etag = f"{export_id}-{archive.size}"
+    span = None
+    if_range = request.if_range
+    # A stale If-Range (or a date we cannot compare) gets the whole archive
+    if (not if_range.etag and not if_range.date) or if_range.etag == etag:
+        try:
+            span = parse_range(request.headers.get('Range'), archive.size)
+        except ValueError:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f"bytes */{archive.size}"
+            return response
+    start, end = span or (0, archive.size)
+
+    response = Response(stream_with_context(archive.iter_range(start, end)),
+                        status=206 if span else 200, mimetype='application/zip', direct_passthrough=True)
+    response.headers['Content-Length'] = str(end - start)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Disposition'] = f'attachment; filename="dreamlit-export-{export_id[:8]}.zip"'
+    response.set_etag(etag)
+    if span:
+        response.headers['Content-Range'] = f"bytes {start}-{end - 1}/{archive.size}"
+    return response
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
@@ -1164,6 +2392,35 @@ def request_too_large(error):
 # Configure app settings
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max request size
 app.config['JSON_SORT_KEYS'] = False
+json_provider_name = install_json_provider(app)
+init_compression(app)
+init_profiling(app, profiler)
+
+def create_app(preload: bool = False) -> Flask:
+    """App factory for gunicorn (main:create_app()).
+
+    Parses the catalog, builds its lookup and search indexes and indexes recent
+    generations for near-duplicate lookups up front. With preload,
+    this runs once in the gunicorn master and forked workers share the parsed
+    catalog pages copy-on-write instead of each parsing their own copy.
+    """
+    data_manager.refresh_if_changed(force=True)
+    data_manager.load_styles()
+    data_manager.load_models()
+    data_manager.prepare_search()
+    try:
+        seeded = near_duplicates.sync(_near_duplicate_rows)
+    except Exception as e:
+        seeded = 0
+        print(f"WARNING: Could not seed near-duplicate index from history: {str(e)}")
+    if preload:
+        import gc
+        # Move everything allocated so far out of the collector's reach so
+        # GC passes in workers don't write to (and un-share) catalog pages
+        gc.collect()
+        gc.freeze()
+    print(f"Catalog version {data_manager.version} loaded (preload={preload}), {seeded} recent generations indexed")
+    return app
 
 if __name__ == "__main__":
     # Ensure all directories exist before starting
@@ -1175,20 +2432,20 @@ if __name__ == "__main__":
     styles_file = os.path.join(DATA_DIR, 'styles.json')
     if not os.path.exists(styles_file):
         with open(styles_file, 'w', encoding='utf-8') as f:
-            json.dump(STYLE_CATEGORIES, f, indent=2, ensure_ascii=False)
+            json.dump(data_manager.load_styles(), f, indent=2, ensure_ascii=False)
         print(f"Created default {styles_file}")
     
     models_file = os.path.join(DATA_DIR, 'models.json')
     if not os.path.exists(models_file):
         with open(models_file, 'w', encoding='utf-8') as f:
-            json.dump(MODEL_CATEGORIES, f, indent=2, ensure_ascii=False)
+            json.dump(data_manager.load_models(), f, indent=2, ensure_ascii=False)
         print(f"Created default {models_file}")
     
     print("Starting DreamlitAI server...")
     print(f"Generated images will be stored in: {GENERATED_IMAGES_FOLDER}")
     print(f"Static files served from: {STATIC_FOLDER}")
-    print(f"Available models: {len(MODELS)}")
-    print(f"Available model categories: {len(MODEL_CATEGORIES)}")
-    print(f"Available styles: {sum(len(cat.get('styles', [])) for cat in STYLE_CATEGORIES)}")
+    print(f"Available models: {len(data_manager.get_models_dict())}")
+    print(f"Available model categories: {len(data_manager.load_models())}")
+    print(f"Available styles: {sum(len(cat.get('styles', [])) for cat in data_manager.load_styles())}")
     
     app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,237 @@
+"""Measured upstream performance per image model.
+
+Every upstream image call is recorded as a sample (time, latency, success)
+under its model and a resolution bucket. From the recent samples the
+tracker derives an EWMA latency, p50/p90 and an error rate, which drive
+generation-time estimates and the ``auto`` model mode.
+
+Samples are kept in a bounded window and periodically merged into the
+shared key/value backend, so estimates survive restarts and every worker
+contributes to them. Merging is a union of samples by timestamp; a race
+between two workers flushing at once only loses a few samples.
+"""
+import atexit
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+MODEL_STATS_KEY = 'modelperf:v1'
+MODEL_STATS_WINDOW = int(os.environ.get('MODEL_STATS_WINDOW', '128'))
+# Samples older than this no longer describe how a model behaves now
+MODEL_STATS_MAX_AGE = float(os.environ.get('MODEL_STATS_MAX_AGE', str(6 * 3600)))
+MODEL_STATS_FLUSH_SECONDS = float(os.environ.get('MODEL_STATS_FLUSH_SECONDS', '30'))
+MODEL_STATS_MIN_SAMPLES = int(os.environ.get('MODEL_STATS_MIN_SAMPLES', '5'))
+
+# Auto routing: models slower than this factor of the fastest, or failing
+# more often than this, are not picked; unmeasured models are tried now and then
+AUTO_SLOW_FACTOR = float(os.environ.get('AUTO_SLOW_FACTOR', '1.5'))
+AUTO_MAX_ERROR_RATE = float(os.environ.get('AUTO_MAX_ERROR_RATE', '0.3'))
+AUTO_EXPLORE_RATE = float(os.environ.get('AUTO_EXPLORE_RATE', '0.05'))
+
+_EWMA_ALPHA = 0.2
+
+# Upper bound in megapixels of each resolution bucket
+RESOLUTION_BUCKETS = (('sd', 0.6), ('hd', 1.2), ('2k', 2.5), ('4k', float('inf')))
+
+
+def resolution_bucket(width: int, height: int) -> str:
+    megapixels = width * height / 1e6
+    for name, limit in RESOLUTION_BUCKETS:
+        if megapixels <= limit:
+            return name
+    return RESOLUTION_BUCKETS[-1][0]
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(samples: List[Tuple[float, Optional[float], bool]]) -> Optional[Dict[str, Any]]:
+    """EWMA/p50/p90 latency (ms) and error rate of time-ordered (ts, latency_ms, ok) samples"""
+    if not samples:
+        return None
+    ewma: Optional[float] = None
+    error_rate = 0.0
+    latencies: List[float] = []
+    for _, latency, ok in samples:
+        error_rate += _EWMA_ALPHA * ((0.0 if ok else 1.0) - error_rate)
+        if latency is None:
+            continue
+        latencies.append(latency)
+        ewma = latency if ewma is None else ewma + _EWMA_ALPHA * (latency - ewma)
+    latencies.sort()
+    return {
+        'samples': len(samples),
+        'ewma_ms': round(ewma, 1) if ewma is not None else None,
+        'p50_ms': round(_percentile(latencies, 0.5), 1) if latencies else None,
+        'p90_ms': round(_percentile(latencies, 0.9), 1) if latencies else None,
+        'error_rate': round(error_rate, 3),
+        'last_at': samples[-1][0]
+    }
+
+
+class ModelPerformance:
+    """Sliding window of upstream samples per (model, resolution bucket), shared through the KV backend"""
+
+    def __init__(self, kv, window: int = MODEL_STATS_WINDOW, flush_seconds: float = MODEL_STATS_FLUSH_SECONDS):
+        self.kv = kv
+        self.window = window
+        self.flush_seconds = flush_seconds
+        self._samples: Dict[Tuple[str, str], List[Tuple[float, Optional[float], bool]]] = defaultdict(list)
+        self._summaries: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def _stored(self) -> Dict[str, List[list]]:
+        try:
+            raw = self.kv.get(MODEL_STATS_KEY)
+            return json.loads(raw) if raw else {}
+        except Exception as e:
+            print(f"WARNING: Model stats unavailable: {str(e)}")
+            return {}
+
+    def _merge(self, stored: Dict[str, List[list]]):
+        """Union stored samples into memory (caller holds the lock)"""
+        cutoff = time.time() - MODEL_STATS_MAX_AGE
+        for key, rows in stored.items():
+            model, _, bucket = key.partition('|')
+            samples = self._samples[(model, bucket)]
+            merged = {(row[0], row[1]): (row[0], row[1], bool(row[2])) for row in rows if row[0] >= cutoff}
+            merged.update({(s[0], s[1]): s for s in samples if s[0] >= cutoff})
+            samples[:] = sorted(merged.values(), key=lambda s: s[0])[-self.window:]
+        self._summaries.clear()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        stored = self._stored()
+        with self._lock:
+            if not self._loaded:
+                self._merge(stored)
+                self._loaded = True
+
+    def record(self, model: str, width: int, height: int, latency_ms: Optional[float], ok: bool):
+        """One upstream call; `latency_ms` is None for failures that say nothing about speed"""
+        self._ensure_loaded()
+        key = (model, resolution_bucket(width, height))
+        with self._lock:
+            samples = self._samples[key]
+            samples.append((time.time(), round(latency_ms, 1) if latency_ms is not None else None, ok))
+            del samples[:-self.window]
+            self._summaries.pop(key, None)
+            self._summaries.pop((model, '*'), None)
+            self._dirty = True
+            due = time.monotonic() - self._last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Merge this worker's samples with the shared copy and write the union back"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._last_flush = time.monotonic()
+        stored = self._stored()
+        with self._lock:
+            self._merge(stored)
+            payload = {f"{model}|{bucket}": [list(s) for s in samples]
+                       for (model, bucket), samples in self._samples.items() if samples}
+        try:
+            self.kv.set(MODEL_STATS_KEY, json.dumps(payload, separators=(',', ':')))
+        except Exception as e:
+            print(f"WARNING: Could not persist model stats: {str(e)}")
+
+    def summary(self, model: str, width: Optional[int] = None, height: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Stats for the model at this size; all sizes pooled when the bucket has too few samples"""
+        self._ensure_loaded()
+        with self._lock:
+            if width and height:
+                key = (model, resolution_bucket(width, height))
+                if key not in self._summaries:
+                    self._summaries[key] = summarize(self._samples.get(key, []))
+                bucket = self._summaries[key]
+                if bucket and bucket['samples'] >= MODEL_STATS_MIN_SAMPLES:
+                    return bucket
+            pooled = (model, '*')
+            if pooled not in self._summaries:
+                rows = [s for (name, _), samples in self._samples.items() if name == model for s in samples]
+                self._summaries[pooled] = summarize(sorted(rows, key=lambda s: s[0]))
+            return self._summaries[pooled]
+
+    def typical_ms(self, model: str, width: int, height: int) -> Optional[float]:
+        """Median latency of this model at this size alone (no pooling across sizes), if measured"""
+        self._ensure_loaded()
+        key = (model, resolution_bucket(width, height))
+        with self._lock:
+            if key not in self._summaries:
+                self._summaries[key] = summarize(self._samples.get(key, []))
+            stats = self._summaries[key]
+        if not stats or stats['samples'] < MODEL_STATS_MIN_SAMPLES:
+            return None
+        return stats['p50_ms']
+
+    def estimate(self, model: str, width: int, height: int) -> Optional[Tuple[float, float]]:
+        """Measured (typical, slow) generation time in seconds, or None without enough samples"""
+        stats = self.summary(model, width, height)
+        if not stats or stats['samples'] < MODEL_STATS_MIN_SAMPLES or stats['p50_ms'] is None:
+            return None
+        return stats['p50_ms'] / 1000, stats['p90_ms'] / 1000
+
+    def _acceptable(self, models: List[str], width: Optional[int], height: Optional[int]) -> Tuple[List[str], List[str]]:
+        """(acceptable models in preference order, models without enough samples)"""
+        measured: Dict[str, Dict[str, Any]] = {}
+        unmeasured: List[str] = []
+        for model in models:
+            stats = self.summary(model, width, height)
+            if stats and stats['samples'] >= MODEL_STATS_MIN_SAMPLES and stats['ewma_ms'] is not None:
+                measured[model] = stats
+            else:
+                unmeasured.append(model)
+        healthy = {model: stats for model, stats in measured.items() if stats['error_rate'] <= AUTO_MAX_ERROR_RATE}
+        if not healthy:
+            return [], unmeasured
+        fastest = min(stats['ewma_ms'] for stats in healthy.values())
+        return [model for model in models
+                if model in healthy and healthy[model]['ewma_ms'] <= fastest * AUTO_SLOW_FACTOR], unmeasured
+
+    def fastest(self, models: List[str], width: Optional[int] = None, height: Optional[int] = None) -> Optional[str]:
+        """Measured fastest healthy model, or None when nothing has been measured"""
+        candidates = [(self.summary(model, width, height), model) for model in models]
+        candidates = [(stats['ewma_ms'], model) for stats, model in candidates
+                      if stats and stats['samples'] >= MODEL_STATS_MIN_SAMPLES and stats['ewma_ms'] is not None
+                      and stats['error_rate'] <= AUTO_MAX_ERROR_RATE]
+        return min(candidates)[1] if candidates else None
+
+    def choose(self, models: List[str], width: int, height: int) -> str:
+        """Fastest acceptable model: the most preferred (earliest) of those close to the fastest.
+
+        Now and then another model is picked instead, so unmeasured models
+        get measured and slow ones get a chance to show they have recovered.
+        """
+        acceptable, unmeasured = self._acceptable(models, width, height)
+        if not acceptable:
+            # Nothing measured (or everything failing): the most preferred model is the best guess
+            return unmeasured[0] if unmeasured else models[0]
+        others = [model for model in models if model not in acceptable]
+        if others and random.random() < AUTO_EXPLORE_RATE:
+            return random.choice(others)
+        return acceptable[0]
+
+    def stats(self, models: List[str]) -> Dict[str, Any]:
+        self._ensure_loaded()
+        with self._lock:
+            keys = sorted(key for key, samples in self._samples.items() if samples and key[0] in models)
+        result: Dict[str, Any] = {}
+        for model, bucket in keys:
+            with self._lock:
+                summary = summarize(self._samples[(model, bucket)])
+            result.setdefault(model, {})[bucket] = summary
+        return result
@@ -0,0 +1,198 @@
+"""Near-duplicate prompt lookup over recent generations.
+
+Prompts are normalized (case, punctuation, whitespace, word order, plurals,
+filler words) into a set of content words, so "a red fox in the snow." and
+"Snow, red foxes" are identical and "a red fox in snow, beautiful" differs
+by a single shingle. Each prompt gets a MinHash signature, and
+signatures are bucketed with LSH (bands of rows) so a lookup only compares
+against prompts that share at least one band. Candidates are confirmed
+with the exact Jaccard similarity of their shingle sets.
+
+Entries are scoped to (model, style, resolution), kept in memory per
+worker, capped in number and dropped once older than the maximum age.
+sync() reads entries recorded elsewhere (a shared history: other workers,
+earlier runs) so every worker sees every recent generation.
+"""
+import hashlib
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+NEAR_DUP_THRESHOLD = float(os.environ.get('NEAR_DUP_THRESHOLD', '0.7'))
+NEAR_DUP_MAX_ENTRIES = int(os.environ.get('NEAR_DUP_MAX_ENTRIES', '5000'))
+NEAR_DUP_MAX_AGE = float(os.environ.get('NEAR_DUP_MAX_AGE', str(6 * 3600)))
+
+# 16 bands of 4 rows: pairs at Jaccard 0.7 share a band ~99% of the time, pairs at 0.3 only ~12%
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_HASHES = NUM_BANDS * ROWS_PER_BAND
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD = re.compile(r'[a-z0-9]+')
+_STOPWORDS = frozenset(('a', 'an', 'the', 'of', 'in', 'on', 'at', 'with', 'and', 'to', 'for', 'by'))
+
+
+def _permutations(count: int) -> List[Tuple[int, int]]:
+    """Fixed (a, b) pairs for the universal hashes h(x) = (a*x + b) mod p"""
+    pairs = []
+    for i in range(count):
+        a, b = struct.unpack('<QQ', hashlib.blake2b(b'minhash-%d' % i, digest_size=16).digest())
+        pairs.append((a % (_MERSENNE_PRIME - 1) + 1, b % _MERSENNE_PRIME))
+    return pairs
+
+
+_PERMUTATIONS = _permutations(NUM_HASHES)
+
+
+def _singular(word: str) -> str:
+    """Crude plural folding: foxes -> fox, dragons -> dragon (glass stays glass)"""
+    if len(word) > 4 and word.endswith('es') and word[-3] in 'sxz':
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def shingles(prompt: str) -> FrozenSet[str]:
+    """Order-insensitive shingle set of a prompt's content words"""
+    return frozenset(_singular(word) for word in _WORD.findall(prompt.lower()) if word not in _STOPWORDS)
+
+
+def minhash(items: FrozenSet[str]) -> Tuple[int, ...]:
+    hashes = [zlib.crc32(item.encode('utf-8')) for item in items]
+    if not hashes:
+        return tuple([_MAX_HASH] * NUM_HASHES)
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH for a, b in _PERMUTATIONS)
+
+
+def jaccard(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+class _Entry:
+    __slots__ = ('key', 'scope', 'shingles', 'bands', 'created_at')
+
+    def __init__(self, key: Any, scope: tuple, items: FrozenSet[str], bands: List[tuple], created_at: float):
+        self.key = key
+        self.scope = scope
+        self.shingles = items
+        self.bands = bands
+        self.created_at = created_at
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index from prompts to recent generation keys (e.g. history ids)"""
+
+    def __init__(self, threshold: float = NEAR_DUP_THRESHOLD, max_entries: int = NEAR_DUP_MAX_ENTRIES,
+                 max_age: float = NEAR_DUP_MAX_AGE):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: 'OrderedDict[Any, _Entry]' = OrderedDict()
+        self._buckets: Dict[tuple, Set[Any]] = defaultdict(set)
+        self._lock = threading.Lock()
+        # Highest key read by sync(); keys are assumed to increase (e.g. history ids)
+        self._synced_key: Any = None
+        self._sync_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _bands(scope: tuple, signature: Tuple[int, ...]) -> List[tuple]:
+        return [(scope, band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+                for band in range(NUM_BANDS)]
+
+    def _remove(self, key: Any):
+        """Drop one entry and its bucket memberships (caller holds the lock)"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def _evict(self):
+        """Oldest first: past the maximum age, then down to the size cap (caller holds the lock)"""
+        cutoff = time.time() - self.max_age
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.created_at >= cutoff and len(self._entries) <= self.max_entries:
+                break
+            self._remove(key)
+
+    def add(self, key: Any, prompt: str, scope: tuple, created_at: Optional[float] = None):
+        items = shingles(prompt)
+        if not items:
+            return
+        bands = self._bands(scope, minhash(items))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _Entry(key, scope, items, bands, created_at or time.time())
+            for band in bands:
+                self._buckets[band].add(key)
+            self._evict()
+
+    def sync(self, fetch: Callable[[Any, float, int], List[tuple]], batch: int = 500) -> int:
+        """Index entries recorded since the last sync; returns how many were added.
+
+        `fetch(after_key, created_after, limit)` returns up to `limit`
+        (key, prompt, scope, created_at) tuples with keys above `after_key`
+        (None on the first call), in key order.
+        """
+        added = 0
+        with self._sync_lock:
+            while True:
+                rows = fetch(self._synced_key, time.time() - self.max_age, batch)
+                for key, prompt, scope, created_at in rows:
+                    self.add(key, prompt, scope, created_at)
+                added += len(rows)
+                if rows:
+                    self._synced_key = rows[-1][0]
+                if len(rows) < batch:
+                    return added
+
+    def discard(self, key: Any):
+        with self._lock:
+            self._remove(key)
+
+    def find(self, prompt: str, scope: tuple, limit: int = 3) -> List[Tuple[Any, float]]:
+        """Recent entries in `scope` at or above the similarity threshold: [(key, similarity)], best first"""
+        items = shingles(prompt)
+        if not items:
+            return []
+        bands = self._bands(scope, minhash(items))
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            candidates: Set[Any] = set()
+            for band in bands:
+                candidates.update(self._buckets.get(band, ()))
+            matches = []
+            for key in candidates:
+                entry = self._entries[key]
+                if entry.created_at < cutoff:
+                    continue
+                similarity = jaccard(items, entry.shingles)
+                if similarity >= self.threshold:
+                    matches.append((similarity, entry.created_at, key))
+            if matches:
+                self.hits += 1
+            else:
+                self.misses += 1
+        matches.sort(key=lambda match: (-match[0], -match[1]))
+        return [(key, round(similarity, 3)) for similarity, _, key in matches[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'buckets': len(self._buckets), 'hits': self.hits,
+                    'misses': self.misses, 'threshold': self.threshold}
@@ -0,0 +1,89 @@
+"""Model placeholder image generation.
+
+Runs as an offline build step (``python src/placeholders.py``) so web workers
+never import PIL or stat the model images at boot. ``main`` can also start it
+as a background task when ``MODEL_PLACEHOLDERS=background`` is set.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BASE_DIR)
+DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
+MODELS_FOLDER = os.path.join(PROJECT_ROOT, 'static', 'models')
+
+
+def _load_model_categories() -> List[Dict[str, Any]]:
+    """Read model categories straight from models.json"""
+    try:
+        with open(os.path.join(DATA_DIR, 'models.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def create_model_placeholders(model_categories: Optional[List[Dict[str, Any]]] = None,
+                              models_folder: str = MODELS_FOLDER) -> int:
+    """Create placeholder images for models that don't have one; returns the number created"""
+    if model_categories is None:
+        model_categories = _load_model_categories()
+
+    missing = []
+    for category in model_categories:
+        for model in category.get('models', []):
+            model_path = os.path.join(models_folder, f"{model['name']}.jpg")
+            if not os.path.exists(model_path):
+                missing.append((model, model_path))
+    if not missing:
+        return 0
+
+    try:
+        from PIL import Image, ImageDraw, ImageFont
+    except ImportError:
+        # PIL not available, skip placeholder creation
+        print("PIL not available, skipping model placeholder creation")
+        return 0
+
+    os.makedirs(models_folder, exist_ok=True)
+    for model, model_path in missing:
+        # Create a simple placeholder image
+        img = Image.new('RGB', (400, 300), color='#6366f1')
+        draw = ImageDraw.Draw(img)
+
+        # Try to use a font, fallback to default if not available
+        try:
+            font = ImageFont.truetype("arial.ttf", 20)
+        except Exception:
+            font = ImageFont.load_default()
+
+        # Draw model name on image
+        text = model.get('display_name', model['name'])
+        bbox = draw.textbbox((0, 0), text, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        x = (400 - text_width) // 2
+        y = (300 - text_height) // 2
+
+        draw.text((x, y), text, fill='white', font=font)
+        img.save(model_path, 'JPEG')
+    return len(missing)
+
+
+def start_background_placeholders(model_categories: List[Dict[str, Any]],
+                                  models_folder: str = MODELS_FOLDER) -> threading.Thread:
+    """Generate placeholders on a daemon thread so the caller doesn't wait"""
+    thread = threading.Thread(
+        target=create_model_placeholders,
+        args=(model_categories, models_folder),
+        name='model-placeholders',
+        daemon=True
+    )
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    created = create_model_placeholders()
+    print(f"Created {created} model placeholder image(s) in {MODELS_FOLDER}")
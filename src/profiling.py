@@ -0,0 +1,203 @@
+"""Opt-in request profiling and slow-request capture.
+
+A single sampler thread per process reads ``sys._current_frames()`` for the
+request threads it has been asked to watch and aggregates their stacks in
+the folded format used by flamegraph.pl, speedscope and inferno
+(``frame;frame;frame count`` per line).
+
+- On demand: a request carrying ``X-Profile: <PROFILE_TOKEN>`` (or
+  ``?__profile=<PROFILE_TOKEN>``) is sampled from start to finish.
+- Slow requests: every request is registered cheaply, and sampling only
+  starts once it has run longer than ``SLOW_REQUEST_MS``. Fast requests are
+  never sampled at all.
+
+Profiles are written to the profiles folder (newest ``PROFILE_KEEP`` kept).
+"""
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from flask import Flask, g, request
+
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '15000'))
+SLOW_SAMPLE_INTERVAL_MS = float(os.environ.get('SLOW_SAMPLE_INTERVAL_MS', '20'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '50'))
+PROFILE_MAX_DEPTH = 128
+
+# Static files and generated images are never worth profiling
+_SKIP_PREFIXES = ('/static/', '/generated_images/')
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class ProfileSession:
+    """Stack samples of one request thread"""
+
+    __slots__ = ('thread_id', 'label', 'on_demand', 'started', 'samples', 'sample_count')
+
+    def __init__(self, thread_id: int, label: str, on_demand: bool):
+        self.thread_id = thread_id
+        self.label = label
+        self.on_demand = on_demand
+        self.started = time.monotonic()
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started) * 1000
+
+
+def fold_stack(frame) -> str:
+    """Folded representation of a frame's stack, outermost call first"""
+    names: List[str] = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(name.replace(';', ':') for name in names)
+
+
+class RequestProfiler:
+    """Sampler thread plus the registry of request threads it may sample"""
+
+    def __init__(self, folder: str, slow_ms: float = SLOW_REQUEST_MS):
+        self.folder = folder
+        self.slow_ms = slow_ms
+        self._sessions: Dict[int, ProfileSession] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self.captured = 0
+
+    def _ensure_thread(self):
+        # Started lazily, and again after a fork: threads do not survive into workers
+        if self._thread is None or self._thread_pid != os.getpid():
+            self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def begin(self, label: str, on_demand: bool = False) -> ProfileSession:
+        session = ProfileSession(threading.get_ident(), label, on_demand)
+        with self._lock:
+            idle = not self._sessions
+            self._sessions[session.thread_id] = session
+            self._ensure_thread()
+        # A new slow-request session is never due before the ones already waiting
+        if idle or on_demand:
+            self._wake.set()
+        return session
+
+    def end(self, session: ProfileSession) -> Optional[str]:
+        """Stop sampling a request; writes and returns the profile file name if anything was captured"""
+        with self._lock:
+            if self._sessions.get(session.thread_id) is session:
+                del self._sessions[session.thread_id]
+        if not session.samples:
+            return None
+        return self._write(session)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                sessions = list(self._sessions.values())
+            if not sessions:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            # Nothing to sample until the oldest request turns slow (or an on-demand one arrives)
+            wait_ms = min(0 if session.on_demand else self.slow_ms - session.elapsed_ms() for session in sessions)
+            if wait_ms > 0:
+                self._wake.wait(wait_ms / 1000)
+                self._wake.clear()
+                continue
+            fast = any(session.on_demand for session in sessions)
+            time.sleep((PROFILE_INTERVAL_MS if fast else SLOW_SAMPLE_INTERVAL_MS) / 1000)
+            due = [session for session in sessions
+                   if session.on_demand or session.elapsed_ms() >= self.slow_ms]
+            if not due:
+                continue
+            frames = sys._current_frames()
+            for session in due:
+                frame = frames.get(session.thread_id)
+                if frame is not None:
+                    session.samples[fold_stack(frame)] += 1
+                    session.sample_count += 1
+            del frames
+
+    def _write(self, session: ProfileSession) -> str:
+        os.makedirs(self.folder, exist_ok=True)
+        kind = 'profile' if session.on_demand else 'slow'
+        name = (f"{time.strftime('%Y%m%d-%H%M%S')}_{kind}_{_UNSAFE_CHARS.sub('_', session.label).strip('_')[:60]}"
+                f"_{int(session.elapsed_ms())}ms_{os.getpid()}.folded")
+        path = os.path.join(self.folder, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in session.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.captured += 1
+        self._prune()
+        print(f"DEBUG: Wrote {kind} profile {name} ({session.sample_count} samples)")
+        return name
+
+    def _prune(self):
+        try:
+            names = sorted(name for name in os.listdir(self.folder) if name.endswith('.folded'))
+        except FileNotFoundError:
+            return
+        for name in names[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else []:
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                pass
+
+    def list_profiles(self) -> List[str]:
+        try:
+            return sorted((name for name in os.listdir(self.folder) if name.endswith('.folded')), reverse=True)
+        except FileNotFoundError:
+            return []
+
+
+def is_authorized() -> bool:
+    """True when the request carries the profiling admin token"""
+    if not PROFILE_TOKEN:
+        return False
+    supplied = request.headers.get('X-Profile') or request.args.get('__profile') or ''
+    return hmac.compare_digest(supplied.encode('utf-8'), PROFILE_TOKEN.encode('utf-8'))
+
+
+def init_profiling(app: Flask, profiler: RequestProfiler):
+    """Register the request hooks that start and stop profile sessions"""
+
+    @app.before_request
+    def start_profile():
+        if request.path.startswith(_SKIP_PREFIXES):
+            return
+        on_demand = is_authorized()
+        if on_demand or profiler.slow_ms > 0:
+            g.profile_session = profiler.begin(f"{request.method} {request.path}", on_demand=on_demand)
+
+    @app.after_request
+    def finish_profile(response):
+        session = g.pop('profile_session', None)
+        if session is not None:
+            name = profiler.end(session)
+            if session.on_demand:
+                # Requests shorter than one sampling interval yield no samples and no file
+                response.headers['X-Profile-Samples'] = str(session.sample_count)
+                if name:
+                    response.headers['X-Profile-File'] = name
+        return response
+
+    @app.teardown_request
+    def discard_profile(error=None):
+        # Requests that raised never reach after_request
+        session = g.pop('profile_session', None)
+        if session is not None:
+            profiler.end(session)
@@ -0,0 +1,220 @@
+"""TF-IDF similarity search over catalog text for recommendations.
+
+Each document (a style or a model) is tokenized into words and word
+bigrams, weighted by ``(1 + log tf) * idf`` and L2-normalized. The weights
+are stored as an inverted index (term -> documents and weights), i.e. the
+transposed sparse document-term matrix, so scoring a prompt only touches
+the postings of the prompt's own terms.
+
+With NumPy the postings are flat arrays and a query is a single sparse
+matrix-vector product (``np.bincount`` over the gathered postings) plus an
+``argpartition`` for the top k; without it the same index is walked in
+pure Python. NumPy is imported, and the index built, on the first search,
+so importing the app doesn't pay for either. Term counts are cached per
+document text, so a catalog change only re-tokenizes the documents that
+changed; the vocabulary and idf are rebuilt from scratch each time.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_numpy: Any = None
+
+_WORD = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'into', 'is', 'it', 'its',
+    'of', 'on', 'or', 'that', 'the', 'this', 'to', 'with', 'very', 'style', 'image', 'quality'
+))
+
+
+def _np():
+    """NumPy on first use (it is slow to import); None when it is not installed"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def tokenize(text: str) -> List[str]:
+    """Words (minus stopwords) plus adjacent-word bigrams"""
+    words = [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS and len(word) > 1]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class SimilarityIndex:
+    """Cosine similarity of a query against a fixed set of documents"""
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self._lock = threading.Lock()
+        # Documents waiting to be indexed by the next search (or build())
+        self._pending: Optional[List[Tuple[str, str]]] = None
+        # Term counts per document text, handed on by rebuilt()
+        self._term_counts: Dict[str, Counter] = {}
+        # Pure Python: term -> idf and term -> [(doc, weight)]
+        self._idf: Dict[str, float] = {}
+        self._postings: Dict[str, List[Tuple[int, float]]] = {}
+        # NumPy: this build's vocabulary (term -> id), idf per id, and the
+        # postings of term id t at docs/weights[offsets[t]:offsets[t + 1]]
+        self._vocab: Dict[str, int] = {}
+        self._idf_array = None
+        self._offsets = None
+        self._docs = None
+        self._weights = None
+
+    def __len__(self) -> int:
+        pending = self._pending
+        return len(pending if pending is not None else self.keys)
+
+    def rebuild(self, documents: Iterable[Tuple[str, str]]):
+        """Replace the indexed documents with (key, text) pairs; they are indexed on the next search"""
+        documents = list(documents)
+        with self._lock:
+            self._pending = documents
+
+    def rebuilt(self, documents: Iterable[Tuple[str, str]]) -> 'SimilarityIndex':
+        """A new index over (key, text) pairs that reuses this one's tokenization; this one is left as is"""
+        index = SimilarityIndex()
+        index._term_counts = self._term_counts
+        index.rebuild(documents)
+        return index
+
+    def build(self):
+        """Index pending documents now instead of on the next search"""
+        with self._lock:
+            documents, self._pending = self._pending, None
+            if documents is None:
+                return
+            counts: List[Counter] = []
+            term_counts: Dict[str, Counter] = {}
+            for _, text in documents:
+                counter = term_counts.get(text) or self._term_counts.get(text) or Counter(tokenize(text))
+                term_counts[text] = counter
+                counts.append(counter)
+            self.keys = [key for key, _ in documents]
+            self._term_counts = term_counts
+            np = _np()
+            if np is not None:
+                self._build_arrays(np, counts)
+            else:
+                self._build_postings(counts)
+
+    def _build_arrays(self, np, counts: List[Counter]):
+        vocab: Dict[str, int] = {}
+        ids = [np.fromiter((vocab.setdefault(term, len(vocab)) for term in counter), dtype=np.int32, count=len(counter))
+               for counter in counts]
+        tfs = [1.0 + np.log(np.fromiter(counter.values(), dtype=np.float32, count=len(counter)))
+               for counter in counts]
+
+        total = len(counts)
+        term_ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int32)
+        tf = np.concatenate(tfs) if tfs else np.empty(0, dtype=np.float32)
+        doc_ids = np.repeat(np.arange(total, dtype=np.int32), [len(item) for item in ids])
+
+        df = np.bincount(term_ids, minlength=len(vocab))
+        idf = (np.log((1.0 + total) / (1.0 + df)) + 1.0).astype(np.float32)
+        weights = tf * idf[term_ids]
+        norms = np.sqrt(np.bincount(doc_ids, weights=weights * weights, minlength=total))
+        norms[norms == 0] = 1.0
+        weights = (weights / norms[doc_ids]).astype(np.float32)
+
+        # Group postings by term: the transposed (CSC) document-term matrix
+        order = np.argsort(term_ids, kind='stable')
+        offsets = np.zeros(len(df) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+
+        self._vocab = vocab
+        self._idf_array = idf
+        self._offsets = offsets
+        self._docs = doc_ids[order]
+        self._weights = weights[order]
+
+    def _build_postings(self, counts: List[Counter]):
+        df: Counter = Counter()
+        for counter in counts:
+            df.update(counter.keys())
+        total = len(counts)
+        idf = {term: math.log((1 + total) / (1 + freq)) + 1.0 for term, freq in df.items()}
+
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for doc, counter in enumerate(counts):
+            weights = {term: (1.0 + math.log(count)) * idf[term] for term, count in counter.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            for term, weight in weights.items():
+                postings.setdefault(term, []).append((doc, weight / norm))
+
+        self._idf = idf
+        self._postings = postings
+
+    @staticmethod
+    def _normalize(weights: Dict[Any, float]) -> Dict[Any, float]:
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {term: weight / norm for term, weight in weights.items()}
+
+    def search(self, text: str, k: int = 5, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """Top-k (key, cosine similarity) for the query text, best first"""
+        if self._pending is not None:
+            self.build()
+        counter = Counter(tokenize(text))
+        with self._lock:
+            keys = self.keys
+            vocab, idf, offsets, docs, doc_weights = self._vocab, self._idf_array, self._offsets, self._docs, self._weights
+            idf_map, postings = self._idf, self._postings
+        if not keys or not counter:
+            return []
+
+        if docs is not None:
+            np = _np()
+            query: Dict[int, float] = {}
+            for term, count in counter.items():
+                term_id = vocab.get(term)
+                if term_id is not None:
+                    query[term_id] = (1.0 + math.log(count)) * float(idf[term_id])
+            if not query:
+                return []
+            query = self._normalize(query)
+            # Sparse matrix-vector product over the query's postings
+            spans = [(offsets[term_id], offsets[term_id + 1], weight) for term_id, weight in query.items()]
+            scores = np.bincount(np.concatenate([docs[start:end] for start, end, _ in spans]),
+                                 weights=np.concatenate([doc_weights[start:end] * weight for start, end, weight in spans]),
+                                 minlength=len(keys))
+            k = min(k, len(keys))
+            top = np.argpartition(-scores, k - 1)[:k]
+            ranked = sorted(((float(scores[doc]), int(doc)) for doc in top), key=lambda item: (-item[0], item[1]))
+        else:
+            query = self._normalize({term: (1.0 + math.log(count)) * idf_map[term]
+                                     for term, count in counter.items() if term in idf_map})
+            accumulated: Dict[int, float] = {}
+            for term, weight in query.items():
+                for doc, doc_weight in postings[term]:
+                    accumulated[doc] = accumulated.get(doc, 0.0) + doc_weight * weight
+            ranked = [(-score, doc) for score, doc in
+                      heapq.nsmallest(k, ((-score, doc) for doc, score in accumulated.items()))]
+        return [(keys[doc], round(score, 4)) for score, doc in ranked if score > min_score]
+
+
+def style_document(style: dict, category: Optional[dict] = None) -> str:
+    """Searchable text of a style: name, prompt, advanced prompts, use cases and category"""
+    parts = [style.get('name', ''), style.get('prompt', '')]
+    advanced = style.get('advanced_prompts') or {}
+    parts.extend(advanced.values() if hasattr(advanced, 'values') else advanced)
+    parts.extend((style.get('compatibility') or {}).get('recommended_for', []))
+    if category:
+        parts.extend([category.get('category', ''), category.get('description', '')])
+    return ' '.join(str(part) for part in parts if part)
+
+
+def model_document(model: dict) -> str:
+    """Searchable text of a model: names, description, use cases and compatible styles"""
+    compatibility = model.get('compatibility') or {}
+    parts = [model.get('name', ''), model.get('display_name', ''), model.get('description', '')]
+    parts.extend(compatibility.get('recommended_for', []))
+    parts.extend(compatibility.get('styles', []))
+    return ' '.join(str(part) for part in parts if part)
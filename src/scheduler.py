@@ -0,0 +1,230 @@
+"""Priority-aware admission control for upstream calls.
+
+Every call to an upstream (image, text, TTS) takes a slot from the
+scheduler first. Three priority classes are served in strict order
+(interactive, then background, then bulk), each with its own concurrency
+cap so lower classes can never occupy all upstream connections. Within a
+class, waiting calls are ordered by start-time fair queuing over flows of
+(endpoint, client): one busy client or endpoint cannot push everyone else
+to the back of the queue.
+
+Time spent waiting for a slot and time spent in the upstream call are
+measured separately per class.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+PRIORITY_CLASSES = ('interactive', 'background', 'bulk')
+
+UPSTREAM_CONCURRENCY = int(os.environ.get('UPSTREAM_CONCURRENCY', '16'))
+# Request threads per worker process (gunicorn_config.py). Interactive calls are made
+# on them, so a higher interactive cap could never fill up and load would never show
+WORKER_THREADS = int(os.environ.get('GUNICORN_THREADS', '8'))
+CLASS_LIMITS = {
+    'interactive': int(os.environ.get('UPSTREAM_INTERACTIVE_LIMIT', str(min(UPSTREAM_CONCURRENCY, WORKER_THREADS)))),
+    'background': int(os.environ.get('UPSTREAM_BACKGROUND_LIMIT', '6')),
+    'bulk': int(os.environ.get('UPSTREAM_BULK_LIMIT', '2'))
+}
+# Longest a call may wait for a slot before it is rejected
+CLASS_MAX_WAIT = {
+    'interactive': float(os.environ.get('UPSTREAM_INTERACTIVE_MAX_WAIT', '30')),
+    'background': float(os.environ.get('UPSTREAM_BACKGROUND_MAX_WAIT', '120')),
+    'bulk': float(os.environ.get('UPSTREAM_BULK_MAX_WAIT', '600'))
+}
+
+_SAMPLES = 512
+# Seconds between calls of an acquire() check callback while waiting for a slot
+_CHECK_INTERVAL = 0.5
+
+
+class SchedulerBusy(Exception):
+    """No upstream slot (or API key) became free in time; `retry_after` is a hint in seconds, if known"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One admitted (or waiting) upstream call"""
+
+    __slots__ = ('priority', 'flow', 'tag', 'enqueued_at', 'admitted_at', 'released_at', 'event')
+
+    def __init__(self, priority: str, flow: Tuple[str, str], tag: float):
+        self.priority = priority
+        self.flow = flow
+        self.tag = tag
+        self.enqueued_at = time.perf_counter()
+        self.admitted_at: Optional[float] = None
+        self.released_at: Optional[float] = None
+        self.event = threading.Event()
+
+    @property
+    def queue_ms(self) -> float:
+        end = self.admitted_at if self.admitted_at is not None else time.perf_counter()
+        return (end - self.enqueued_at) * 1000
+
+    @property
+    def upstream_ms(self) -> float:
+        if self.admitted_at is None:
+            return 0.0
+        end = self.released_at if self.released_at is not None else time.perf_counter()
+        return (end - self.admitted_at) * 1000
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 1)
+
+
+class UpstreamScheduler:
+    """Strict-priority classes with per-class caps; fair queuing across flows within a class"""
+
+    def __init__(self, total_limit: int = UPSTREAM_CONCURRENCY, class_limits: Optional[Dict[str, int]] = None,
+                 max_wait: Optional[Dict[str, float]] = None):
+        self.total_limit = total_limit
+        self.class_limits = dict(class_limits or CLASS_LIMITS)
+        self.max_wait = dict(max_wait or CLASS_MAX_WAIT)
+        self._lock = threading.Lock()
+        self._queues: Dict[str, List[Tuple[float, int, Ticket]]] = {name: [] for name in PRIORITY_CLASSES}
+        self._in_flight: Dict[str, int] = {name: 0 for name in PRIORITY_CLASSES}
+        # Start-time fair queuing state: class virtual time and last finish tag per flow
+        self._virtual_time: Dict[str, float] = {name: 0.0 for name in PRIORITY_CLASSES}
+        self._finish_tags: Dict[str, Dict[Tuple[str, str], float]] = {name: {} for name in PRIORITY_CLASSES}
+        self._seq = itertools.count()
+        self._queue_samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=_SAMPLES))
+        self._upstream_samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=_SAMPLES))
+        self._completed: Dict[str, int] = defaultdict(int)
+        self._rejected: Dict[str, int] = defaultdict(int)
+
+    def _total_in_flight(self) -> int:
+        return sum(self._in_flight.values())
+
+    def _dispatch(self):
+        """Admit waiting tickets while capacity allows (caller holds the lock)"""
+        while self._total_in_flight() < self.total_limit:
+            for name in PRIORITY_CLASSES:
+                if self._queues[name] and self._in_flight[name] < self.class_limits[name]:
+                    tag, _, ticket = heapq.heappop(self._queues[name])
+                    self._virtual_time[name] = max(self._virtual_time[name], tag)
+                    self._in_flight[name] += 1
+                    ticket.admitted_at = time.perf_counter()
+                    ticket.event.set()
+                    break
+            else:
+                return
+
+    def acquire(self, endpoint: str, client: str = '', priority: str = 'interactive',
+                weight: float = 1.0, timeout: Optional[float] = None,
+                check: Optional[Callable[[], None]] = None) -> Ticket:
+        """Block until a slot is free for this call; raises SchedulerBusy after the class's max wait.
+
+        `check` is called every _CHECK_INTERVAL while waiting; an exception
+        from it (e.g. a cancelled job) gives up the place in the queue and
+        propagates.
+        """
+        if priority not in PRIORITY_CLASSES:
+            priority = 'interactive'
+        flow = (endpoint, client)
+        with self._lock:
+            finish_tags = self._finish_tags[priority]
+            start = max(self._virtual_time[priority], finish_tags.get(flow, 0.0))
+            finish_tags[flow] = start + 1.0 / max(weight, 0.01)
+            if len(finish_tags) > 4096:
+                # Flows at or behind virtual time carry no debt; forget them
+                now = self._virtual_time[priority]
+                for key in [key for key, tag in finish_tags.items() if tag <= now]:
+                    del finish_tags[key]
+            ticket = Ticket(priority, flow, start)
+            heapq.heappush(self._queues[priority], (start, next(self._seq), ticket))
+            self._dispatch()
+
+        wait = self.max_wait[priority] if timeout is None else min(timeout, self.max_wait[priority])
+        give_up = time.monotonic() + max(0.0, wait)
+        while True:
+            remaining = give_up - time.monotonic()
+            if ticket.event.wait(max(0.0, min(remaining, _CHECK_INTERVAL) if check else remaining)):
+                return ticket
+            if check is None or remaining <= _CHECK_INTERVAL:
+                break
+            try:
+                check()
+            except BaseException:
+                if not self._withdraw(ticket):
+                    self.release(ticket)
+                raise
+        if not self._withdraw(ticket, rejected=True):
+            # Admitted just as the wait expired
+            return ticket
+        raise SchedulerBusy(f"No upstream slot for {priority} work after {wait:.1f}s")
+
+    def _withdraw(self, ticket: Ticket, rejected: bool = False) -> bool:
+        """Take a waiting ticket out of its queue; False if it was admitted meanwhile"""
+        with self._lock:
+            if ticket.event.is_set():
+                return False
+            self._queues[ticket.priority] = [item for item in self._queues[ticket.priority] if item[2] is not ticket]
+            heapq.heapify(self._queues[ticket.priority])
+            if rejected:
+                self._rejected[ticket.priority] += 1
+            return True
+
+    def release(self, ticket: Ticket):
+        with self._lock:
+            if ticket.released_at is not None or ticket.admitted_at is None:
+                return
+            ticket.released_at = time.perf_counter()
+            self._in_flight[ticket.priority] -= 1
+            self._completed[ticket.priority] += 1
+            self._queue_samples[ticket.priority].append(ticket.queue_ms)
+            self._upstream_samples[ticket.priority].append(ticket.upstream_ms)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, endpoint: str, client: str = '', priority: str = 'interactive',
+             weight: float = 1.0, timeout: Optional[float] = None):
+        ticket = self.acquire(endpoint, client, priority, weight, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def load(self, priority: Optional[str] = None) -> Dict[str, int]:
+        """Cheap snapshot of capacity, calls in flight and calls waiting (of one class, if given)"""
+        with self._lock:
+            if priority in PRIORITY_CLASSES:
+                return {
+                    'limit': min(self.class_limits[priority], self.total_limit),
+                    'in_flight': self._in_flight[priority],
+                    'queued': len(self._queues[priority])
+                }
+            return {
+                'limit': self.total_limit,
+                'in_flight': self._total_in_flight(),
+                'queued': sum(len(queue) for queue in self._queues.values())
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            classes = {}
+            for name in PRIORITY_CLASSES:
+                queue = list(self._queue_samples[name])
+                upstream = list(self._upstream_samples[name])
+                classes[name] = {
+                    'limit': self.class_limits[name],
+                    'in_flight': self._in_flight[name],
+                    'queued': len(self._queues[name]),
+                    'completed': self._completed[name],
+                    'rejected': self._rejected[name],
+                    'queue_ms': {'p50': _percentile(queue, 0.5), 'p95': _percentile(queue, 0.95)},
+                    'upstream_ms': {'p50': _percentile(upstream, 0.5), 'p95': _percentile(upstream, 0.95)}
+                }
+            return {'total_limit': self.total_limit, 'in_flight': self._total_in_flight(), 'classes': classes}
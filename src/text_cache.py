@@ -0,0 +1,159 @@
+"""Response cache and conversation compaction for text generation"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share a cache entry"""
+    return _WHITESPACE.sub(' ', prompt).strip().lower()
+
+
+def make_cache_key(prompt: str, api_model: str, system_prompt: str, temperature: float,
+                   context: str = '') -> str:
+    """Build the cache key for one text request"""
+    parts = [normalize_prompt(prompt), api_model, system_prompt, f"{temperature:.2f}", context]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed TTL"""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a live entry and mark it most recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store an entry, evicting the least recently used ones over capacity"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class TieredCache:
+    """Per-worker TTLCache in front of the shared key/value backend.
+
+    Hits in the local tier cost nothing; misses fall through to the shared
+    store so every worker and instance benefits from a completion once any
+    of them has paid for it.
+    """
+
+    def __init__(self, local: TTLCache, kv, prefix: str = 'textcache:'):
+        self.local = local
+        self.kv = kv
+        self.prefix = prefix
+        self.shared_hits = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        try:
+            value = self.kv.get(self.prefix + key)
+        except Exception as e:
+            print(f"WARNING: Shared text cache unavailable: {str(e)}")
+            return None
+        if value is not None:
+            self.shared_hits += 1
+            self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.local.set(key, value, ttl)
+        try:
+            self.kv.set(self.prefix + key, value, ttl=self.local.ttl if ttl is None else ttl)
+        except Exception as e:
+            print(f"WARNING: Shared text cache unavailable: {str(e)}")
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.local.stats(), 'shared_hits': self.shared_hits}
+
+
+def compact_history(messages: List[Dict[str, Any]], max_turns: int = 6,
+                    max_chars: int = 4000, max_message_chars: int = 800) -> List[Dict[str, str]]:
+    """Reduce chat messages to a bounded window of recent text turns.
+
+    Only user prompts and text replies are kept (images, audio, loading and
+    error bubbles carry no conversational context). Each message is trimmed
+    to `max_message_chars`, and the newest turns are kept until either
+    `max_turns` or the `max_chars` budget is reached.
+    """
+    turns: List[Dict[str, str]] = []
+    for message in messages or []:
+        kind = message.get('type')
+        if kind not in ('user', 'bot'):
+            continue
+        content = _WHITESPACE.sub(' ', str(message.get('content') or '')).strip()
+        if not content:
+            continue
+        if len(content) > max_message_chars:
+            content = content[:max_message_chars].rstrip() + ' …'
+        turns.append({'role': 'user' if kind == 'user' else 'assistant', 'content': content})
+
+    window: List[Dict[str, str]] = []
+    budget = max_chars
+    for turn in reversed(turns[-max_turns:]):
+        if len(turn['content']) > budget:
+            break
+        window.append(turn)
+        budget -= len(turn['content'])
+    window.reverse()
+    return window
+
+
+def render_context(window: List[Dict[str, str]], prompt: str) -> str:
+    """Fold a compacted history window and the new prompt into one upstream prompt"""
+    if not window:
+        return prompt
+    lines = ["Conversation so far:"]
+    for turn in window:
+        speaker = 'User' if turn['role'] == 'user' else 'Assistant'
+        lines.append(f"{speaker}: {turn['content']}")
+    lines.append("")
+    lines.append(f"User: {prompt}")
+    return "\n".join(lines)
@@ -0,0 +1,334 @@
+"""Request-scoped tracing.
+
+Each request joins the caller's trace (W3C ``traceparent`` or
+``X-Trace-Id``) or starts a new one, and the trace id is returned in
+``X-Trace-Id``. Code marks timed sections with ``span(name, **attributes)``
+or ``@traced(name)``. Spans nest through a context variable, so a span
+opened inside another becomes its child without anything being passed
+around. Outside a sampled trace a span costs one context lookup; even
+that doubles a sub-microsecond catalog lookup, so lookups are timed by
+the span of their caller (``prompt.select_style``, ``prompt.build``,
+``catalog.recommendations``) rather than one by one.
+
+Finished spans go onto a bounded queue that a background thread exports in
+batches: as JSON lines to a file, or as OTLP/HTTP JSON to a collector
+(``scripts/otlp_standin.py`` is a local one). Request threads never wait
+on the export; when the queue is full, spans are dropped and counted.
+"""
+import atexit
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+TRACE_HEADER = 'X-Trace-Id'
+# file | otlp | off (ids are still issued and returned with 'off'); off unless asked for
+TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', 'off').lower()
+TRACE_OTLP_ENDPOINT = os.environ.get('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '1.0'))
+TRACE_QUEUE_SIZE = int(os.environ.get('TRACE_QUEUE_SIZE', '10000'))
+TRACE_BATCH_SIZE = int(os.environ.get('TRACE_BATCH_SIZE', '512'))
+TRACE_FLUSH_INTERVAL = float(os.environ.get('TRACE_FLUSH_INTERVAL', '2'))
+TRACE_FILE_MAX_BYTES = int(os.environ.get('TRACE_FILE_MAX_BYTES', str(50 * 1024 * 1024)))
+SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'dreamlitai')
+
+_TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+_TRACE_ID = re.compile(r'^[0-9a-f]{32}$')
+# OTLP span kinds
+_KINDS = {'internal': 1, 'server': 2, 'client': 3}
+
+
+class Span:
+    """One timed operation of a trace"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns', 'attributes',
+                 'error', 'sampled')
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: str = 'internal',
+                 sampled: bool = True, span_id: Optional[str] = None, **attributes):
+        self.trace_id = trace_id
+        self.span_id = span_id or f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = attributes
+        self.error: Optional[str] = None
+        self.sampled = sampled
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, message: str):
+        self.error = message
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start': self.start_ns / 1e9,
+            'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes,
+            'status': 'error' if self.error else 'ok',
+            'error': self.error
+        }
+
+
+class _NoopSpan:
+    """Stand-in outside a sampled trace; accepts and ignores everything"""
+
+    trace_id = None
+    span_id = None
+    sampled = False
+
+    def set(self, **attributes):
+        pass
+
+    def fail(self, message: str):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_current: contextvars.ContextVar = contextvars.ContextVar('trace_span', default=None)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def otlp_payload(spans: List[Span]) -> Dict[str, Any]:
+    """OTLP/HTTP JSON body (ExportTraceServiceRequest) for a batch of spans"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{
+            'scope': {'name': SERVICE_NAME},
+            'spans': [{
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'parentSpanId': span.parent_id or '',
+                'name': span.name,
+                'kind': _KINDS.get(span.kind, 1),
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns),
+                'attributes': [{'key': key, 'value': _otlp_value(value)}
+                               for key, value in span.attributes.items() if value is not None],
+                'status': {'code': 2, 'message': span.error} if span.error else {'code': 1}
+            } for span in spans]
+        }]
+    }]}
+
+
+class SpanExporter:
+    """Bounded queue of finished spans, drained in batches by a background thread"""
+
+    def __init__(self, kind: str = TRACE_EXPORTER, path: Optional[str] = None,
+                 endpoint: str = TRACE_OTLP_ENDPOINT, max_queue: int = TRACE_QUEUE_SIZE,
+                 batch_size: int = TRACE_BATCH_SIZE, interval: float = TRACE_FLUSH_INTERVAL,
+                 max_file_bytes: int = TRACE_FILE_MAX_BYTES):
+        self.kind = kind if kind in ('file', 'otlp') else 'off'
+        self.path = path
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_file_bytes = max_file_bytes
+        self._queue: 'queue.Queue[Span]' = queue.Queue(maxsize=max_queue)
+        self._thread_pid: Optional[int] = None
+        self._thread_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        if self.kind == 'file' and not path:
+            self.kind = 'off'
+        atexit.register(self.flush)
+
+    @property
+    def enabled(self) -> bool:
+        return self.kind != 'off'
+
+    def _ensure_thread(self):
+        # Threads don't survive a fork, so each worker starts its own (exactly one)
+        if self._thread_pid != os.getpid():
+            with self._thread_lock:
+                if self._thread_pid != os.getpid():
+                    threading.Thread(target=self._run, name='span-exporter', daemon=True).start()
+                    self._thread_pid = os.getpid()
+
+    def export(self, span: Span):
+        """Queue a finished span; never blocks"""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self, first: Optional[Span] = None) -> List[Span]:
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            # Let a burst accumulate into one write
+            time.sleep(min(0.2, self.interval))
+            self._write(self._drain(first))
+
+    def flush(self):
+        """Export everything queued so far (at exit, or on demand)"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._write(batch)
+
+    def _write(self, batch: List[Span]):
+        with self._write_lock:
+            try:
+                if self.kind == 'file':
+                    self._write_file(batch)
+                elif self.kind == 'otlp':
+                    self._post_otlp(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"WARNING: Could not export {len(batch)} spans: {str(e)}")
+
+    def _write_file(self, batch: List[Span]):
+        try:
+            if os.path.getsize(self.path) > self.max_file_bytes:
+                os.replace(self.path, self.path + '.1')
+        except OSError:
+            pass
+        lines = ''.join(json.dumps(span.to_dict(), default=str) + '\n' for span in batch).encode('utf-8')
+        # One O_APPEND write per batch keeps lines from several workers intact
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, lines)
+        finally:
+            os.close(fd)
+
+    def _post_otlp(self, batch: List[Span]):
+        body = json.dumps(otlp_payload(batch), default=str).encode('utf-8')
+        request = urllib.request.Request(self.endpoint, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'exporter': self.kind, 'exported': self.exported, 'dropped': self.dropped,
+                'failed': self.failed, 'queued': self._queue.qsize()}
+
+
+class Tracer:
+    """Starts traces per request and records spans into the exporter"""
+
+    def __init__(self, exporter: SpanExporter, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, trace_id: Optional[str] = None,
+                    **attributes) -> Span:
+        """Root span of a request: continues an incoming trace or starts a sampled-or-not new one"""
+        parent_id = None
+        sampled = None
+        match = _TRACEPARENT.match((traceparent or '').strip().lower())
+        if match:
+            trace_id, parent_id, flags = match.group(1), match.group(2), match.group(3)
+            sampled = bool(int(flags, 16) & 1)
+        elif trace_id and _TRACE_ID.match(trace_id.strip().lower()):
+            trace_id = trace_id.strip().lower()
+        else:
+            trace_id = f"{random.getrandbits(128):032x}"
+        if sampled is None:
+            sampled = random.random() < self.sample_rate
+        span = Span(trace_id, parent_id, name, kind='server', sampled=sampled and self.exporter.enabled,
+                    **attributes)
+        _current.set(span)
+        return span
+
+    def end_trace(self, span: Span, error: Optional[str] = None):
+        if error:
+            span.fail(error)
+        self._finish(span)
+        _current.set(None)
+
+    def _finish(self, span: Span):
+        if span.end_ns is None:
+            span.end_ns = time.time_ns()
+            if span.sampled:
+                self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str = 'internal', **attributes):
+        """Time a block as a child of the current span (a no-op outside a sampled trace)"""
+        parent = _current.get()
+        if parent is None or not parent.sampled:
+            yield NOOP_SPAN
+            return
+        span = Span(parent.trace_id, parent.span_id, name, kind=kind, **attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.fail(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current.reset(token)
+            self._finish(span)
+
+    def traced(self, name: str):
+        """Decorator form of span()"""
+        def decorate(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                parent = _current.get()
+                if parent is None or not parent.sampled:
+                    return func(*args, **kwargs)
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    @staticmethod
+    def bind(func: Callable) -> Callable:
+        """Carry the current trace into work run on another thread (e.g. a background job)"""
+        context = contextvars.copy_context()
+        return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+    @staticmethod
+    def current_trace_id() -> Optional[str]:
+        span = _current.get()
+        return span.trace_id if span is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {'sample_rate': self.sample_rate, **self.exporter.stats()}
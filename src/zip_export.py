@@ -0,0 +1,220 @@
+"""Streaming ZIP archives of generated assets.
+
+Archives are produced on the fly: entries are STORED (images and MP3s are
+already compressed, so deflating them again only burns CPU) and the CRC of
+each file is computed while it streams and written in a data descriptor
+after it. No temp file is written and memory stays at one read buffer.
+
+Because every entry is stored, the archive's layout and total size follow
+from the file names and sizes alone. That makes ``Content-Length`` exact up
+front and lets any byte range be served without producing what comes
+before it (a resumed download only reads the files it still needs; the
+CRCs of skipped files are computed from disk when a later descriptor or
+the central directory needs them).
+
+Classic (non-ZIP64) format: archives are limited to 65535 entries and 4 GiB.
+"""
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+READ_CHUNK = 256 * 1024
+ZIP_MAX_BYTES = 0xFFFFFFFF
+ZIP_MAX_ENTRIES = 0xFFFF
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_DATA_DESCRIPTOR = struct.Struct('<IIII')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+
+_VERSION = 20
+# Bit 3: CRC and sizes follow the data; bit 11: names are UTF-8
+_FLAGS = 0x0008 | 0x0800
+
+# CRC32 of immutable generated files, keyed by (path, size, mtime)
+_crc_cache: 'OrderedDict[Tuple[str, int, float], int]' = OrderedDict()
+_crc_lock = threading.Lock()
+_CRC_CACHE_SIZE = 4096
+
+
+def _cached_crc(key: Tuple[str, int, float]) -> Optional[int]:
+    with _crc_lock:
+        crc = _crc_cache.get(key)
+        if crc is not None:
+            _crc_cache.move_to_end(key)
+        return crc
+
+
+def _remember_crc(key: Tuple[str, int, float], crc: int):
+    with _crc_lock:
+        _crc_cache[key] = crc
+        while len(_crc_cache) > _CRC_CACHE_SIZE:
+            _crc_cache.popitem(last=False)
+
+
+def file_crc(path: str, size: int, mtime: float) -> int:
+    key = (path, size, mtime)
+    crc = _cached_crc(key)
+    if crc is None:
+        crc = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+                crc = zlib.crc32(chunk, crc)
+        _remember_crc(key, crc)
+    return crc
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(max(timestamp, 315532800))  # DOS dates start in 1980
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class ZipEntry:
+    """One stored file: archive name, source path, size and modification time"""
+
+    __slots__ = ('name', 'path', 'size', 'mtime', 'offset', 'encoded_name')
+
+    def __init__(self, name: str, path: str, size: int, mtime: float):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.encoded_name = name.encode('utf-8')
+        self.offset = 0
+
+    def crc(self) -> int:
+        return file_crc(self.path, self.size, self.mtime)
+
+    def local_header(self) -> bytes:
+        dos_time, dos_date = _dos_datetime(self.mtime)
+        return _LOCAL_HEADER.pack(0x04034b50, _VERSION, _FLAGS, 0, dos_time, dos_date,
+                                  0, self.size, self.size, len(self.encoded_name), 0) + self.encoded_name
+
+    def data_descriptor(self) -> bytes:
+        return _DATA_DESCRIPTOR.pack(0x08074b50, self.crc(), self.size, self.size)
+
+    def central_header(self) -> bytes:
+        dos_time, dos_date = _dos_datetime(self.mtime)
+        return _CENTRAL_HEADER.pack(0x02014b50, (3 << 8) | _VERSION, _VERSION, _FLAGS, 0, dos_time, dos_date,
+                                    self.crc(), self.size, self.size, len(self.encoded_name), 0, 0, 0, 0,
+                                    0o100644 << 16, self.offset) + self.encoded_name
+
+
+# A part of the archive: (length, producer of its bytes from an offset within it)
+Part = Tuple[int, Callable[[int, int], Iterator[bytes]]]
+
+
+class ZipStream:
+    """Byte-exact layout of a stored ZIP archive that can be streamed from any offset"""
+
+    def __init__(self, entries: List[ZipEntry]):
+        if len(entries) > ZIP_MAX_ENTRIES:
+            raise ValueError(f"At most {ZIP_MAX_ENTRIES} files per archive")
+        self.entries = entries
+        self.parts: List[Part] = []
+        offset = 0
+        for entry in entries:
+            entry.offset = offset
+            header_size = _LOCAL_HEADER.size + len(entry.encoded_name)
+            self.parts.append(self._small(header_size, entry.local_header))
+            self.parts.append((entry.size, self._file_reader(entry)))
+            self.parts.append(self._small(_DATA_DESCRIPTOR.size, entry.data_descriptor))
+            offset += header_size + entry.size + _DATA_DESCRIPTOR.size
+        self.central_offset = offset
+        self.central_size = sum(_CENTRAL_HEADER.size + len(entry.encoded_name) for entry in entries)
+        self.parts.append(self._small(self.central_size, self._central_directory))
+        self.size = offset + self.central_size + _END_RECORD.size
+        if self.size > ZIP_MAX_BYTES:
+            raise ValueError('Archive would exceed 4 GiB')
+        self.parts.append(self._small(_END_RECORD.size, self._end_record))
+
+    @staticmethod
+    def _small(length: int, build: Callable[[], bytes]) -> Part:
+        """A part small enough to build in memory, built only if it is actually sent"""
+        def produce(start: int, end: int) -> Iterator[bytes]:
+            yield build()[start:end]
+        return length, produce
+
+    @staticmethod
+    def _file_reader(entry: ZipEntry) -> Callable[[int, int], Iterator[bytes]]:
+        def produce(start: int, end: int) -> Iterator[bytes]:
+            # A whole file streamed in order gets its CRC computed on the way through
+            track = start == 0 and end == entry.size and _cached_crc((entry.path, entry.size, entry.mtime)) is None
+            crc = 0
+            with open(entry.path, 'rb') as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = f.read(min(READ_CHUNK, remaining))
+                    if not chunk:
+                        raise IOError(f"{entry.name} changed size while streaming")
+                    if track:
+                        crc = zlib.crc32(chunk, crc)
+                    remaining -= len(chunk)
+                    yield chunk
+            if track:
+                _remember_crc((entry.path, entry.size, entry.mtime), crc)
+        return produce
+
+    def _central_directory(self) -> bytes:
+        return b''.join(entry.central_header() for entry in self.entries)
+
+    def _end_record(self) -> bytes:
+        count = len(self.entries)
+        return _END_RECORD.pack(0x06054b50, 0, 0, count, count, self.central_size, self.central_offset, 0)
+
+    def iter_range(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Archive bytes [start, end)"""
+        end = self.size if end is None else min(end, self.size)
+        position = 0
+        for length, produce in self.parts:
+            part_start, part_end = position, position + length
+            position = part_end
+            if part_end <= start or length == 0:
+                continue
+            if part_start >= end:
+                break
+            yield from produce(max(start, part_start) - part_start, min(end, part_end) - part_start)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Single ``bytes=`` range as [start, end); None if absent, unsupported or multi-range.
+
+    Raises ValueError for a range that cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[6:].strip().partition('-')
+    try:
+        if first == '':
+            length = int(last)
+            if length <= 0:
+                raise ValueError('empty suffix range')
+            return max(0, size - length), size
+        start = int(first)
+        end = int(last) + 1 if last else size
+    except ValueError:
+        raise ValueError(f"Invalid range {header!r}")
+    if start >= size or end <= start:
+        raise ValueError(f"Range {header!r} not satisfiable")
+    return start, min(end, size)
+
+
+def unique_names(names: List[str]) -> List[str]:
+    """Archive names made unique by suffixing duplicates (``name-2.jpg``)"""
+    seen: Dict[str, int] = {}
+    result = []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        candidate, n = name, 1
+        while candidate.lower() in seen:
+            n += 1
+            candidate = f"{stem}-{n}{ext}"
+        seen[candidate.lower()] = 1
+        result.append(candidate)
+    return result
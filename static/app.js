@@ -1,5 +1,15 @@
 // Alpine.js app logic for AI Image Generator with Fixed Layout
+const CHAT_PAGE_SIZE = 50;      // messages loaded per page from IndexedDB
+const HISTORY_PAGE_SIZE = 30;   // saved chats listed per page in the sidebar
+const CHAT_OVERSCAN_PX = 800;   // rendered area above and below the viewport
+
 function imageGenApp() {
+    // Kept out of Alpine's reactive state: measured row heights by message key
+    const messageHeights = new Map();
+    let rowObserver = null;
+    let scrollFrame = null;
+    let messageKeys = 0;
+
     return {
         darkMode: localStorage.getItem('darkMode') === 'true',
         prompt: '',
@@ -25,14 +35,25 @@ function imageGenApp() {
         showModelModal: false,
         showModelModal: false,
         chatMessages: [], // Always starts empty
-        chatHistory: JSON.parse(localStorage.getItem('chatHistory') || '[]'),
+        chatHistory: [],  // Saved chat metadata, newest first; messages stay in IndexedDB
+        hasMoreChats: false,
+        currentChat: null, // Metadata of the chat being persisted, created on first content
+        nextSeq: 0,
+        hasOlderMessages: false,
+        isLoadingOlder: false,
+        // Virtualized chat: only chatMessages[windowStart, windowEnd) are in the DOM
+        windowStart: 0,
+        windowEnd: 0,
+        heightsVersion: 0,
+        stickToBottom: true,
+        lastScrollTop: 0,
         currentMessage: '',
         isTyping: false,
         showMobileControls: false,
         mobile: window.innerWidth < 1024, // Initialize based on lg breakpoint
         isEditing: false,
         editingIndex: null,
-        style_categories: window.style_categories || [],
+        style_categories: [],
         modelFilters: {
             category: '',
             difficulty: '',
@@ -44,8 +65,9 @@ function imageGenApp() {
             difficulty: '',
             complexity: ''
         },
-        models: window.models || {},
-        model_categories: window.model_categories || [],
+        models: {},
+        model_categories: [],
+        catalogLoaded: false,
         showModelDetails: false,
         showStyleDetails: false,
         selectedModelDetails: null,
@@ -67,6 +89,10 @@ function imageGenApp() {
         textTemperature: 0.7,   // New: Creativity
         textLength: 'medium',   // New: Response Length
         textFormat: 'paragraph',// New: Output Format
+        textMultiTurn: false,   // Send recent turns as context
+        referenceImage: null,   // { name, url } of an uploaded image-to-image reference
+        referenceStrength: 0.6,
+        isUploadingReference: false,
         voices: [
             { id: 'en-US-AriaNeural', name: 'Aria', gender: 'Female', desc: 'Versatile & Professional', color: 'indigo' },
             { id: 'en-US-GuyNeural', name: 'Guy', gender: 'Male', desc: 'Calm & Trustworthy', color: 'blue' },
@@ -88,13 +114,12 @@ function imageGenApp() {
             this.addWelcomeMessage();
 
             // Load model and style categories
-            this.model_categories = window.model_categories || [];
-            this.style_categories = window.style_categories || [];
-
-            // Set default selected model from first model in categories
-            if (this.model_categories.length > 0 && this.model_categories[0].models && this.model_categories[0].models.length > 0) {
-                this.selectedModel = this.model_categories[0].models[0].name;
-                this.model = this.model_categories[0].models[0].name;
+            this.loadCatalog();
+            if ('serviceWorker' in navigator) {
+                // The service worker serves the catalog from cache and says when a newer one arrived
+                navigator.serviceWorker.addEventListener('message', (event) => {
+                    if (event.data && event.data.type === 'catalog-updated') this.loadCatalog();
+                });
             }
 
             this.$watch('darkMode', val => {
@@ -130,6 +155,68 @@ function imageGenApp() {
             window.addEventListener('resize', () => {
                 this.mobile = window.innerWidth < 1024;
             });
+
+            // Don't pay for final renders nobody will see
+            window.addEventListener('pagehide', () => this.cancelPendingRenders());
+
+            // Re-measure rendered messages as they change size (images loading, streamed text)
+            if (window.ResizeObserver) {
+                rowObserver = new ResizeObserver(entries => {
+                    for (const entry of entries) {
+                        messageHeights.set(+entry.target.dataset.msgKey, entry.target.offsetHeight);
+                    }
+                    this.heightsVersion++;
+                    if (this.stickToBottom) {
+                        const container = this.$refs.chatContainer;
+                        if (container) container.scrollTop = container.scrollHeight;
+                    }
+                    this.scheduleWindowUpdate();
+                });
+            }
+            window.addEventListener('resize', () => this.scheduleWindowUpdate());
+            this.$watch('chatMessages.length', () => this.scheduleWindowUpdate());
+
+            this.loadHistory();
+        },
+
+        async loadCatalog() {
+            try {
+                const response = await fetch('/api/catalog');
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                const data = await response.json();
+                this.models = data.models || {};
+                this.model_categories = data.model_categories || [];
+                this.style_categories = data.style_categories || [];
+
+                // Set default selected model from first model in categories
+                if (!this.catalogLoaded && this.model_categories.length > 0 && this.model_categories[0].models && this.model_categories[0].models.length > 0) {
+                    this.selectedModel = this.model_categories[0].models[0].name;
+                    this.model = this.model_categories[0].models[0].name;
+                }
+                this.catalogLoaded = true;
+            } catch (error) {
+                console.error('Failed to load catalog:', error);
+                this.showNotification('Could not load models and styles');
+            }
+        },
+
+        async loadHistory() {
+            try {
+                await ChatStore.migrateLegacy();
+                const chats = await ChatStore.listChats(HISTORY_PAGE_SIZE);
+                this.chatHistory = chats;
+                this.hasMoreChats = chats.length === HISTORY_PAGE_SIZE;
+            } catch (error) {
+                console.error('Failed to load chat history:', error);
+            }
+        },
+
+        async loadMoreChats() {
+            const oldest = this.chatHistory[this.chatHistory.length - 1];
+            if (!oldest) return;
+            const chats = await ChatStore.listChats(HISTORY_PAGE_SIZE, oldest.updatedAt);
+            this.chatHistory.push(...chats);
+            this.hasMoreChats = chats.length === HISTORY_PAGE_SIZE;
         },
 
         setDefaultImage(event, type, key = null) {
@@ -175,11 +262,207 @@ function imageGenApp() {
         },
 
         addWelcomeMessage() {
-            this.chatMessages = [{
+            this.resetMessages([{
                 type: 'bot',
                 content: 'Welcome to DreamlitAI! Describe your vision, and I\'ll create stunning artwork for you. Try something like "a majestic dragon soaring over a cyberpunk city at sunset".',
                 timestamp: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
-            }];
+            }]);
+        },
+
+        // --- Message list: every change goes through these so rows keep stable keys
+        // and only the touched message is written to IndexedDB ---
+
+        resetMessages(messages) {
+            messageHeights.clear();
+            messages.forEach(m => { m.key = ++messageKeys; });
+            this.chatMessages = messages;
+            this.windowStart = 0;
+            this.windowEnd = messages.length;
+        },
+
+        addMessage(message, persist = true) {
+            message.key = ++messageKeys;
+            this.chatMessages.push(message);
+            if (persist) this.persistMessage(message);
+            // Return the reactive copy so later mutations re-render
+            return this.chatMessages[this.chatMessages.length - 1];
+        },
+
+        replaceMessage(index, message, persist = true) {
+            const old = this.chatMessages[index];
+            message.key = ++messageKeys;
+            if (old) {
+                messageHeights.delete(old.key);
+                message.seq = old.seq;
+            }
+            this.chatMessages[index] = message;
+            if (persist) this.persistMessage(message);
+            return this.chatMessages[index];
+        },
+
+        removeMessage(id) {
+            const index = this.chatMessages.findIndex(m => m.id === id);
+            if (index === -1) return;
+            messageHeights.delete(this.chatMessages[index].key);
+            this.chatMessages.splice(index, 1);
+            if (this.editingIndex !== null && this.editingIndex > index) this.editingIndex--;
+        },
+
+        persistMessage(message) {
+            if (message.type === 'loading') return;
+            if (!this.currentChat) {
+                // Like before, a chat is only saved once it has a prompt or an image
+                if (message.type !== 'user' && message.type !== 'image') return;
+                this.currentChat = {
+                    id: Date.now(),
+                    title: 'Untitled Creation',
+                    date: new Date().toLocaleDateString(),
+                    updatedAt: Date.now(),
+                    count: 0
+                };
+                this.nextSeq = 0;
+                this.chatHistory.unshift(this.currentChat);
+            }
+            const chat = this.currentChat;
+            if (message.seq === undefined) message.seq = this.nextSeq++;
+            if (message.type === 'user' && chat.title === 'Untitled Creation') {
+                chat.title = message.content.substring(0, 30) + (message.content.length > 30 ? '...' : '');
+            }
+            chat.updatedAt = Date.now();
+            chat.count = this.nextSeq;
+            ChatStore.putMessage({ ...chat }, message.seq, { ...message }).catch(error => {
+                console.error('Failed to save message:', error);
+            });
+        },
+
+        async loadOlderMessages() {
+            if (!this.currentChat || !this.hasOlderMessages || this.isLoadingOlder) return;
+            const first = this.chatMessages.find(m => m.seq !== undefined);
+            if (!first) return;
+            this.isLoadingOlder = true;
+            const chatId = this.currentChat.id;
+            try {
+                const page = await ChatStore.loadMessages(chatId, CHAT_PAGE_SIZE, first.seq);
+                if (!this.currentChat || this.currentChat.id !== chatId) return;
+                this.hasOlderMessages = page.length > 0 && page[0].seq > 0;
+                if (!page.length) return;
+
+                // Prepend without moving what the user is looking at
+                const container = this.$refs.chatContainer;
+                const previousHeight = container ? container.scrollHeight : 0;
+                page.forEach(m => { m.key = ++messageKeys; });
+                this.chatMessages.unshift(...page);
+                this.windowStart += page.length;
+                this.windowEnd += page.length;
+                if (this.editingIndex !== null) this.editingIndex += page.length;
+                this.$nextTick(() => {
+                    if (container) {
+                        container.scrollTo({ top: container.scrollTop + container.scrollHeight - previousHeight, behavior: 'instant' });
+                    }
+                    this.scheduleWindowUpdate();
+                });
+            } catch (error) {
+                console.error('Failed to load older messages:', error);
+            } finally {
+                this.isLoadingOlder = false;
+            }
+        },
+
+        // --- Virtualized rendering ---
+
+        get visibleMessages() {
+            return this.chatMessages.slice(this.windowStart, this.windowEnd);
+        },
+
+        get topSpacerHeight() {
+            this.heightsVersion; // re-evaluate when rows are measured
+            let height = 0;
+            for (let i = 0; i < this.windowStart && i < this.chatMessages.length; i++) {
+                height += this.messageHeight(this.chatMessages[i]);
+            }
+            return height;
+        },
+
+        get bottomSpacerHeight() {
+            this.heightsVersion;
+            let height = 0;
+            for (let i = this.windowEnd; i < this.chatMessages.length; i++) {
+                height += this.messageHeight(this.chatMessages[i]);
+            }
+            return height;
+        },
+
+        messageHeight(msg) {
+            const measured = messageHeights.get(msg.key);
+            if (measured !== undefined) return measured;
+            // Rough per-type estimate until the row has been rendered once
+            if (msg.type === 'image') {
+                const container = this.$refs.chatContainer;
+                const width = Math.min(container ? container.clientWidth : 800, 1152) - 48;
+                return (msg.width && msg.height ? width * msg.height / msg.width : width) + 160;
+            }
+            if (msg.type === 'audio') return 180;
+            if (msg.type === 'bot') return 80 + Math.ceil((msg.content || '').length / 80) * 24;
+            return 96;
+        },
+
+        onChatScroll() {
+            const container = this.$refs.chatContainer;
+            if (!container) return;
+            const atBottom = container.scrollHeight - container.scrollTop - container.clientHeight < 80;
+            // Smooth scrolling towards the bottom must not unstick it halfway
+            this.stickToBottom = atBottom || (this.stickToBottom && container.scrollTop >= this.lastScrollTop);
+            this.lastScrollTop = container.scrollTop;
+            this.scheduleWindowUpdate();
+        },
+
+        scheduleWindowUpdate() {
+            if (scrollFrame) return;
+            scrollFrame = requestAnimationFrame(() => {
+                scrollFrame = null;
+                this.updateChatWindow();
+            });
+        },
+
+        updateChatWindow() {
+            const container = this.$refs.chatContainer;
+            const list = this.$refs.messageList;
+            const count = this.chatMessages.length;
+            let start = 0;
+            let end = count;
+            if (container && list && container.clientHeight) {
+                // Scroll position relative to the top of the message list
+                const offset = list.getBoundingClientRect().top - container.getBoundingClientRect().top + container.scrollTop;
+                const top = container.scrollTop - offset - CHAT_OVERSCAN_PX;
+                const bottom = container.scrollTop - offset + container.clientHeight + CHAT_OVERSCAN_PX;
+                let y = 0;
+                start = -1;
+                for (let i = 0; i < count; i++) {
+                    const height = this.messageHeight(this.chatMessages[i]);
+                    if (start === -1 && y + height > top) start = i;
+                    if (y >= bottom) {
+                        end = i;
+                        break;
+                    }
+                    y += height;
+                }
+                if (start === -1) start = Math.max(0, count - 1);
+                end = Math.max(end, start);
+                // Near the top (or a short chat that doesn't scroll yet): fetch the previous page
+                if (container.scrollTop < CHAT_OVERSCAN_PX / 2) this.loadOlderMessages();
+            }
+            if (start !== this.windowStart || end !== this.windowEnd) {
+                this.windowStart = start;
+                this.windowEnd = end;
+            }
+            this.$nextTick(() => this.observeRows());
+        },
+
+        observeRows() {
+            if (!rowObserver || !this.$refs.messageList) return;
+            // Re-observe only the rows that are currently rendered
+            rowObserver.disconnect();
+            this.$refs.messageList.querySelectorAll('[data-msg-key]').forEach(row => rowObserver.observe(row));
         },
 
         startEditPrompt(idx) {
@@ -253,7 +536,7 @@ function imageGenApp() {
                 timestamp: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
             };
 
-            this.chatMessages.push(userMessage);
+            this.addMessage(userMessage);
             this.scrollToBottom();
 
             const messageContent = this.currentMessage;
@@ -267,7 +550,7 @@ function imageGenApp() {
 
         async generateImage(fromChat = false, isEdit = false) {
             if (!this.prompt.trim()) {
-                this.chatMessages.push({
+                this.addMessage({
                     type: 'bot',
                     content: 'Please enter a prompt first!',
                     timestamp: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
@@ -284,12 +567,12 @@ function imageGenApp() {
                 if (this.currentMode === 'text') loadingContent = 'Writing your story...';
                 if (this.currentMode === 'audio') loadingContent = 'Composing your audio...';
 
-                this.chatMessages.push({
+                this.addMessage({
                     type: 'loading',
                     id: loadingId,
                     content: loadingContent,
                     timestamp: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
-                });
+                }, false);
                 this.scrollToBottom();
             }
 
@@ -302,8 +585,13 @@ function imageGenApp() {
                     resolution: this.resolution,
                     quality: this.quality,
                     hdr: this.hdr,
-                    // Add reference image
+                    // Large renders show a fast draft first, then the final image
+                    progressive: this.isLargeResolution(this.resolution),
                 };
+                if (this.referenceImage) {
+                    body.reference_image = this.referenceImage.name;
+                    body.strength = this.referenceStrength;
+                }
 
                 if (this.currentMode === 'text') {
                     endpoint = '/generate_text';
@@ -313,8 +601,15 @@ function imageGenApp() {
                         persona: this.textPersona,
                         temperature: this.textTemperature,
                         length: this.textLength,
-                        format: this.textFormat
+                        format: this.textFormat,
+                        stream: true
                     };
+                    if (this.textMultiTurn) {
+                        // Prior turns only; the server compacts them further
+                        const prior = this.chatMessages.filter(m => m.id !== loadingId);
+                        if (prior.length && prior[prior.length - 1].type === 'user') prior.pop();
+                        body.history = prior.slice(-12).map(m => ({ type: m.type, content: m.content }));
+                    }
                 } else if (this.currentMode === 'audio') {
                     endpoint = '/generate_audio';
                     body = { prompt: this.prompt, voice: this.activeVoice, model: 'openai-audio' };
@@ -328,15 +623,39 @@ function imageGenApp() {
 
                 if (!response.ok) throw new Error(`HTTP ${response.status}`);
 
+                // Streaming text arrives as Server-Sent Events, token by token
+                if ((response.headers.get('Content-Type') || '').includes('text/event-stream')) {
+                    await this.consumeTextStream(response, loadingId, isEdit);
+                    return;
+                }
+
                 const data = await response.json();
-                this.chatMessages = this.chatMessages.filter(m => m.id !== loadingId);
+                this.removeMessage(loadingId);
 
                 if (data.success) {
                     let newMessage;
-                    if (this.currentMode === 'image') {
+                    if (this.currentMode === 'image' && data.progressive) {
+                        newMessage = {
+                            type: 'image',
+                            content: data.draft ? data.draft.image_url : '',
+                            pending: true,
+                            jobId: data.job_id,
+                            prompt: data.prompt || this.prompt,
+                            model: this.selectedModel,
+                            style: this.selectedStyle,
+                            resolution: this.resolution,
+                            timestamp: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
+                        };
+                    } else if (this.currentMode === 'image') {
                         newMessage = {
                             type: 'image',
                             content: data.image_url,
+                            // Chat shows the light derivatives; lightbox/download use the original
+                            display: data.display_url || null,
+                            preview: data.preview_url || null,
+                            lqip: data.lqip || null,
+                            width: data.width || null,
+                            height: data.height || null,
                             prompt: data.prompt || this.prompt,
                             model: this.selectedModel,
                             style: this.selectedStyle,
@@ -361,19 +680,22 @@ function imageGenApp() {
                     }
 
                     if (isEdit && this.editingIndex !== null) {
-                        this.chatMessages[this.editingIndex] = newMessage;
+                        // A regenerated message no longer needs its old final render
+                        this.cancelFinalRender(this.chatMessages[this.editingIndex]);
+                        this.replaceMessage(this.editingIndex, newMessage);
                         this.showNotification('Updated successfully!');
                     } else {
-                        this.chatMessages.push(newMessage);
-                        this.showNotification('Generated successfully!');
+                        this.addMessage(newMessage);
+                        this.showNotification(newMessage.pending ? 'Draft ready, refining...' : 'Generated successfully!');
                     }
+                    if (newMessage.pending) this.awaitFinalRender(newMessage.jobId);
                 } else {
                     throw new Error(data.error || 'Generation failed');
                 }
             } catch (error) {
                 console.error('Generation error:', error);
-                this.chatMessages = this.chatMessages.filter(m => m.id !== loadingId);
-                this.chatMessages.push({
+                this.removeMessage(loadingId);
+                this.addMessage({
                     type: 'error',
                     content: 'Error: ' + error.message,
                     timestamp: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
@@ -384,30 +706,206 @@ function imageGenApp() {
             }
         },
 
-        async downloadImage(url, filename) {
+        async attachReference(event) {
+            const file = event.target.files && event.target.files[0];
+            event.target.value = '';
+            if (!file) return;
+            if (!/^image\/(jpeg|png|webp)$/.test(file.type)) {
+                this.showNotification('Reference must be a JPEG, PNG or WebP image');
+                return;
+            }
+            this.isUploadingReference = true;
             try {
-                this.showNotification('Downloading image...');
+                // Images the server already has are recognised by hash and never re-sent
+                if (window.crypto && crypto.subtle) {
+                    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+                    const hex = Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+                    const existing = await fetch(`/upload_reference/${hex}`);
+                    if (existing.ok) {
+                        const data = await existing.json();
+                        this.referenceImage = { name: data.reference, url: data.url };
+                        return;
+                    }
+                }
+                // Raw body, so the server can stream it to disk instead of parsing a form
+                const response = await fetch('/upload_reference', {
+                    method: 'POST',
+                    headers: { 'Content-Type': file.type },
+                    body: file
+                });
+                const data = await response.json();
+                if (!response.ok || !data.success) throw new Error(data.error || `HTTP ${response.status}`);
+                this.referenceImage = { name: data.reference, url: data.url };
+            } catch (error) {
+                console.error('Reference upload failed:', error);
+                this.showNotification('Reference upload failed: ' + error.message);
+            } finally {
+                this.isUploadingReference = false;
+            }
+        },
 
-                const response = await fetch(url);
-                if (!response.ok) throw new Error('Download failed');
+        clearReference() {
+            this.referenceImage = null;
+        },
 
-                const blob = await response.blob();
-                const link = document.createElement('a');
-                link.href = URL.createObjectURL(blob);
-                link.download = filename + '.jpg';
+        isLargeResolution(resolution) {
+            const match = /(\d+)x(\d+)/.exec(resolution || '');
+            return !!match && Math.max(+match[1], +match[2]) >= 1536;
+        },
+
+        async awaitFinalRender(jobId) {
+            // Long-poll the job until the full-resolution image is ready
+            while (true) {
+                const msg = this.chatMessages.find(m => m.jobId === jobId && m.pending);
+                if (!msg) return; // Message was replaced or the chat was cleared
+
+                let job;
+                try {
+                    const response = await fetch(`/generate/jobs/${jobId}?wait=20`);
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    job = (await response.json()).job;
+                } catch (error) {
+                    console.error('Final render polling failed:', error);
+                    msg.pending = false;
+                    return;
+                }
+
+                if (job.status === 'done') {
+                    Object.assign(msg, {
+                        content: job.result.image_url,
+                        display: job.result.display_url || null,
+                        preview: job.result.preview_url || null,
+                        lqip: job.result.lqip || null,
+                        width: job.result.width || null,
+                        height: job.result.height || null,
+                        pending: false
+                    });
+                    this.persistMessage(msg);
+                    this.showNotification('Full-resolution image ready!');
+                    return;
+                }
+                if (job.status === 'failed' || job.status === 'cancelled') {
+                    msg.pending = false;
+                    if (job.status === 'failed') this.showNotification('Final render failed, keeping the draft');
+                    return;
+                }
+            }
+        },
+
+        cancelFinalRender(msg) {
+            if (!msg || !msg.pending || !msg.jobId) return;
+            msg.pending = false;
+            // keepalive lets the cancel go out even while the page unloads
+            fetch(`/generate/jobs/${msg.jobId}`, { method: 'DELETE', keepalive: true }).catch(() => { });
+        },
+
+        cancelPendingRenders() {
+            this.chatMessages.forEach(m => this.cancelFinalRender(m));
+        },
+
+        async consumeTextStream(response, loadingId, isEdit = false) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let message = null;
+
+            const handleEvent = (eventName, payload) => {
+                if (eventName === 'error') throw new Error(payload.error || 'Stream failed');
+                if (eventName === 'done') {
+                    if (message) message.model = payload.model;
+                    return;
+                }
+                if (!payload.delta) return;
+                if (!message) {
+                    // First token replaces the loading bubble
+                    this.removeMessage(loadingId);
+                    message = {
+                        type: 'bot',
+                        content: '',
+                        model: this.selectedTextModel,
+                        timestamp: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
+                    };
+                    // Saved once complete, not on every token
+                    message = isEdit && this.editingIndex !== null
+                        ? this.replaceMessage(this.editingIndex, message, false)
+                        : this.addMessage(message, false);
+                }
+                message.content += payload.delta;
+                this.scrollToBottom();
+            };
 
-                // Trigger download
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let eventName = 'message';
+                    let dataLines = [];
+                    for (const line of rawEvent.split('\n')) {
+                        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trimStart());
+                    }
+                    if (dataLines.length) handleEvent(eventName, JSON.parse(dataLines.join('\n')));
+                }
+            }
+
+            if (!message) throw new Error('Empty response from text model');
+            message.content = message.content.trim();
+            this.persistMessage(message);
+            this.showNotification(isEdit ? 'Updated successfully!' : 'Generated successfully!');
+        },
+
+        downloadImage(url, filename) {
+            // Same-origin link: the browser streams the file to disk instead of
+            // buffering it as a blob; the extension comes from the stored file
+            const ext = (new URL(url, window.location.href).pathname.match(/\.[a-z0-9]+$/i) || ['.jpg'])[0];
+            const link = document.createElement('a');
+            link.href = url;
+            link.download = filename + ext;
+
+            document.body.appendChild(link);
+            link.click();
+            document.body.removeChild(link);
+
+            this.showNotification('Download started!');
+        },
+
+        async exportMedia() {
+            // Every generated image and audio clip of this chat as one ZIP
+            const files = this.chatMessages
+                .filter(msg => (msg.type === 'image' || msg.type === 'audio') && msg.content)
+                .map(msg => msg.content);
+            if (!files.length) {
+                this.showNotification('Nothing to export yet');
+                return;
+            }
+
+            try {
+                this.showNotification('Preparing export...');
+                const response = await fetch('/api/export', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ files })
+                });
+                const data = await response.json();
+                if (!response.ok) throw new Error(data.error || 'Export failed');
+
+                const link = document.createElement('a');
+                link.href = data.download_url;
                 document.body.appendChild(link);
                 link.click();
                 document.body.removeChild(link);
 
-                // Clean up
-                URL.revokeObjectURL(link.href);
-
-                this.showNotification('Image downloaded successfully!');
+                const skipped = data.missing.length ? ` (${data.missing.length} no longer available)` : '';
+                this.showNotification(`Exporting ${data.count} files${skipped}`);
             } catch (error) {
-                console.error('Download failed:', error);
-                this.showNotification('Download failed. Please try again.');
+                console.error('Export failed:', error);
+                this.showNotification('Export failed. Please try again.');
             }
         },
 
@@ -422,46 +920,46 @@ function imageGenApp() {
         },
 
         scrollToBottom() {
+            this.stickToBottom = true;
             this.$nextTick(() => {
                 const chatContainer = this.$refs.chatContainer;
                 if (chatContainer) {
                     chatContainer.scrollTop = chatContainer.scrollHeight;
+                    this.updateChatWindow();
                 }
             });
         },
 
         clearChat() {
-            // Save if there are user messages or generated images
-            const hasContent = this.chatMessages.some(m => m.type === 'user' || m.type === 'image');
-            if (hasContent) {
-                this.saveCurrentChat();
-            }
+            // Messages are saved as they arrive, so starting over just detaches the current chat
+            this.cancelPendingRenders();
+            this.currentChat = null;
+            this.nextSeq = 0;
+            this.hasOlderMessages = false;
 
-            this.chatMessages = [];
             this.currentMessage = '';
             this.prompt = '';
             this.addWelcomeMessage();
             this.showNotification('New creation started!');
         },
 
-        saveCurrentChat() {
-            // Find first user message for title
-            const firstUserMsg = this.chatMessages.find(m => m.type === 'user');
-            const title = firstUserMsg ? firstUserMsg.content.substring(0, 30) + (firstUserMsg.content.length > 30 ? '...' : '') : 'Untitled Creation';
-
-            const chatSession = {
-                id: Date.now(),
-                title: title,
-                date: new Date().toLocaleDateString(),
-                messages: this.chatMessages
-            };
-
-            this.chatHistory.unshift(chatSession);
-            this.saveHistory();
-        },
-
-        loadChat(chat) {
-            this.chatMessages = chat.messages;
+        async loadChat(chat) {
+            this.cancelPendingRenders();
+            try {
+                // Only the newest page; older messages load when scrolling up
+                const messages = await ChatStore.loadMessages(chat.id, CHAT_PAGE_SIZE);
+                this.currentChat = chat;
+                this.nextSeq = messages.length ? messages[messages.length - 1].seq + 1 : 0;
+                this.hasOlderMessages = messages.length > 0 && messages[0].seq > 0;
+                this.isEditing = false;
+                this.editingIndex = null;
+                this.resetMessages(messages);
+                this.scrollToBottom();
+            } catch (error) {
+                console.error('Failed to load chat:', error);
+                this.showNotification('Could not load chat');
+                return;
+            }
             if (this.isMobile()) {
                 this.showSidebar = false;
             }
@@ -469,15 +967,18 @@ function imageGenApp() {
         },
 
         deleteChat(index) {
-            this.chatHistory.splice(index, 1);
-            this.saveHistory();
+            const [chat] = this.chatHistory.splice(index, 1);
+            if (!chat) return;
+            ChatStore.deleteChat(chat.id).catch(error => console.error('Failed to delete chat:', error));
+            if (this.currentChat && this.currentChat.id === chat.id) {
+                this.currentChat = null;
+                this.nextSeq = 0;
+                this.hasOlderMessages = false;
+                this.addWelcomeMessage();
+            }
             this.showNotification('Chat deleted from history');
         },
 
-        saveHistory() {
-            localStorage.setItem('chatHistory', JSON.stringify(this.chatHistory));
-        },
-
         exportChat() {
             const chatData = {
                 timestamp: new Date().toISOString(),
@@ -903,10 +1404,12 @@ document.addEventListener('DOMContentLoaded', function () {
     });
 });
 
-// Service worker registration for PWA capabilities
+// Service worker: caches static assets, the catalog and generated media.
+// Served from the root so its scope covers the whole app; the version
+// query makes a deploy install a new worker with a fresh precache.
 if ('serviceWorker' in navigator) {
     window.addEventListener('load', function () {
-        navigator.serviceWorker.register('/static/sw.js')
+        navigator.serviceWorker.register(`/sw.js?v=${window.STATIC_VERSION || ''}`, { scope: '/' })
             .then(function (registration) {
                 console.log('SW registered: ', registration);
             })
@@ -0,0 +1,145 @@
+// IndexedDB persistence for chat history: one record per chat and one per message,
+// so saving a message writes only that message and long chats load a page at a time
+const ChatStore = (() => {
+    const DB_NAME = 'dreamlitai';
+    const DB_VERSION = 1;
+    const LEGACY_KEY = 'chatHistory';
+    let dbPromise = null;
+
+    function open() {
+        if (dbPromise) return dbPromise;
+        dbPromise = new Promise((resolve) => {
+            if (!window.indexedDB) return resolve(null);
+            const request = indexedDB.open(DB_NAME, DB_VERSION);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                // chats: { id, title, date, updatedAt, count }
+                const chats = db.createObjectStore('chats', { keyPath: 'id' });
+                chats.createIndex('updatedAt', 'updatedAt');
+                // messages: { chatId, seq, ...message }, ordered by [chatId, seq]
+                db.createObjectStore('messages', { keyPath: ['chatId', 'seq'] });
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => {
+                console.error('IndexedDB unavailable:', request.error);
+                resolve(null);
+            };
+        });
+        return dbPromise;
+    }
+
+    function committed(tx) {
+        return new Promise((resolve, reject) => {
+            tx.oncomplete = () => resolve();
+            tx.onerror = tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    function messageRange(chatId, fromSeq = 0, toSeq = Number.MAX_SAFE_INTEGER) {
+        return IDBKeyRange.bound([chatId, fromSeq], [chatId, toSeq]);
+    }
+
+    // Transient UI state is not worth persisting
+    function storable(message) {
+        const { key, id, pending, jobId, ...rest } = message;
+        return rest;
+    }
+
+    return {
+        // Newest chats first; pass the last chat's updatedAt to get the next page
+        async listChats(limit = 50, before = Infinity) {
+            const db = await open();
+            if (!db) return [];
+            const index = db.transaction('chats').objectStore('chats').index('updatedAt');
+            const range = before === Infinity ? null : IDBKeyRange.upperBound(before, true);
+            const chats = [];
+            return new Promise((resolve, reject) => {
+                const cursor = index.openCursor(range, 'prev');
+                cursor.onsuccess = () => {
+                    const c = cursor.result;
+                    if (!c || chats.length >= limit) return resolve(chats);
+                    chats.push(c.value);
+                    c.continue();
+                };
+                cursor.onerror = () => reject(cursor.error);
+            });
+        },
+
+        async putChat(chat) {
+            const db = await open();
+            if (!db) return;
+            const tx = db.transaction('chats', 'readwrite');
+            tx.objectStore('chats').put(chat);
+            return committed(tx);
+        },
+
+        // Writes one message (and bumps the chat's metadata) in a single transaction
+        async putMessage(chat, seq, message) {
+            const db = await open();
+            if (!db) return;
+            const tx = db.transaction(['chats', 'messages'], 'readwrite');
+            tx.objectStore('messages').put({ ...storable(message), chatId: chat.id, seq });
+            tx.objectStore('chats').put(chat);
+            return committed(tx);
+        },
+
+        // The `limit` messages before `beforeSeq` (newest page by default), oldest first
+        async loadMessages(chatId, limit = 50, beforeSeq = Number.MAX_SAFE_INTEGER) {
+            const db = await open();
+            if (!db) return [];
+            const store = db.transaction('messages').objectStore('messages');
+            const page = [];
+            return new Promise((resolve, reject) => {
+                const cursor = store.openCursor(messageRange(chatId, 0, beforeSeq - 1), 'prev');
+                cursor.onsuccess = () => {
+                    const c = cursor.result;
+                    if (!c || page.length >= limit) return resolve(page.reverse());
+                    page.push(c.value);
+                    c.continue();
+                };
+                cursor.onerror = () => reject(cursor.error);
+            });
+        },
+
+        async deleteChat(chatId) {
+            const db = await open();
+            if (!db) return;
+            const tx = db.transaction(['chats', 'messages'], 'readwrite');
+            tx.objectStore('chats').delete(chatId);
+            tx.objectStore('messages').delete(messageRange(chatId));
+            return committed(tx);
+        },
+
+        // One-time move of the old single-blob localStorage history into IndexedDB
+        async migrateLegacy() {
+            const raw = localStorage.getItem(LEGACY_KEY);
+            if (!raw) return;
+            const db = await open();
+            if (!db) return;
+            let sessions = [];
+            try {
+                sessions = JSON.parse(raw);
+            } catch (error) {
+                console.error('Unreadable legacy chat history:', error);
+            }
+            const tx = db.transaction(['chats', 'messages'], 'readwrite');
+            const now = Date.now();
+            sessions.forEach((session, i) => {
+                const messages = (session.messages || []).filter(m => m.type !== 'loading');
+                tx.objectStore('chats').put({
+                    id: session.id,
+                    title: session.title,
+                    date: session.date,
+                    // Keep the old newest-first order
+                    updatedAt: session.id || now - i,
+                    count: messages.length
+                });
+                messages.forEach((m, seq) => {
+                    tx.objectStore('messages').put({ ...storable(m), chatId: session.id, seq });
+                });
+            });
+            await committed(tx);
+            localStorage.removeItem(LEGACY_KEY);
+        }
+    };
+})();
@@ -0,0 +1,171 @@
+// DreamlitAI service worker
+// - versioned static assets (?v=<version>): precached, cache-first
+// - catalog (/api/catalog) and style/model thumbnails: stale-while-revalidate
+// - generated media (/generated_images/): cache-first, size-bounded LRU
+const VERSION = new URL(self.location).searchParams.get('v') || 'dev';
+const STATIC_CACHE = `static-${VERSION}`;
+const CATALOG_CACHE = 'catalog';
+const THUMBNAIL_CACHE = 'thumbnails';
+const MEDIA_CACHE = 'generated-media';
+const META_CACHE = 'sw-meta';
+const PRECACHE = ['/static/app.js', '/static/chat_store.js'].map(path => `${path}?v=${VERSION}`);
+
+const MEDIA_CACHE_MAX_BYTES = 200 * 1024 * 1024;
+// Larger files are streamed from the network every time rather than flushing the cache
+const MEDIA_ENTRY_MAX_BYTES = MEDIA_CACHE_MAX_BYTES / 8;
+const LRU_INDEX_KEY = '/__sw/media-lru.json';
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(
+        caches.open(STATIC_CACHE)
+            .then(cache => cache.addAll(PRECACHE))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', (event) => {
+    // Precaches of earlier versions; catalog, thumbnails and media stay valid across deploys
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names
+                .filter(name => name.startsWith('static-') && name !== STATIC_CACHE)
+                .map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (url.pathname === '/api/catalog') {
+        event.respondWith(staleWhileRevalidate(event, CATALOG_CACHE, true));
+    } else if (url.pathname.startsWith('/generated_images/')) {
+        // Audio and video seek with Range requests; leave those to the network
+        if (!request.headers.has('Range')) event.respondWith(mediaCacheFirst(event));
+    } else if (url.pathname.startsWith('/static/')) {
+        if (url.searchParams.get('v') === VERSION) {
+            event.respondWith(cacheFirst(request, STATIC_CACHE));
+        } else if (/^\/static\/(style_images|model_images|styles|models)\//.test(url.pathname)) {
+            event.respondWith(staleWhileRevalidate(event, THUMBNAIL_CACHE, false));
+        }
+    }
+});
+
+async function cacheFirst(request, cacheName) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    if (cached) return cached;
+    const response = await fetch(request);
+    if (response.ok) await cache.put(request, response.clone());
+    return response;
+}
+
+async function staleWhileRevalidate(event, cacheName, notifyOnChange) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(event.request);
+    const refresh = fetch(event.request).then(async (response) => {
+        if (response.ok) {
+            const changed = cached && cached.headers.get('ETag') !== response.headers.get('ETag');
+            await cache.put(event.request, response.clone());
+            if (notifyOnChange && changed) await notifyClients({ type: 'catalog-updated' });
+        }
+        return response;
+    });
+    event.waitUntil(refresh.catch(() => { }));
+    return cached || refresh;
+}
+
+async function notifyClients(message) {
+    const clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach(client => client.postMessage(message));
+}
+
+// --- Generated media LRU ---
+// Map insertion order is recency order (oldest first); persisted so it survives worker restarts
+let lru = null;
+let lruBytes = 0;
+let lruSave = null;
+
+async function loadLru() {
+    if (lru) return lru;
+    lru = new Map();
+    lruBytes = 0;
+    const stored = await (await caches.open(META_CACHE)).match(LRU_INDEX_KEY);
+    if (stored) {
+        for (const [key, size] of await stored.json()) {
+            lru.set(key, size);
+            lruBytes += size;
+        }
+    }
+    return lru;
+}
+
+function saveLru() {
+    // Coalesce bursts of updates (scrolling through history) into one write
+    if (!lruSave) {
+        lruSave = new Promise(resolve => setTimeout(resolve, 1000)).then(async () => {
+            lruSave = null;
+            const body = JSON.stringify(Array.from(lru.entries()));
+            const cache = await caches.open(META_CACHE);
+            await cache.put(LRU_INDEX_KEY, new Response(body, { headers: { 'Content-Type': 'application/json' } }));
+        });
+    }
+    return lruSave;
+}
+
+async function mediaCacheFirst(event) {
+    const request = event.request;
+    const key = new URL(request.url).pathname;
+    const cache = await caches.open(MEDIA_CACHE);
+    const [cached] = await Promise.all([cache.match(key), loadLru()]);
+    if (cached) {
+        let size = lru.get(key);
+        if (size === undefined) {
+            // Cached before the last index write was lost: track it again so it can be evicted
+            size = parseInt(cached.headers.get('Content-Length') || '0', 10) || 0;
+            lruBytes += size;
+        }
+        lru.delete(key);
+        lru.set(key, size);
+        event.waitUntil(saveLru());
+        return cached;
+    }
+
+    const response = await fetch(request);
+    if (response.status === 200 && response.type === 'basic') {
+        event.waitUntil(storeMedia(cache, key, response.clone()).catch(error => {
+            console.warn('Media cache write failed:', error);
+        }));
+    }
+    return response;
+}
+
+async function storeMedia(cache, key, response) {
+    let size = parseInt(response.headers.get('Content-Length') || '', 10);
+    if (!Number.isFinite(size)) {
+        const body = await response.blob();
+        size = body.size;
+        response = new Response(body, { headers: response.headers });
+    }
+    if (size > MEDIA_ENTRY_MAX_BYTES) return;
+
+    await cache.put(key, response);
+    if (lru.has(key)) lruBytes -= lru.get(key);
+    lru.delete(key);
+    lru.set(key, size);
+    lruBytes += size;
+
+    // Evict least recently used entries until the cache fits its budget
+    const evictions = [];
+    for (const [oldKey, oldSize] of lru) {
+        if (lruBytes <= MEDIA_CACHE_MAX_BYTES) break;
+        lru.delete(oldKey);
+        lruBytes -= oldSize;
+        evictions.push(cache.delete(oldKey));
+    }
+    await Promise.all(evictions);
+    await saveLru();
+}